@@ -0,0 +1,91 @@
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from typing import List, Optional
+from datetime import datetime, timedelta
+import logging
+
+from models import User, SignupsPerDay, AgeBandCount, ActiveHospitals
+from auth_routes import get_db, get_current_user
+from server_timing import TimedRoute
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin", tags=["admin"], route_class=TimedRoute)
+
+# Statistics are computed by aggregation pipelines, so MongoDB does the
+# grouping and only the summary rows are sent back.
+
+async def require_admin(
+    authorization: Optional[str] = Header(None),
+    request: Request = None
+) -> User:
+    """Get the current user, who must be an active admin."""
+    user = await get_current_user(authorization, request)
+    
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if not user.is_active:
+        raise HTTPException(status_code=401, detail="Account is inactive")
+    
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return user
+
+@router.get("/stats/signups-per-day", response_model=List[SignupsPerDay])
+async def signups_per_day(
+    days: int = Query(30, ge=1, le=366),
+    authorization: Optional[str] = Header(None),
+    request: Request = None
+):
+    """Number of users registered on each of the last `days` days."""
+    await require_admin(authorization, request)
+    db = get_db(request)
+    
+    since = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    pipeline = [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "date": "$_id", "count": 1}},
+    ]
+    return await db.users.aggregate(pipeline).to_list(None)
+
+@router.get("/stats/donors-by-age", response_model=List[AgeBandCount])
+async def donors_by_age(
+    authorization: Optional[str] = Header(None),
+    request: Request = None
+):
+    """Number of donors in each ten-year age band; donors without an age are in band null."""
+    await require_admin(authorization, request)
+    db = get_db(request)
+    
+    pipeline = [
+        {"$match": {"role": "donor"}},
+        {"$group": {
+            "_id": {"$multiply": [{"$floor": {"$divide": ["$age", 10]}}, 10]},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "age_band": "$_id", "count": 1}},
+    ]
+    return await db.users.aggregate(pipeline).to_list(None)
+
+@router.get("/stats/active-hospitals", response_model=ActiveHospitals)
+async def active_hospitals(
+    authorization: Optional[str] = Header(None),
+    request: Request = None
+):
+    """Number of active hospital accounts."""
+    await require_admin(authorization, request)
+    db = get_db(request)
+    
+    pipeline = [
+        {"$match": {"role": "hospital", "is_active": True}},
+        {"$count": "active_hospitals"},
+    ]
+    result = await db.users.aggregate(pipeline).to_list(1)
+    return result[0] if result else {"active_hospitals": 0}
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends, Header, Request
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import Optional
+from typing import Any, Dict, Optional, Set
+import asyncio
 import logging
+import os
+import sys
 from datetime import timedelta
 import random
 
@@ -10,18 +12,160 @@ from models import (
     OTPRequest, OTPVerify
 )
 from auth_utils import (
-    verify_password, get_password_hash, create_access_token,
-    decode_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+    create_access_token, decode_access_token, password_needs_rehash,
+    ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from hashing import HasherBusy, get_password_hasher
+from mock_db import DuplicateKeyError as MockDuplicateKeyError
+from ttl_cache import TTLCache
+from expiring_store import LocalExpiringStore, RedisExpiringStore
+from rate_limit import RateLimitExceeded, client_ip, get_rate_limits, retry_after_header
+from server_timing import TimedRoute
+import metrics
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/auth", tags=["authentication"])
+router = APIRouter(prefix="/auth", tags=["authentication"], route_class=TimedRoute)
 
-# In-memory OTP storage (for demo purposes)
-otp_storage = {}
+# Outcome of each auth request; action is the route name, result "success" or why it failed
+AUTH_ATTEMPTS = metrics.Counter(
+    "auth_attempts_total", "Authentication requests by action and result.", ("action", "result")
+)
+
+_otp_store = None
+
+def get_otp_ttl() -> float:
+    """Seconds an OTP stays valid (OTP_TTL_SECONDS, default 5 minutes)."""
+    return float(os.environ.get("OTP_TTL_SECONDS", "300"))
+
+def get_otp_store():
+    """Store for pending OTPs, configured from the environment on first use.
+
+    OTP_STORE=local keeps them in this process (the default); OTP_STORE=redis
+    keeps them in Redis at REDIS_URL, so every worker sees them.
+    """
+    global _otp_store
+    if _otp_store is None:
+        backend = os.environ.get("OTP_STORE", "local").lower()
+        if backend == "redis":
+            _otp_store = RedisExpiringStore.from_env(prefix="otp:")
+        elif backend == "local":
+            _otp_store = LocalExpiringStore(
+                max_entries=int(os.environ.get("OTP_STORE_MAX_ENTRIES", "100000"))
+            )
+        else:
+            raise ValueError(f"Unknown OTP store: {backend}")
+    return _otp_store
+
+# Messages for unique index violations on the users collection
+DUPLICATE_KEY_MESSAGES = {
+    "email": "Email already registered",
+    "mobile": "Mobile number already registered",
+}
+
+_principal_cache: Optional[TTLCache] = None
+
+def get_principal_cache() -> TTLCache:
+    """Cache of authenticated users by id, configured from the environment on first use.
+
+    Entries are dropped when the user is updated through update_user, but
+    only in this worker: with several workers, a user deactivated, demoted
+    or given a new password through another one (or changed in the mongo
+    shell) keeps being served from here for up to PRINCIPAL_CACHE_TTL
+    seconds (default 10). Keep it short; 0 disables the cache.
+    """
+    global _principal_cache
+    if _principal_cache is None:
+        _principal_cache = TTLCache(
+            maxsize=int(os.environ.get("PRINCIPAL_CACHE_SIZE", "10000")),
+            ttl=float(os.environ.get("PRINCIPAL_CACHE_TTL", "10")),
+        )
+    return _principal_cache
+
+def _principal_cache_samples():
+    if _principal_cache is None:
+        return None
+    stats = _principal_cache.stats()
+    return [((result,), stats[result]) for result in ("hits", "misses", "evictions")]
+
+metrics.CallbackMetric(
+    "principal_cache_events_total", "Principal cache lookups (hits, misses) and evictions.",
+    _principal_cache_samples, kind="counter", labelnames=("event",),
+)
+
+async def update_user(db, filter_dict: Dict[str, Any], update: Dict[str, Any]):
+    """Update one user document and drop it from the principal cache.
+
+    All writes to users should go through here, so that deactivating a user
+    or changing their password takes effect on their next request to this
+    worker; other workers see it within PRINCIPAL_CACHE_TTL seconds.
+    """
+    result = await db.users.update_one(filter_dict, update)
+    if "id" in filter_dict:
+        get_principal_cache().pop(filter_dict["id"])
+    else:
+        get_principal_cache().clear()
+    return result
+
+def auth_failed(action: str, result: str, status_code: int, detail: str) -> HTTPException:
+    """Count a failed auth request and return the HTTPException to raise."""
+    AUTH_ATTEMPTS.labels(action, result).inc()
+    return HTTPException(status_code=status_code, detail=detail)
 
-def get_db(request: Request) -> AsyncIOMotorDatabase:
+def hasher_unavailable(action: str, e: HasherBusy) -> HTTPException:
+    """503 response for when password hashing is saturated."""
+    logger.warning(f"Rejecting auth request: {e}")
+    AUTH_ATTEMPTS.labels(action, "busy").inc()
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please try again",
+        headers={"Retry-After": "1"},
+    )
+
+# Rehash tasks still running (asyncio only keeps weak references to tasks)
+rehash_tasks: Set[asyncio.Task] = set()
+
+async def rehash_password(db, user_id: str, password: str, old_hash: str):
+    """Store a hash of password made with the current bcrypt cost."""
+    try:
+        new_hash = await get_password_hasher().hash(password)
+    except HasherBusy:
+        # Try again on the user's next login
+        return
+    # Only replace the hash that was verified, in case the password changed meanwhile
+    await update_user(
+        db,
+        {"id": user_id, "hashed_password": old_hash},
+        {"$set": {"hashed_password": new_hash}}
+    )
+    logger.info(f"Rehashed password for user {user_id}")
+
+async def enforce_rate_limit(route: str, request: Request, **keys: Optional[str]):
+    """Reject the request with 429 if it is over one of the route's rate limits."""
+    try:
+        peer = request.client.host if request.client else None
+        await get_rate_limits().check(route, ip=client_ip(peer, request.headers), **keys)
+    except RateLimitExceeded as e:
+        logger.warning(str(e))
+        AUTH_ATTEMPTS.labels(route, "rate_limited").inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please try again later",
+            headers={"Retry-After": retry_after_header(e.retry_after)},
+        )
+
+def duplicate_key_errors() -> tuple:
+    """DuplicateKeyError classes of the database drivers that are loaded.
+
+    pymongo is only imported when Motor is in use, so check for it rather
+    than importing it on the mock database path.
+    """
+    pymongo_errors = sys.modules.get("pymongo.errors")
+    if pymongo_errors is None:
+        return (MockDuplicateKeyError,)
+    return (pymongo_errors.DuplicateKeyError, MockDuplicateKeyError)
+
+def get_db(request: Request):
     """Get database from request state."""
     return request.state.db
 
@@ -30,6 +174,10 @@ async def get_current_user(
     request: Request = None
 ) -> Optional[User]:
     """Get current user from JWT token."""
+    return await authenticate(request.state.db, authorization)
+
+async def authenticate(db, authorization: Optional[str]) -> Optional[User]:
+    """The user an Authorization header's bearer token belongs to, if it is valid."""
     if not authorization or not authorization.startswith("Bearer "):
         return None
     
@@ -43,36 +191,38 @@ async def get_current_user(
     if not user_id:
         return None
     
-    db = request.state.db
+    cache = get_principal_cache()
+    user = cache.get(user_id)
+    if user is not None:
+        return user
+    
     user_dict = await db.users.find_one({"id": user_id})
     if not user_dict:
         return None
     
-    return User(**user_dict)
+    user = User(**user_dict)
+    cache.set(user_id, user)
+    return user
 
 @router.post("/register", response_model=Token)
 async def register(user_data: UserRegister, request: Request):
     """Register a new user (donor or hospital only)."""
+    await enforce_rate_limit("register", request)
     db = get_db(request)
     
     # Check if passwords match
     if user_data.password != user_data.confirm_password:
-        raise HTTPException(status_code=400, detail="Passwords do not match")
-    
-    # Check if email already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
+        raise auth_failed("register", "password_mismatch", 400, "Passwords do not match")
     
-    # Check if mobile already exists
-    existing_mobile = await db.users.find_one({"mobile": user_data.mobile})
-    if existing_mobile:
-        raise HTTPException(status_code=400, detail="Mobile number already registered")
+    try:
+        hashed_password = await get_password_hasher().hash(user_data.password)
+    except HasherBusy as e:
+        raise hasher_unavailable("register", e)
     
     # Create user
     user = User(
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         role=user_data.role,
         name=user_data.name,
         mobile=user_data.mobile,
@@ -80,7 +230,19 @@ async def register(user_data: UserRegister, request: Request):
         mobile_verified=True  # Auto-verify for demo
     )
     
-    await db.users.insert_one(user.model_dump())
+    # Email and mobile uniqueness is enforced by unique indexes, so a single
+    # insert both checks and writes, without racing concurrent signups.
+    try:
+        await db.users.insert_one(user.model_dump())
+    except duplicate_key_errors() as e:
+        details = e.details or {}
+        key_pattern = details.get("keyPattern", {})
+        errmsg = details.get("errmsg", "")
+        for field, message in DUPLICATE_KEY_MESSAGES.items():
+            # Servers older than 4.2 only name the index in errmsg
+            if field in key_pattern or f"index: {field}_" in errmsg:
+                raise auth_failed("register", f"duplicate_{field}", 400, message)
+        raise
     
     # Create access token
     access_token = create_access_token(
@@ -89,25 +251,40 @@ async def register(user_data: UserRegister, request: Request):
     )
     
     logger.info(f"User registered: {user.email} with role {user.role}")
+    AUTH_ATTEMPTS.labels("register", "success").inc()
     
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/login", response_model=Token)
 async def login(credentials: UserLogin, request: Request):
     """Login user."""
+    await enforce_rate_limit("login", request, email=credentials.email.lower())
     db = get_db(request)
     user_dict = await db.users.find_one({"email": credentials.email})
     
     if not user_dict:
-        raise HTTPException(status_code=401, detail="Invalid email or password")
+        raise auth_failed("login", "invalid_credentials", 401, "Invalid email or password")
     
     user = User(**user_dict)
     
-    if not verify_password(credentials.password, user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid email or password")
+    try:
+        password_ok = await get_password_hasher().verify(credentials.password, user.hashed_password)
+    except HasherBusy as e:
+        raise hasher_unavailable("login", e)
+    
+    if not password_ok:
+        raise auth_failed("login", "invalid_credentials", 401, "Invalid email or password")
     
     if not user.is_active:
-        raise HTTPException(status_code=401, detail="Account is inactive")
+        raise auth_failed("login", "inactive", 401, "Account is inactive")
+    
+    # Upgrade hashes made with another bcrypt cost without delaying the response
+    if password_needs_rehash(user.hashed_password):
+        task = asyncio.create_task(
+            rehash_password(db, user.id, credentials.password, user.hashed_password)
+        )
+        rehash_tasks.add(task)
+        task.add_done_callback(rehash_tasks.discard)
     
     # Create access token
     access_token = create_access_token(
@@ -116,6 +293,7 @@ async def login(credentials: UserLogin, request: Request):
     )
     
     logger.info(f"User logged in: {user.email}")
+    AUTH_ATTEMPTS.labels("login", "success").inc()
     
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -128,8 +306,9 @@ async def get_me(
     user = await get_current_user(authorization, request)
     
     if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+        raise auth_failed("me", "unauthenticated", 401, "Not authenticated")
     
+    AUTH_ATTEMPTS.labels("me", "success").inc()
     return UserResponse(
         id=user.id,
         email=user.email,
@@ -142,15 +321,17 @@ async def get_me(
     )
 
 @router.post("/request-otp")
-async def request_otp(otp_data: OTPRequest):
+async def request_otp(otp_data: OTPRequest, request: Request):
     """Request OTP for mobile verification (mocked for demo)."""
+    await enforce_rate_limit("request-otp", request, mobile=otp_data.mobile)
+    
     # Generate random 6-digit OTP
     otp = str(random.randint(100000, 999999))
     
-    # Store in memory (in production, use Redis with expiry)
-    otp_storage[otp_data.mobile] = otp
+    await get_otp_store().set(otp_data.mobile, otp, get_otp_ttl())
     
     logger.info(f"OTP generated for {otp_data.mobile}: {otp}")
+    AUTH_ATTEMPTS.labels("request-otp", "success").inc()
     
     # In production, send SMS here
     return {
@@ -159,20 +340,25 @@ async def request_otp(otp_data: OTPRequest):
     }
 
 @router.post("/verify-otp")
-async def verify_otp(verify_data: OTPVerify):
-    """Verify OTP (mocked for demo)."""
-    stored_otp = otp_storage.get(verify_data.mobile)
+async def verify_otp(verify_data: OTPVerify, request: Request):
+    """Verify OTP (mocked for demo).
+
+    The pending OTP is compared and removed in one step, so two concurrent
+    requests cannot both use it; a wrong code leaves it in place.
+    """
+    await enforce_rate_limit("verify-otp", request, mobile=verify_data.mobile)
+    verified = await get_otp_store().pop_if_equal(verify_data.mobile, verify_data.otp)
     
-    if not stored_otp:
+    if verified is None:
         # For demo, accept any 6-digit OTP
         if len(verify_data.otp) == 6 and verify_data.otp.isdigit():
+            AUTH_ATTEMPTS.labels("verify-otp", "success").inc()
             return {"verified": True, "message": "OTP verified successfully"}
-        raise HTTPException(status_code=400, detail="Invalid OTP")
+        raise auth_failed("verify-otp", "invalid", 400, "Invalid OTP")
     
-    if stored_otp != verify_data.otp:
-        raise HTTPException(status_code=400, detail="Invalid OTP")
+    if not verified:
+        raise auth_failed("verify-otp", "invalid", 400, "Invalid OTP")
     
-    # Remove OTP after verification
-    del otp_storage[verify_data.mobile]
+    AUTH_ATTEMPTS.labels("verify-otp", "success").inc()
     
     return {"verified": True, "message": "OTP verified successfully"}
\ No newline at end of file
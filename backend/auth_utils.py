@@ -1,12 +1,23 @@
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
 from typing import Optional
+import logging
 import os
+import time
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Lowest bcrypt cost we accept, whatever the latency budget
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+# Settings document holding the calibrated cost all workers use
+BCRYPT_ROUNDS_SETTING = "bcrypt_rounds"
+
 # JWT settings
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "organconnect-secret-key-change-in-production")
 ALGORITHM = "HS256"
@@ -20,6 +31,134 @@ def get_password_hash(password: str) -> str:
     """Generate password hash."""
     return pwd_context.hash(password)
 
+def calibrate_bcrypt_rounds(target_ms: float, samples: int = 3) -> int:
+    """Highest bcrypt cost whose hash time fits in target_ms on this machine.
+
+    Each extra round doubles the work, so the cost is measured once at
+    BCRYPT_MIN_ROUNDS and extrapolated.
+    """
+    handler = pwd_context.handler("bcrypt").using(rounds=BCRYPT_MIN_ROUNDS)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.hash("calibration")
+        timings.append((time.perf_counter() - start) * 1000)
+    base_ms = sorted(timings)[len(timings) // 2]
+
+    rounds = BCRYPT_MIN_ROUNDS
+    while rounds < BCRYPT_MAX_ROUNDS and base_ms * 2 ** (rounds + 1 - BCRYPT_MIN_ROUNDS) <= target_ms:
+        rounds += 1
+    logger.info(
+        f"bcrypt calibration: {base_ms:.1f}ms at cost {BCRYPT_MIN_ROUNDS}, "
+        f"using cost {rounds} (~{base_ms * 2 ** (rounds - BCRYPT_MIN_ROUNDS):.0f}ms) "
+        f"for a {target_ms:.0f}ms budget"
+    )
+    return rounds
+
+def set_bcrypt_rounds(rounds: int):
+    """Hash new passwords with this cost and flag hashes of a lower cost for rehashing.
+
+    Hashes of a higher cost are left alone, so a worker that picked a lower
+    cost never weakens a stronger hash.
+    """
+    rounds = max(rounds, BCRYPT_MIN_ROUNDS)
+    pwd_context.update(
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+def get_bcrypt_rounds() -> int:
+    return pwd_context.handler("bcrypt").default_rounds
+
+async def configure_bcrypt_rounds(db) -> int:
+    """Pick the bcrypt cost: BCRYPT_ROUNDS if set, else calibrate to BCRYPT_TARGET_MS.
+
+    A calibrated cost is shared through the settings collection: the first
+    worker to start stores its cost and every other worker (and every later
+    start) uses that one, so all workers hash alike. Delete the
+    "bcrypt_rounds" settings document to calibrate again.
+    """
+    rounds = os.environ.get("BCRYPT_ROUNDS")
+    if rounds:
+        rounds = int(rounds)
+    else:
+        calibrated = calibrate_bcrypt_rounds(float(os.environ.get("BCRYPT_TARGET_MS", "250")))
+        await db.settings.update_one(
+            {"id": BCRYPT_ROUNDS_SETTING},
+            {"$setOnInsert": {"rounds": calibrated}},
+            upsert=True,
+        )
+        setting = await db.settings.find_one({"id": BCRYPT_ROUNDS_SETTING})
+        rounds = setting["rounds"] if setting else calibrated
+        if rounds != calibrated:
+            logger.info(f"Using the shared bcrypt cost {rounds} instead of the calibrated {calibrated}")
+    set_bcrypt_rounds(rounds)
+    return get_bcrypt_rounds()
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash was made with a lower cost than the current one."""
+    return pwd_context.needs_update(hashed_password)
+
+class JoseBackend:
+    """JWT encoding and verification with python-jose."""
+    name = "jose"
+
+    def __init__(self):
+        from jose import JWTError, jwt
+        self._jwt = jwt
+        self._error = JWTError
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return self._jwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithm: str) -> Optional[dict]:
+        try:
+            return self._jwt.decode(token, key, algorithms=[algorithm])
+        except self._error:
+            return None
+
+class PyJWTBackend:
+    """JWT encoding and verification with PyJWT."""
+    name = "pyjwt"
+
+    def __init__(self):
+        import jwt
+        self._jwt = jwt
+        self._error = jwt.PyJWTError
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return self._jwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithm: str) -> Optional[dict]:
+        try:
+            return self._jwt.decode(token, key, algorithms=[algorithm])
+        except self._error:
+            return None
+
+JWT_BACKENDS = {"jose": JoseBackend, "pyjwt": PyJWTBackend}
+
+_jwt_backend = None
+_verified_tokens: Optional[TTLCache] = None
+
+def get_jwt_backend():
+    """The JWT library selected by JWT_BACKEND ("jose" or "pyjwt"), loaded on first use."""
+    global _jwt_backend
+    if _jwt_backend is None:
+        name = os.environ.get("JWT_BACKEND", "jose").lower()
+        if name not in JWT_BACKENDS:
+            raise ValueError(f"Unknown JWT backend: {name}")
+        _jwt_backend = JWT_BACKENDS[name]()
+    return _jwt_backend
+
+def get_verified_token_cache() -> TTLCache:
+    """Claims of tokens that already passed verification, until they expire."""
+    global _verified_tokens
+    if _verified_tokens is None:
+        _verified_tokens = TTLCache(
+            maxsize=int(os.environ.get("JWT_CACHE_SIZE", "10000")), ttl=0
+        )
+    return _verified_tokens
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token."""
     to_encode = data.copy()
@@ -28,13 +167,25 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = get_jwt_backend().encode(to_encode, SECRET_KEY, ALGORITHM)
     return encoded_jwt
 
 def decode_access_token(token: str) -> Optional[dict]:
-    """Decode JWT access token."""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+    """Decode JWT access token.
+
+    A token that verified before is answered from the cache until its exp,
+    skipping the signature check.
+    """
+    cache = get_verified_token_cache()
+    payload = cache.get(token)
+    if payload is not None:
+        return dict(payload)
+    
+    payload = get_jwt_backend().decode(token, SECRET_KEY, ALGORITHM)
+    if payload is None:
         return None
+    
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        cache.set(token, dict(payload), ttl=exp - time.time())
+    return payload
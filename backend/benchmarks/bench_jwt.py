@@ -0,0 +1,56 @@
+"""Benchmark JWT encoding and verification for each backend in auth_utils.
+
+Usage: python benchmarks/bench_jwt.py [--rounds N]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import auth_utils
+from auth_utils import ALGORITHM, JWT_BACKENDS, SECRET_KEY
+
+
+def ops_per_second(func, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    claims = {
+        "sub": "5f0c7a52-6d7e-4a59-9d8c-1d3f1b2c3d4e",
+        "email": "donor@organconnect.com",
+        "role": "donor",
+        "exp": datetime.utcnow() + timedelta(days=7),
+    }
+
+    print(f"{'backend':<10}{'encode ops/s':>16}{'decode ops/s':>16}")
+    for name, backend_class in JWT_BACKENDS.items():
+        backend = backend_class()
+        token = backend.encode(claims, SECRET_KEY, ALGORITHM)
+        encode = ops_per_second(lambda: backend.encode(claims, SECRET_KEY, ALGORITHM), args.rounds)
+        decode = ops_per_second(lambda: backend.decode(token, SECRET_KEY, ALGORITHM), args.rounds)
+        print(f"{name:<10}{encode:>16,.0f}{decode:>16,.0f}")
+
+    # decode_access_token with its verified-token cache warm
+    token = auth_utils.create_access_token(
+        {key: value for key, value in claims.items() if key != "exp"}
+    )
+    auth_utils.decode_access_token(token)
+    cached = ops_per_second(lambda: auth_utils.decode_access_token(token), args.rounds)
+    backend_name = auth_utils.get_jwt_backend().name
+    print(f"\ndecode_access_token, cached ({backend_name}): {cached:,.0f} ops/s")
+
+
+if __name__ == "__main__":
+    main()
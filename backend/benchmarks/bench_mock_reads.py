@@ -0,0 +1,77 @@
+"""Benchmark mock database reads in 'copy' versus 'view' read mode.
+
+Usage: python benchmarks/bench_mock_reads.py [--users N] [--rounds N]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from mock_db import MockMongoClient
+from models import User
+
+
+def make_user(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "email": f"user{i}@organconnect.com",
+        "hashed_password": "$2b$12$" + "x" * 53,
+        "role": "donor",
+        "name": f"User {i}",
+        "mobile": f"+1{i:010d}",
+        "age": 30,
+        "mobile_verified": True,
+        "is_active": True,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+async def run(read_mode: str, users: int, rounds: int) -> dict:
+    db = MockMongoClient("mock://bench", read_mode=read_mode)["bench"]
+    await db.users.create_index("id", unique=True)
+    await db.users.insert_many([make_user(i) for i in range(users)])
+    ids = [doc["id"] async for doc in db.users.find({}, {"id": 1})]
+
+    results = {}
+    start = time.perf_counter()
+    for i in range(rounds):
+        await db.users.find_one({"id": ids[i % users]})
+    results["find_one"] = rounds / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        User(**await db.users.find_one({"id": ids[i % users]}))
+    results["find_one + User"] = rounds / (time.perf_counter() - start)
+
+    pages = max(1, rounds // 100)
+    start = time.perf_counter()
+    for _ in range(pages):
+        await db.users.find().to_list(1000)
+    results["find().to_list(1000)"] = pages / (time.perf_counter() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=50000)
+    args = parser.parse_args()
+
+    copy_results = asyncio.run(run("copy", args.users, args.rounds))
+    view_results = asyncio.run(run("view", args.users, args.rounds))
+
+    print(f"{'operation':<24}{'copy ops/s':>14}{'view ops/s':>14}{'speedup':>10}")
+    for name, copy_ops in copy_results.items():
+        view_ops = view_results[name]
+        print(f"{name:<24}{copy_ops:>14,.0f}{view_ops:>14,.0f}{view_ops / copy_ops:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark the per-item cost of turning status check documents into a JSON response.
+
+Compares the old path (StatusCheck(**doc), validation against the
+response_model, stdlib JSONResponse), the same with ORJSONResponse, and
+ORJSONResponses of trusted_models and of trusted_content, and checks that
+they all produce the same bytes.
+
+Usage: python benchmarks/bench_serialization.py [--items N] [--rounds N]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+# Add backend directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from responses import ORJSONResponse, trusted_content, trusted_models
+from server import StatusCheck
+
+
+def make_documents(count: int) -> List[dict]:
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    documents = []
+    for i in range(count):
+        # Mix naive, whole-second and UTC timestamps, as stored over time
+        timestamp = start + timedelta(seconds=i, microseconds=(i * 7919) % 1000000 if i % 3 else 0)
+        if i % 5 == 0:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        documents.append({
+            "_id": i,
+            "id": str(uuid.uuid4()),
+            "client_name": f"client-{i} é",
+            "timestamp": timestamp,
+        })
+    return documents
+
+
+async def validated_body(field, documents, response_class) -> bytes:
+    models = [StatusCheck(**document) for document in documents]
+    content = await serialize_response(field=field, response_content=models)
+    return response_class(content).body
+
+
+def trusted_models_body(documents) -> bytes:
+    return ORJSONResponse(trusted_models(StatusCheck, documents)).body
+
+
+def trusted_content_body(documents) -> bytes:
+    return ORJSONResponse(trusted_content(StatusCheck, documents)).body
+
+
+async def seconds_per_round(func, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+        if asyncio.iscoroutine(result):
+            await result
+    return (time.perf_counter() - start) / rounds
+
+
+async def run(items: int, rounds: int):
+    documents = make_documents(items)
+    field = create_response_field(name="Response_get_status_checks", type_=List[StatusCheck])
+
+    paths = {
+        "validated + JSONResponse": lambda: validated_body(field, documents, JSONResponse),
+        "validated + ORJSONResponse": lambda: validated_body(field, documents, ORJSONResponse),
+        "trusted_models + ORJSON": lambda: trusted_models_body(documents),
+        "trusted_content + ORJSON": lambda: trusted_content_body(documents),
+    }
+
+    bodies = {}
+    for name, func in paths.items():
+        result = func()
+        bodies[name] = await result if asyncio.iscoroutine(result) else result
+    reference = bodies["validated + JSONResponse"]
+    for name, body in bodies.items():
+        if body != reference:
+            raise SystemExit(f"{name} output differs from JSONResponse's")
+
+    print(f"{items} status checks, {len(reference):,} bytes; all outputs identical\n")
+    print(f"{'path':<30}{'us/item':>10}{'items/s':>14}")
+    for name, func in paths.items():
+        seconds = await seconds_per_round(func, rounds)
+        print(f"{name:<30}{seconds / items * 1e6:>10.2f}{items / seconds:>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Report where server startup time goes: module imports, then startup steps.
+
+Usage: python benchmarks/bench_startup.py [--top N]
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+# Import server and run its startup hooks in a fresh interpreter
+STARTUP_SCRIPT = """
+import server
+from fastapi.testclient import TestClient
+with TestClient(server.app):
+    pass
+print("import server.py", server.SERVER_IMPORT_SECONDS)
+for step, seconds in server.startup_timings.items():
+    print(step, seconds)
+"""
+
+
+def import_times(output: str):
+    """Parse -X importtime output into (module, self us, cumulative us, depth)."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15, help="number of imports to list")
+    args = parser.parse_args()
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    rows = import_times(result.stderr)
+
+    # Top-level imports of server.py and the modules it imports, by cumulative time
+    print(f"{'import':<40}{'cumulative ms':>16}{'self ms':>10}")
+    for name, self_us, cumulative_us, depth in sorted(
+        (row for row in rows if row[3] <= 1), key=lambda row: -row[2]
+    )[:args.top]:
+        print(f"{'  ' * depth + name:<40}{cumulative_us / 1000:>16.1f}{self_us / 1000:>10.1f}")
+
+    print(f"\n{'startup step':<40}{'ms':>16}")
+    for line in result.stdout.splitlines():
+        step, _, seconds = line.rpartition(" ")
+        try:
+            print(f"{step:<40}{float(seconds) * 1000:>16.1f}")
+        except ValueError:
+            continue
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Load test the API: requests per second and p50/p95/p99 latency per route.
+
+Closed-loop workers send a weighted mix of requests for a fixed duration.
+The app runs in this process behind an ASGI transport (--mode inprocess),
+in a uvicorn subprocess (--mode uvicorn), or anywhere else (--mode url).
+--db picks the mock database or MongoDB (MONGO_URL) for the first two.
+
+Rate limiting is turned off in the app under test, and bcrypt runs at
+cost 10 (--bcrypt-rounds), so that results are comparable between runs;
+with --mode url the server's own settings apply.
+
+Results can be checked against stored baselines (benchmarks/baselines.json),
+keyed by mode, database, mix and concurrency: the run fails if a route's
+RPS drops, or its p95 rises, by more than --tolerance. p95 is only compared
+for routes with enough requests to make it stable.
+
+Usage:
+    python benchmarks/load_test.py [--mode inprocess|uvicorn|url] [--db mock|mongo]
+        [--mix default|read|auth|ROUTE=WEIGHT,...] [--concurrency N] [--duration S]
+        [--check-baseline | --save-baseline]
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = Path(__file__).parent.parent
+BASELINES_FILE = Path(__file__).parent / "baselines.json"
+
+# Route name -> weight
+MIXES: Dict[str, Dict[str, int]] = {
+    "default": {
+        "me": 40, "status_list": 20, "status_create": 20, "login": 10,
+        "register": 5, "request_otp": 3, "verify_otp": 2,
+    },
+    "read": {"me": 50, "status_list": 50},
+    "auth": {"login": 40, "register": 20, "me": 40},
+}
+
+LOAD_TEST_PASSWORD = "load-test-password"
+
+# p95 of routes with fewer requests than this is too noisy to compare
+MIN_P95_SAMPLES = 100
+
+
+class Scenario:
+    """Builds each route's requests; holds what setup() created for them."""
+
+    def __init__(self, status_page_size: int):
+        self.status_page_size = status_page_size
+        self.run_id = uuid.uuid4().hex[:8]
+        self._counter = itertools.count()
+        self.email = f"load-{self.run_id}@loadtest.organconnect.com"
+        self.headers: Dict[str, str] = {}
+
+    def _unique(self) -> int:
+        return next(self._counter)
+
+    def _new_user(self) -> Dict[str, Any]:
+        n = self._unique()
+        return {
+            "email": f"load-{self.run_id}-{n}@loadtest.organconnect.com",
+            "password": LOAD_TEST_PASSWORD,
+            "confirm_password": LOAD_TEST_PASSWORD,
+            "role": "donor",
+            "name": f"Load Test {n}",
+            "mobile": f"+1555{self.run_id}{n}",
+        }
+
+    async def setup(self, client: httpx.AsyncClient, status_checks: int):
+        """Register the user that login and me use, and store some status checks."""
+        response = await client.post("/api/auth/register", json=dict(self._new_user(), email=self.email))
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        for i in range(status_checks):
+            (await client.post("/api/status", json={"client_name": f"load-{i}"})).raise_for_status()
+
+    def request(self, route: str) -> Tuple[str, str, Dict[str, Any]]:
+        """(method, path, httpx keyword arguments) for one request to route."""
+        if route == "register":
+            return "POST", "/api/auth/register", {"json": self._new_user()}
+        if route == "login":
+            return "POST", "/api/auth/login", {
+                "json": {"email": self.email, "password": LOAD_TEST_PASSWORD}
+            }
+        if route == "me":
+            return "GET", "/api/auth/me", {"headers": self.headers}
+        if route == "request_otp":
+            return "POST", "/api/auth/request-otp", {"json": {"mobile": f"+1666{self._unique()}"}}
+        if route == "verify_otp":
+            # With no OTP pending for the number, the demo accepts any six digits
+            return "POST", "/api/auth/verify-otp", {
+                "json": {"mobile": f"+1777{self._unique()}", "otp": "123456"}
+            }
+        if route == "status_create":
+            return "POST", "/api/status", {"json": {"client_name": f"load-{self.run_id}"}}
+        if route == "status_list":
+            return "GET", "/api/status", {"params": {"limit": self.status_page_size}}
+        raise ValueError(f"Unknown route: {route}")
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    if value in MIXES:
+        return MIXES[value]
+    mix = {}
+    for part in value.split(","):
+        route, _, weight = part.partition("=")
+        mix[route.strip()] = int(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": len(values) / seconds,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+    }
+
+
+async def run_load(client: httpx.AsyncClient, scenario: Scenario, mix: Dict[str, int],
+                   concurrency: int, duration: float, warmup: float,
+                   seed: int) -> Dict[str, Dict[str, Any]]:
+    """Run the mix; returns results per route, plus "total".
+
+    Requests started during the measured window count, including ones that
+    finish after it, so slow routes are not under-represented.
+    """
+    routes = list(mix)
+    cumulative = list(itertools.accumulate(mix[route] for route in routes))
+    latencies: Dict[str, List[float]] = {route: [] for route in routes}
+    errors: Dict[str, int] = {route: 0 for route in routes}
+    loop_start = time.perf_counter()
+    measure_from = loop_start + warmup
+    deadline = measure_from + duration
+
+    async def worker(worker_seed: int):
+        rng = random.Random(worker_seed)
+        while True:
+            route = routes[bisect.bisect_right(cumulative, rng.random() * cumulative[-1])]
+            method, path, kwargs = scenario.request(route)
+            start = time.perf_counter()
+            if start >= deadline:
+                return
+            try:
+                response = await client.request(method, path, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            end = time.perf_counter()
+            if start >= measure_from:
+                latencies[route].append(end - start)
+                errors[route] += failed
+
+    await asyncio.gather(*(worker(seed + i) for i in range(concurrency)))
+
+    results = {route: summarize(latencies[route], errors[route], duration) for route in routes}
+    results["total"] = summarize(
+        list(itertools.chain.from_iterable(latencies.values())), sum(errors.values()), duration
+    )
+    return results
+
+
+def app_environment(args: argparse.Namespace) -> Dict[str, str]:
+    """Settings for the app under test, on top of backend/.env."""
+    environment = {
+        "USE_MOCK_DB": "true" if args.db == "mock" else "false",
+        "RATE_LIMIT_ENABLED": "false",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+    }
+    if args.db == "mock":
+        # A fresh in-memory database for every run
+        environment["MOCK_DB_PATH"] = ""
+        environment["MOCK_DB_SOCKET"] = ""
+    return environment
+
+
+async def load_in_process(args: argparse.Namespace, scenario: Scenario, mix: Dict[str, int]):
+    os.environ.update(app_environment(args))
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.chdir(BACKEND_DIR)
+    import logging
+
+    # Per-request logging would dominate the measurement
+    logging.disable(logging.INFO)
+    from server import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            await scenario.setup(client, args.status_checks)
+            return await run_load(client, scenario, mix, args.concurrency, args.duration,
+                                  args.warmup, args.seed)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_healthy(client: httpx.AsyncClient, process: Optional[subprocess.Popen],
+                             timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"Server exited with status {process.returncode}")
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit("Server did not become healthy in time")
+        await asyncio.sleep(0.2)
+
+
+async def load_over_http(args: argparse.Namespace, scenario: Scenario, mix: Dict[str, int]):
+    process = None
+    url = args.url
+    if args.mode == "uvicorn":
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        command = [
+            sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+            "--port", str(port), "--workers", str(args.workers), "--log-level", "warning",
+            "--no-access-log",
+        ]
+        process = subprocess.Popen(command, cwd=BACKEND_DIR, env=dict(os.environ, **app_environment(args)))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+            await wait_until_healthy(client, process)
+            await scenario.setup(client, args.status_checks)
+            return await run_load(client, scenario, mix, args.concurrency, args.duration,
+                                  args.warmup, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def print_results(results: Dict[str, Dict[str, Any]]):
+    print(f"\n{'route':<16}{'requests':>10}{'errors':>8}{'rps':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, result in results.items():
+        print(f"{route:<16}{result['requests']:>10}{result['errors']:>8}{result['rps']:>10.1f}"
+              f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+
+
+def check_baseline(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                   tolerance: float) -> List[str]:
+    """Regressions of the results against the baseline, as messages."""
+    regressions = []
+    for route, expected in baseline.items():
+        result = results.get(route)
+        if result is None:
+            continue
+        if result["rps"] < expected["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: {result['rps']:.1f} rps, baseline {expected['rps']:.1f}")
+        if result["requests"] < MIN_P95_SAMPLES or expected["requests"] < MIN_P95_SAMPLES:
+            continue
+        if result["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{route}: p95 {result['p95_ms']:.2f}ms, baseline {expected['p95_ms']:.2f}ms"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn", "url"), default="inprocess")
+    parser.add_argument("--url", default="http://127.0.0.1:8001", help="server for --mode url")
+    parser.add_argument("--db", choices=("mock", "mongo"), default="mock")
+    parser.add_argument("--mix", default="default",
+                        help=f"one of {', '.join(MIXES)}, or weights like login=1,me=10")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds run before measuring")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--status-checks", type=int, default=200,
+                        help="status checks stored before the run")
+    parser.add_argument("--status-page-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baselines", type=Path, default=BASELINES_FILE)
+    parser.add_argument("--check-baseline", action="store_true",
+                        help="exit with status 1 if a route regressed past its baseline")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed RPS drop and p95 rise, as a fraction of the baseline")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    scenario = Scenario(args.status_page_size)
+    print(f"{args.mode} / {args.db}: mix {args.mix}, {args.concurrency} concurrent, "
+          f"{args.duration:.0f}s after {args.warmup:.0f}s warm-up")
+    runner = load_in_process if args.mode == "inprocess" else load_over_http
+    results = asyncio.run(runner(args, scenario, mix))
+    print_results(results)
+
+    key = f"{args.mode}:{args.db}:{args.mix}:c{args.concurrency}"
+    baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+    if args.save_baseline:
+        baselines[key] = {
+            "recorded": time.strftime("%Y-%m-%d"),
+            "machine": f"{platform.machine()}, {os.cpu_count()} CPUs, Python {platform.python_version()}",
+            "routes": {
+                route: {"requests": result["requests"], "rps": round(result["rps"], 1),
+                        "p95_ms": round(result["p95_ms"], 2)}
+                for route, result in results.items()
+            },
+        }
+        args.baselines.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline {key} to {args.baselines}")
+    elif args.check_baseline:
+        if key not in baselines:
+            raise SystemExit(f"No baseline {key} in {args.baselines}; record one with --save-baseline")
+        regressions = check_baseline(results, baselines[key]["routes"], args.tolerance)
+        if regressions:
+            print(f"\nRegressed past baseline {key} (tolerance {args.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            raise SystemExit(1)
+        print(f"\nWithin {args.tolerance:.0%} of baseline {key}")
+
+    if results["total"]["errors"]:
+        raise SystemExit(f"{results['total']['errors']} requests failed")
+
+
+if __name__ == "__main__":
+    main()
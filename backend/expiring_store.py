@@ -0,0 +1,501 @@
+"""
+Key-value stores whose entries expire, for short-lived data such as OTPs.
+
+LocalExpiringStore keeps entries in process memory. Expiry is driven by a
+hashed timer wheel, so expiring an entry costs O(1) amortized and needs no
+background task, and a hard cap on entries evicts the oldest first.
+
+RedisExpiringStore keeps entries in Redis (or anything that speaks its
+protocol), so every worker sees the same entries. For development without
+Redis, run a stand-in backed by LocalExpiringStore:
+    python expiring_store.py --port 6390
+and set REDIS_URL=redis://localhost:6390.
+"""
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+import argparse
+import asyncio
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LocalExpiringStore:
+    """In-process expiring store.
+
+    Each entry is also filed in the timer wheel slot of the tick it expires
+    in; every operation first advances the wheel to the current tick and
+    removes the entries due in the slots it passes. Entries due more than one
+    revolution ahead stay in their slot until a later pass.
+
+    Not thread-safe; meant to be used from the event loop.
+    """
+
+    def __init__(self, max_entries: int = 100000, resolution: float = 1.0,
+                 slots: int = 3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.resolution = resolution
+        self._clock = clock
+        # Insertion ordered, so the first key is the oldest entry
+        self._entries: Dict[str, Tuple[Any, float]] = {}
+        self._wheel: List[Set[str]] = [set() for _ in range(slots)]
+        self._tick = self._current_tick()
+        self.expired = 0
+        self.evicted = 0
+
+    def _current_tick(self) -> int:
+        return int(self._clock() / self.resolution)
+
+    def _advance(self):
+        now_tick = self._current_tick()
+        if now_tick <= self._tick:
+            return
+        now = self._clock()
+        # A full revolution visits every slot, so never loop further than that
+        first = max(self._tick + 1, now_tick - len(self._wheel) + 1)
+        for tick in range(first, now_tick + 1):
+            slot = self._wheel[tick % len(self._wheel)]
+            for key in [key for key in slot if self._entries[key][1] <= now]:
+                slot.discard(key)
+                del self._entries[key]
+                self.expired += 1
+        self._tick = now_tick
+
+    def _slot(self, expires_at: float) -> Set[str]:
+        # Round up, so a slot is only processed once its entries are all due
+        return self._wheel[math.ceil(expires_at / self.resolution) % len(self._wheel)]
+
+    def _remove(self, key: str) -> Optional[Any]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._slot(entry[1]).discard(key)
+        return entry[0]
+
+    async def set(self, key: str, value: Any, ttl: float):
+        """Store value under key for ttl seconds, replacing any previous value."""
+        self._advance()
+        self._remove(key)
+        while len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evicted += 1
+        expires_at = self._clock() + ttl
+        self._entries[key] = (value, expires_at)
+        self._slot(expires_at).add(key)
+
+    async def get(self, key: str) -> Optional[Any]:
+        self._advance()
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= self._clock():
+            return None
+        return entry[0]
+
+    async def pop(self, key: str) -> Optional[Any]:
+        """Remove key and return its value, if it had not expired."""
+        self._advance()
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= self._clock():
+            return None
+        return self._remove(key)
+
+    async def pop_if_equal(self, key: str, value: Any) -> Optional[bool]:
+        """Remove key if it holds value.
+
+        True if it did, False if it holds another value (which is kept), None
+        if there is no entry. Nothing in between yields to the event loop, so
+        no other operation can come between the comparison and the removal.
+        """
+        self._advance()
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= self._clock():
+            return None
+        if entry[0] != value:
+            return False
+        self._remove(key)
+        return True
+
+    async def delete(self, key: str):
+        self._advance()
+        self._remove(key)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        """Add one to the counter at key and return it; a new counter expires after ttl."""
+        self._advance()
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= self._clock():
+            await self.set(key, 1, ttl)
+            return 1
+        count = int(entry[0]) + 1
+        self._entries[key] = (count, entry[1])
+        return count
+
+    async def decr(self, key: str) -> int:
+        """Subtract one from the counter at key, keeping its expiry; 0 if there is none."""
+        self._advance()
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= self._clock():
+            return 0
+        count = int(entry[0]) - 1
+        self._entries[key] = (count, entry[1])
+        return count
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+    async def close(self):
+        pass
+
+
+# Redis protocol (RESP)
+
+
+def _encode_command(*args: Any) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class RespError(Exception):
+    """An error reply from the server."""
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readuntil(b"\r\n")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise RespError(f"Unexpected reply from server: {line!r}")
+
+
+# Lua scripts, which Redis runs atomically; RespServer recognises them by their text
+_POP_IF_EQUAL = """
+local value = redis.call('GET', KEYS[1])
+if not value then return false end
+if value ~= ARGV[1] then return 0 end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+_INCR_WITH_EXPIRY = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end
+return count
+"""
+
+
+class RedisExpiringStore:
+    """Expiring store on a Redis server, using one pipelined connection per event loop.
+
+    Commands are written as soon as they are issued; replies arrive in order
+    and are matched to a queue of waiting futures. Opening the connection
+    fails after connect_timeout seconds and a command after timeout seconds;
+    a failed connection is dropped, and the next command opens a new one.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "",
+                 connect_timeout: float = 2.0, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connected: Optional[asyncio.Task] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._waiting: Deque[asyncio.Future] = deque()
+
+    @classmethod
+    def from_env(cls, prefix: str = "") -> "RedisExpiringStore":
+        """A store at REDIS_URL, with REDIS_CONNECT_TIMEOUT_MS and REDIS_TIMEOUT_MS."""
+        return cls(
+            os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+            prefix=prefix,
+            connect_timeout=float(os.environ.get("REDIS_CONNECT_TIMEOUT_MS", "2000")) / 1000,
+            timeout=float(os.environ.get("REDIS_TIMEOUT_MS", "1000")) / 1000,
+        )
+
+    async def _ensure_connected(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A connection belongs to the loop that opened it
+            self._loop = loop
+            self._connected = None
+        if self._connected is None:
+            self._connected = loop.create_task(self._connect())
+            self._connected.add_done_callback(self._connect_done)
+        await asyncio.shield(self._connected)
+
+    def _connect_done(self, task: asyncio.Task):
+        # Forget a failed attempt, so the next command tries again
+        if task.cancelled() or task.exception() is not None:
+            if self._connected is task:
+                self._connected = None
+
+    async def _connect(self):
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.connect_timeout
+            )
+        except asyncio.TimeoutError:
+            raise ConnectionError(
+                f"Timed out connecting to Redis at {self.host}:{self.port}"
+            ) from None
+        self._writer = writer
+        self._waiting = deque()
+        self._reader_task = asyncio.get_running_loop().create_task(
+            self._read_replies(reader, writer, self._waiting)
+        )
+        try:
+            if self.password:
+                await asyncio.wait_for(self._send("AUTH", self.password), self.connect_timeout)
+            if self.db:
+                await asyncio.wait_for(self._send("SELECT", self.db), self.connect_timeout)
+        except BaseException:
+            self._drop(writer)
+            raise
+
+    async def _read_replies(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                            waiting: Deque[asyncio.Future]):
+        try:
+            while True:
+                reply = await _read_reply(reader)
+                future = waiting.popleft()
+                if future.done():
+                    continue
+                if isinstance(reply, RespError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except BaseException as e:
+            # Whatever stopped the reader, the replies still due will never be
+            # matched to their commands: fail them all and drop the connection
+            if isinstance(e, (asyncio.IncompleteReadError, ConnectionError)):
+                error = ConnectionError(f"Lost connection to Redis at {self.host}:{self.port}: {e}")
+            else:
+                if isinstance(e, Exception):
+                    logger.warning(f"Dropping connection to Redis at {self.host}:{self.port}: {e!r}")
+                error = ConnectionError(f"Connection to Redis at {self.host}:{self.port} failed: {e!r}")
+            self._drop(writer)
+            while waiting:
+                future = waiting.popleft()
+                if not future.done():
+                    future.set_exception(error)
+            if not isinstance(e, Exception):
+                raise
+
+    def _drop(self, writer: asyncio.StreamWriter):
+        """Close writer's connection and, if it is the current one, forget it."""
+        writer.close()
+        if self._writer is writer:
+            self._writer = None
+            self._connected = None
+
+    def _send(self, *args: Any) -> asyncio.Future:
+        future = self._loop.create_future()
+        self._waiting.append(future)
+        self._writer.write(_encode_command(*args))
+        return future
+
+    async def execute(self, *args: Any) -> Any:
+        """Send one command and return its reply."""
+        await self._ensure_connected()
+        writer = self._writer
+        if writer is None:
+            raise ConnectionError(f"Not connected to Redis at {self.host}:{self.port}")
+        try:
+            return await asyncio.wait_for(self._send(*args), self.timeout)
+        except asyncio.TimeoutError:
+            # The server stopped answering; start over on a new connection
+            self._drop(writer)
+            raise ConnectionError(
+                f"Timed out waiting for Redis at {self.host}:{self.port} ({args[0]})"
+            ) from None
+
+    @staticmethod
+    def _decode(value: Optional[bytes]) -> Optional[str]:
+        return value.decode() if value is not None else None
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self.execute("SET", self.prefix + key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._decode(await self.execute("GET", self.prefix + key))
+
+    async def pop(self, key: str) -> Optional[str]:
+        return self._decode(await self.execute("GETDEL", self.prefix + key))
+
+    async def pop_if_equal(self, key: str, value: str) -> Optional[bool]:
+        """Remove key if it holds value; see LocalExpiringStore.pop_if_equal."""
+        reply = await self.execute("EVAL", _POP_IF_EQUAL, 1, self.prefix + key, value)
+        return None if reply is None else reply == 1
+
+    async def delete(self, key: str):
+        await self.execute("DEL", self.prefix + key)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        """Add one to the counter at key and return it; a new counter expires after ttl.
+
+        One script, so a counter never exists without its expiry.
+        """
+        return await self.execute("EVAL", _INCR_WITH_EXPIRY, 1, self.prefix + key,
+                                  max(1, int(ttl * 1000)))
+
+    async def decr(self, key: str) -> int:
+        """Subtract one from the counter at key."""
+        return await self.execute("DECR", self.prefix + key)
+
+    async def close(self):
+        if self._writer is not None:
+            self._drop(self._writer)
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._connected = None
+
+
+# Local stand-in for a Redis server
+
+# Lifetime of keys that Redis would keep until deleted
+_NO_EXPIRY = 10 * 365 * 86400
+
+
+class RespServer:
+    """Serves GET, SET (with EX/PX), GETDEL, DEL, INCR, DECR, PEXPIRE and PING from a LocalExpiringStore.
+
+    EVAL only runs the scripts RedisExpiringStore sends, each by its own handler.
+    """
+
+    def __init__(self, store: LocalExpiringStore, host: str = "127.0.0.1", port: int = 6390):
+        self.store = store
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._scripts = {
+            _POP_IF_EQUAL: self._pop_if_equal,
+            _INCR_WITH_EXPIRY: self._incr_with_expiry,
+        }
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Redis stand-in listening on {self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                command = await _read_reply(reader)
+                if not isinstance(command, list) or not command:
+                    break
+                writer.write(await self._execute([part.decode() for part in command]))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _execute(self, command: List[str]) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if name == "SET" and len(args) == 4 and args[2].upper() in ("EX", "PX"):
+            ttl = float(args[3]) / (1000 if args[2].upper() == "PX" else 1)
+            await self.store.set(args[0], args[1], ttl)
+            return b"+OK\r\n"
+        if name in ("GET", "GETDEL") and len(args) == 1:
+            value = await (self.store.get if name == "GET" else self.store.pop)(args[0])
+            if value is None:
+                return b"$-1\r\n"
+            data = str(value).encode()
+            return b"$%d\r\n%s\r\n" % (len(data), data)
+        if name == "INCR" and len(args) == 1:
+            # Like Redis, a counter created by a bare INCR does not expire
+            value = await self.store.incr(args[0], _NO_EXPIRY)
+            return b":%d\r\n" % value
+        if name == "DECR" and len(args) == 1:
+            return b":%d\r\n" % await self.store.decr(args[0])
+        if name == "PEXPIRE" and len(args) == 2:
+            value = await self.store.get(args[0])
+            if value is None:
+                return b":0\r\n"
+            await self.store.set(args[0], value, float(args[1]) / 1000)
+            return b":1\r\n"
+        if name == "EVAL" and len(args) >= 2 and args[0] in self._scripts:
+            key_count = int(args[1])
+            return await self._scripts[args[0]](args[2:2 + key_count], args[2 + key_count:])
+        if name == "DEL":
+            existing = 0
+            for key in args:
+                if await self.store.pop(key) is not None:
+                    existing += 1
+            return b":%d\r\n" % existing
+        return f"-ERR unsupported command '{name}'\r\n".encode()
+
+    async def _pop_if_equal(self, keys: List[str], argv: List[str]) -> bytes:
+        popped = await self.store.pop_if_equal(keys[0], argv[0])
+        return b"$-1\r\n" if popped is None else b":%d\r\n" % popped
+
+    async def _incr_with_expiry(self, keys: List[str], argv: List[str]) -> bytes:
+        return b":%d\r\n" % await self.store.incr(keys[0], float(argv[0]) / 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis protocol stand-in for development")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--max-entries", type=int, default=100000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = RespServer(LocalExpiringStore(max_entries=args.max_entries), args.host, args.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Async password hashing.
+
+bcrypt is deliberately slow, so hashing and verifying run on a bounded
+executor instead of the event loop. Calls beyond the executor's capacity wait
+in a bounded queue; once that is full, new calls fail fast with HasherBusy so
+a login storm cannot build an unbounded backlog.
+
+Configured with environment variables:
+    HASH_EXECUTOR     "thread" (default) or "process"
+    HASH_WORKERS      number of workers (default: CPU count)
+    HASH_QUEUE_SIZE   calls that may wait for a worker (default: 64)
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+import server_timing
+from auth_utils import get_bcrypt_rounds, get_password_hash, set_bcrypt_rounds, verify_password
+
+logger = logging.getLogger(__name__)
+
+
+HASH_SECONDS = metrics.Histogram(
+    "password_hash_duration_seconds",
+    "Password hashing time by operation and phase (wait for a worker, run).",
+    ("operation", "phase"),
+)
+
+
+class HasherBusy(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+def _timed(func: Callable, *args: Any) -> Tuple[Any, float, float]:
+    """Run func in a worker; returns (result, start time, run seconds).
+
+    time.monotonic() is system-wide, so start times taken in a worker process
+    can be compared with the submit time in the server process.
+    """
+    start = time.monotonic()
+    result = func(*args)
+    return result, start, time.monotonic() - start
+
+
+class _Timing:
+    """Count, total and maximum of a duration, in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded thread or process pool."""
+
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 64,
+                 executor: str = "thread"):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown hash executor: {executor}")
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.executor_kind = executor
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+        self.rejected = 0
+        self.timings: Dict[str, Dict[str, _Timing]] = {
+            operation: {"wait": _Timing(), "run": _Timing()}
+            for operation in ("hash", "verify")
+        }
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        workers = os.environ.get("HASH_WORKERS")
+        return cls(
+            workers=int(workers) if workers else None,
+            queue_size=int(os.environ.get("HASH_QUEUE_SIZE", "64")),
+            executor=os.environ.get("HASH_EXECUTOR", "thread").lower(),
+        )
+
+    def _get_executor(self) -> Executor:
+        # Created on first use, so importing this module never starts a pool
+        if self._executor is None:
+            if self.executor_kind == "process":
+                # Workers import auth_utils afresh, so pass on the configured cost
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=set_bcrypt_rounds,
+                    initargs=(get_bcrypt_rounds(),),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    async def _run(self, operation: str, func: Callable, *args: Any) -> Any:
+        if self._in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HasherBusy(f"Password hashing is saturated ({self._in_flight} calls in flight)")
+
+        self._in_flight += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, run_seconds = await loop.run_in_executor(
+                self._get_executor(), _timed, func, *args
+            )
+        finally:
+            self._in_flight -= 1
+            server_timing.record("hash", time.monotonic() - submitted)
+
+        wait_seconds = max(started - submitted, 0.0)
+        timing = self.timings[operation]
+        timing["wait"].add(wait_seconds)
+        timing["run"].add(run_seconds)
+        HASH_SECONDS.labels(operation, "wait").observe(wait_seconds)
+        HASH_SECONDS.labels(operation, "run").observe(run_seconds)
+        return result
+
+    async def hash(self, password: str) -> str:
+        """Hash a password."""
+        return await self._run("hash", get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against a hash."""
+        return await self._run("verify", verify_password, plain_password, hashed_password)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, rejections and per-operation wait/run timings."""
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "rejected": self.rejected,
+            "timings": {
+                operation: {phase: timing.as_dict() for phase, timing in phases.items()}
+                for operation, phases in self.timings.items()
+            },
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_password_hasher: Optional[PasswordHasher] = None
+
+
+def get_password_hasher() -> PasswordHasher:
+    """The process-wide hasher, configured from the environment on first use."""
+    global _password_hasher
+    if _password_hasher is None:
+        _password_hasher = PasswordHasher.from_env()
+    return _password_hasher
+
+
+# Read when /api/metrics is scraped; nothing is reported before the hasher is first used
+metrics.CallbackMetric(
+    "password_hash_in_flight", "Hashing calls running or waiting for a worker.",
+    lambda: _password_hasher and _password_hasher._in_flight,
+)
+metrics.CallbackMetric(
+    "password_hash_capacity", "Hashing calls allowed in flight (workers plus queue size).",
+    lambda: _password_hasher and _password_hasher.workers + _password_hasher.queue_size,
+)
+metrics.CallbackMetric(
+    "password_hash_rejected_total", "Hashing calls rejected because the queue was full.",
+    lambda: _password_hasher and _password_hasher.rejected, kind="counter",
+)
@@ -0,0 +1,32 @@
+"""
+Index definitions for the collections the API queries.
+Works against both Motor and the mock database, which share create_index.
+"""
+from typing import Any, Dict, List, Tuple
+
+# (collection, keys, options) for every index the routes rely on.
+# /auth/register depends on the unique email and mobile indexes to reject
+# duplicate signups in a single write; the order here decides which error a
+# signup that clashes on both fields reports.
+INDEXES: List[Tuple[str, Any, Dict[str, Any]]] = [
+    ("users", "id", {"unique": True}),
+    ("users", "email", {"unique": True}),
+    # Admin accounts may have no mobile number, so only enforce uniqueness
+    # for documents that actually have one.
+    ("users", "mobile", {
+        "unique": True,
+        "partialFilterExpression": {"mobile": {"$type": "string"}},
+    }),
+    # One document per setting, e.g. the bcrypt cost shared by all workers
+    ("settings", "id", {"unique": True}),
+    # GET /status pages through status checks in (timestamp, id) order
+    ("status_checks", [("timestamp", 1), ("id", 1)], {}),
+]
+
+
+async def ensure_indexes(db) -> List[str]:
+    """Create all application indexes. Safe to call on every startup."""
+    names = []
+    for collection, keys, options in INDEXES:
+        names.append(await db[collection].create_index(keys, **options))
+    return names
@@ -0,0 +1,122 @@
+"""
+Timing wrapper for the database, Motor or mock alike.
+
+InstrumentedDatabase wraps a database object and hands out wrapped
+collections whose operations report their duration to server_timing and
+to the db_operation_duration_seconds histogram in metrics. Cursor
+methods (find, aggregate) return wrapped cursors, timed as they fetch.
+Anything else is passed through to the wrapped object untouched.
+"""
+from typing import Any, Dict
+import time
+
+import metrics
+import server_timing
+
+# Collection methods that return an awaitable result
+TIMED_METHODS = frozenset({
+    "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "delete_one", "delete_many", "bulk_write", "count_documents",
+    "estimated_document_count", "distinct", "find_one_and_update",
+    "find_one_and_replace", "find_one_and_delete", "create_index",
+    "create_indexes", "drop_index", "index_information",
+})
+CURSOR_METHODS = frozenset({"find", "aggregate"})
+# Cursor methods that return the cursor itself, for chaining
+CHAINED_CURSOR_METHODS = frozenset({"sort", "skip", "limit", "batch_size"})
+
+
+DB_OPERATION_SECONDS = metrics.Histogram(
+    "db_operation_duration_seconds",
+    "Database call time by collection and operation (cursors: per fetch).",
+    ("collection", "operation"),
+)
+
+
+def observe(collection: str, operation: str, seconds: float):
+    server_timing.record("db", seconds)
+    DB_OPERATION_SECONDS.labels(collection, operation).observe(seconds)
+
+
+class InstrumentedCursor:
+    """Cursor wrapper timing to_list() and each fetch during async iteration."""
+
+    def __init__(self, cursor: Any, collection: str, operation: str):
+        self._cursor = cursor
+        self._collection = collection
+        self._operation = operation
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._cursor, name)
+        if name in CHAINED_CURSOR_METHODS:
+            def chained(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+            return chained
+        return attr
+
+    async def to_list(self, length) -> Any:
+        start = time.perf_counter()
+        try:
+            return await self._cursor.to_list(length)
+        finally:
+            observe(self._collection, self._operation, time.perf_counter() - start)
+
+    def __aiter__(self) -> "InstrumentedCursor":
+        self._iterator = self._cursor.__aiter__()
+        return self
+
+    async def __anext__(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return await self._iterator.__anext__()
+        finally:
+            observe(self._collection, self._operation, time.perf_counter() - start)
+
+
+class InstrumentedCollection:
+    """Collection wrapper timing each operation."""
+
+    def __init__(self, collection: Any):
+        self._collection = collection
+        self.name = collection.name
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._collection, name)
+        if name in TIMED_METHODS:
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await attr(*args, **kwargs)
+                finally:
+                    observe(self.name, name, time.perf_counter() - start)
+        elif name in CURSOR_METHODS:
+            def timed(*args, **kwargs):
+                return InstrumentedCursor(attr(*args, **kwargs), self.name, name)
+        else:
+            return attr
+        # Cache the wrapper, so later lookups skip __getattr__
+        timed.__name__ = name
+        setattr(self, name, timed)
+        return timed
+
+
+class InstrumentedDatabase:
+    """Database wrapper handing out InstrumentedCollections."""
+
+    def __init__(self, db: Any):
+        self._db = db
+        self.name = db.name
+        self._collections: Dict[str, InstrumentedCollection] = {}
+
+    def __getitem__(self, name: str) -> InstrumentedCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = InstrumentedCollection(self._db[name])
+        return collection
+
+    def __getattr__(self, name: str) -> Any:
+        # Database methods and private attributes belong to the database itself
+        if name.startswith("_") or hasattr(type(self._db), name):
+            return getattr(self._db, name)
+        return self[name]
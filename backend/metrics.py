@@ -0,0 +1,285 @@
+"""
+Prometheus metrics, rendered in the text exposition format at /api/metrics.
+
+Counters and histograms are updated in the request path, so an update is
+kept to a dict lookup for the label values plus an increment (histograms
+add a bisect over their bucket bounds). Everything runs on the event loop,
+so no locks are taken.
+
+Values that already live elsewhere (hasher queue depth, cache and rate
+limiter counters, process stats) are not copied on every change; a
+CallbackMetric reads them when the endpoint is scraped.
+
+    REQUESTS = Counter("http_requests_total", "HTTP requests.", ("method", "route", "status"))
+    REQUESTS.labels("GET", "/api/status", "200").inc()
+"""
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; suits both sub-millisecond mock calls and bcrypt at a few hundred ms
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """The metrics rendered together by one endpoint."""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric"):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def unregister(self, name: str):
+        self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, Any] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> Any:
+        """The child for these label values, created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self, lines: List[str]):
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """A count that only goes up."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        """Increment the counter of a metric without labels."""
+        self.labels().inc(amount)
+
+    def render(self, lines: List[str]):
+        for values, child in self._children.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} "
+                         f"{_format_value(child.value)}")
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One count per bucket, plus the +Inf bucket; made cumulative when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """Observations counted into buckets by upper bound."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 registry: Optional[Registry] = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        """Observe a value on a metric without labels."""
+        self.labels().observe(value)
+
+    def render(self, lines: List[str]):
+        bucket_labels = self.labelnames + ("le",)
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, values + (bound,))} "
+                             f"{cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+
+
+class CallbackMetric(_Metric):
+    """A gauge or counter whose samples are read from callback when scraped.
+
+    callback returns the samples as (label values, value) pairs, or a single
+    number for a metric without labels.
+    """
+
+    def __init__(self, name: str, documentation: str,
+                 callback: Callable[[], Any], kind: str = "gauge",
+                 labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.kind = kind
+        self.callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def render(self, lines: List[str]):
+        samples = self.callback()
+        if samples is None:
+            return
+        if isinstance(samples, (int, float)):
+            samples = [((), samples)]
+        for values, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} "
+                         f"{_format_value(value)}")
+
+
+# Process stats
+
+PROCESS_START_TIME = time.time()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _memory_bytes() -> Iterable[Tuple[LabelValues, int]]:
+    try:
+        with open("/proc/self/statm") as statm:
+            virtual, resident = statm.read().split()[:2]
+    except OSError:
+        # Not Linux: only the peak resident size is available
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KiB on Linux and BSD, bytes on macOS
+        return [(("peak_resident",), peak if os.uname().sysname == "Darwin" else peak * 1024)]
+    return [(("resident",), int(resident) * _PAGE_SIZE), (("virtual",), int(virtual) * _PAGE_SIZE)]
+
+
+def _open_fds() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+CallbackMetric("process_cpu_seconds_total", "User and system CPU time spent, in seconds.",
+               time.process_time, kind="counter")
+CallbackMetric("process_memory_bytes", "Memory size of the process, in bytes.",
+               _memory_bytes, labelnames=("type",))
+CallbackMetric("process_open_fds", "Open file descriptors.", _open_fds)
+CallbackMetric("process_start_time_seconds", "Start time of the process, in seconds since the epoch.",
+               lambda: PROCESS_START_TIME)
+
+
+# HTTP requests
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by method, route template and status code.",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving an HTTP request to sending its response, by route template.",
+    ("method", "route"),
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware counting and timing HTTP requests.
+
+    Requests are labelled with the matched route's path template (so
+    /api/users/{id} is one series, not one per id) and "unmatched" for 404s.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the scope
+            route = scope.get("route")
+            template = getattr(route, "path_format", None) or getattr(route, "path", "unmatched")
+            HTTP_REQUESTS.labels(scope["method"], template, str(status)).inc()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], template).observe(
+                time.perf_counter() - start
+            )
@@ -0,0 +1,440 @@
+"""
+Aggregation pipeline support for the mock database.
+
+Supports the $match, $group, $sort, $project, $skip, $limit and $count stages,
+with the expression operators the admin statistics need. Large $group stages
+run as vectorized pandas group-bys when pandas is installed and every
+expression in the stage can be computed column-wise; everything else is
+evaluated one document at a time.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from datetime import datetime
+import math
+
+from mock_db import (
+    _DescendingKey, _get_path, _project, _sort_value, compile_filter,
+)
+
+# $group stages over at least this many documents use pandas
+VECTORIZE_MIN_DOCS = 2000
+
+_ACCUMULATORS = ('$sum', '$avg', '$min', '$max', '$first', '$last', '$push', '$addToSet', '$count')
+_VECTORIZED_ACCUMULATORS = ('$sum', '$avg', '$min', '$max', '$count')
+# strftime directives $dateToString shares with Python
+_DATE_FORMAT_DIRECTIVES = set('YmdHMSjUwaAbB%')
+
+
+def _pandas():
+    try:
+        import pandas
+    except ImportError:
+        return None
+    return pandas
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _numbers(values: Iterable[Any]) -> List[Any]:
+    return [value for value in values if _is_number(value)]
+
+
+# Expressions
+
+
+def _check_date_format(date_format: str):
+    for index, char in enumerate(date_format):
+        if char == '%' and (index + 1 >= len(date_format) or
+                            date_format[index + 1] not in _DATE_FORMAT_DIRECTIVES):
+            raise ValueError(f"Unsupported $dateToString format: {date_format}")
+
+
+def _arithmetic(op: str, values: List[Any]) -> Any:
+    if any(value is None for value in values):
+        return None
+    if op == '$add':
+        return sum(values)
+    if op == '$multiply':
+        return math.prod(values)
+    first, second = values
+    if op == '$subtract':
+        return first - second
+    return first / second
+
+
+def evaluate(expression: Any, doc: Dict) -> Any:
+    """Evaluate an aggregation expression against one document."""
+    if isinstance(expression, str) and expression.startswith('$'):
+        if expression == '$$ROOT':
+            return doc
+        return _get_path(doc, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, doc) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) != 1 or not next(iter(expression)).startswith('$'):
+        return {key: evaluate(value, doc) for key, value in expression.items()}
+
+    op, operand = next(iter(expression.items()))
+    if op == '$literal':
+        return operand
+    if op == '$dateToString':
+        _check_date_format(operand['format'])
+        date = evaluate(operand['date'], doc)
+        return date.strftime(operand['format']) if isinstance(date, datetime) else None
+    if op in ('$year', '$month', '$dayOfMonth'):
+        date = evaluate(operand, doc)
+        if not isinstance(date, datetime):
+            return None
+        return {'$year': date.year, '$month': date.month, '$dayOfMonth': date.day}[op]
+    if op == '$floor':
+        value = evaluate(operand, doc)
+        if not _is_number(value):
+            return None
+        # Like MongoDB, the floor of a double is still a double
+        return float(math.floor(value)) if isinstance(value, float) else value
+    if op in ('$add', '$subtract', '$multiply', '$divide'):
+        values = [evaluate(item, doc) for item in operand]
+        values = [value if _is_number(value) else None for value in values]
+        return _arithmetic(op, values)
+    if op == '$ifNull':
+        for item in operand:
+            value = evaluate(item, doc)
+            if value is not None:
+                return value
+        return None
+    if op == '$toLower':
+        value = evaluate(operand, doc)
+        return value.lower() if isinstance(value, str) else ''
+    raise ValueError(f"Unsupported aggregation expression operator: {op}")
+
+
+def _numeric_series(values, pd):
+    """Numbers of a column as a nullable series, keeping integers integral."""
+    if pd.api.types.infer_dtype(values, skipna=True) == 'integer':
+        return values.astype('Int64')
+    numbers = [value if _is_number(value) else None for value in values]
+    # Integers among other values that are not numbers still sum to an int
+    integral = all(isinstance(number, int) for number in numbers if number is not None)
+    return pd.Series(numbers, index=values.index, dtype=object).astype('Int64' if integral else 'Float64')
+
+
+def _vectorize(expression: Any, column: Callable[[str], Any], pd) -> Any:
+    """Evaluate an expression over whole columns; returns a Series or a scalar.
+
+    Raises NotImplementedError for expressions that have no vectorized form.
+    """
+    if isinstance(expression, str) and expression.startswith('$'):
+        if expression.startswith('$$'):
+            raise NotImplementedError(expression)
+        return column(expression[1:])
+    if not isinstance(expression, (dict, list)):
+        return expression
+    if isinstance(expression, list) or len(expression) != 1 or \
+            not next(iter(expression)).startswith('$'):
+        raise NotImplementedError("compound expression")
+
+    op, operand = next(iter(expression.items()))
+    if op == '$literal':
+        return operand
+    if op == '$dateToString':
+        _check_date_format(operand['format'])
+        dates = pd.to_datetime(_vectorize(operand['date'], column, pd), errors='coerce')
+        return dates.dt.strftime(operand['format']).astype(object).where(dates.notna(), None)
+    if op in ('$year', '$month', '$dayOfMonth'):
+        dates = pd.to_datetime(_vectorize(operand, column, pd), errors='coerce')
+        part = {'$year': dates.dt.year, '$month': dates.dt.month, '$dayOfMonth': dates.dt.day}[op]
+        return part.astype('Int64')
+    if op == '$floor':
+        values = _vectorize(operand, column, pd)
+        if not isinstance(values, pd.Series):
+            raise NotImplementedError("$floor of a constant")
+        numbers = _numeric_series(values, pd)
+        if pd.api.types.is_integer_dtype(numbers):
+            return numbers
+        return numbers.floordiv(1)
+    if op in ('$add', '$subtract', '$multiply', '$divide'):
+        values = [_vectorize(item, column, pd) for item in operand]
+        values = [
+            _numeric_series(value, pd) if isinstance(value, pd.Series) else value
+            for value in values
+        ]
+        if op == '$add':
+            result = values[0]
+            for value in values[1:]:
+                result = result + value
+            return result
+        if op == '$multiply':
+            result = values[0]
+            for value in values[1:]:
+                result = result * value
+            return result
+        first, second = values
+        return first - second if op == '$subtract' else first / second
+    raise NotImplementedError(op)
+
+
+# $group
+
+
+def _freeze_key(value: Any) -> Any:
+    if isinstance(value, dict):
+        return ('d',) + tuple((key, _freeze_key(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ('l',) + tuple(_freeze_key(item) for item in value)
+    return value
+
+
+def _accumulate(op: str, values: List[Any]) -> Any:
+    if op == '$sum':
+        return sum(_numbers(values))
+    if op == '$avg':
+        numbers = _numbers(values)
+        return sum(numbers) / len(numbers) if numbers else None
+    if op in ('$min', '$max'):
+        present = [value for value in values if value is not None]
+        if not present:
+            return None
+        select = min if op == '$min' else max
+        return select(present, key=_sort_value)
+    if op == '$first':
+        return values[0] if values else None
+    if op == '$last':
+        return values[-1] if values else None
+    if op == '$push':
+        return list(values)
+    if op == '$addToSet':
+        unique = []
+        for value in values:
+            if value not in unique:
+                unique.append(value)
+        return unique
+    raise ValueError(f"Unsupported accumulator: {op}")
+
+
+def _parse_group(spec: Dict[str, Any]) -> Tuple[Any, List[Tuple[str, str, Any]]]:
+    if '_id' not in spec:
+        raise ValueError("a group specification must include an _id")
+    accumulators = []
+    for field, accumulator in spec.items():
+        if field == '_id':
+            continue
+        if not isinstance(accumulator, dict) or len(accumulator) != 1:
+            raise ValueError(f"the group field '{field}' must be an accumulator object")
+        op, argument = next(iter(accumulator.items()))
+        if op not in _ACCUMULATORS:
+            raise ValueError(f"unknown group operator '{op}'")
+        accumulators.append((field, op, argument))
+    return spec['_id'], accumulators
+
+
+def _group_python(docs: List[Dict], spec: Dict[str, Any]) -> List[Dict]:
+    key_expression, accumulators = _parse_group(spec)
+    groups: Dict[Any, Tuple[Any, Dict[str, List[Any]]]] = {}
+    for doc in docs:
+        key = evaluate(key_expression, doc)
+        frozen = _freeze_key(key)
+        if frozen not in groups:
+            groups[frozen] = (key, {field: [] for field, _, _ in accumulators})
+        values = groups[frozen][1]
+        for field, op, argument in accumulators:
+            values[field].append(1 if op == '$count' else evaluate(argument, doc))
+
+    results = []
+    for key, values in groups.values():
+        result = {'_id': key}
+        for field, op, _ in accumulators:
+            result[field] = _accumulate('$sum' if op == '$count' else op, values[field])
+        results.append(result)
+    return results
+
+
+def _python_value(value: Any, pd) -> Any:
+    """Convert a pandas/numpy scalar back to the Python value MongoDB would return."""
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if hasattr(value, 'to_pydatetime'):
+        return value.to_pydatetime()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def _group_vectorized(docs: List[Dict], spec: Dict[str, Any], pd) -> List[Dict]:
+    """Run a $group as a pandas group-by. Raises NotImplementedError if it can't."""
+    key_expression, accumulators = _parse_group(spec)
+    if any(op not in _VECTORIZED_ACCUMULATORS for _, op, _ in accumulators):
+        raise NotImplementedError("accumulator without a vectorized form")
+
+    columns: Dict[str, Any] = {}
+
+    def column(path: str):
+        if path not in columns:
+            columns[path] = pd.Series([_get_path(doc, path) for doc in docs], dtype=object)
+        return columns[path]
+
+    def numeric_column(path: str):
+        # $sum and $avg ignore values that are not numbers, including booleans
+        key = '#' + path
+        if key not in columns:
+            columns[key] = _numeric_series(column(path), pd)
+        return columns[key]
+
+    key_parts = key_expression if isinstance(key_expression, dict) and not any(
+        name.startswith('$') for name in key_expression
+    ) else {'_id': key_expression}
+    keys = {}
+    for name, expression in key_parts.items():
+        value = _vectorize(expression, column, pd)
+        keys[name] = value if isinstance(value, pd.Series) else pd.Series(
+            [value] * len(docs), dtype=object
+        )
+
+    frame = pd.DataFrame({f'key:{name}': series.astype(object) for name, series in keys.items()})
+    aggregations = {}
+    # Fields aggregated to a row label, whose value is taken from this column
+    picked: Dict[str, Any] = {}
+    for field, op, argument in accumulators:
+        if op == '$count' or (op == '$sum' and _is_number(argument)):
+            frame[f'acc:{field}'] = 1 if op == '$count' else argument
+            aggregations[field] = ('sum', f'acc:{field}')
+        elif isinstance(argument, str) and argument.startswith('$') and not argument.startswith('$$'):
+            path = argument[1:]
+            if op in ('$sum', '$avg'):
+                frame[f'acc:{field}'] = numeric_column(path)
+                aggregations[field] = ('sum' if op == '$sum' else 'mean', f'acc:{field}')
+                if op == '$sum':
+                    # A group without numbers sums to the int 0, even in a float column
+                    aggregations[f'{field}#numbers'] = ('count', f'acc:{field}')
+            else:
+                values = column(path)
+                present = values.dropna()
+                kinds = {type(value) for value in present}
+                if len(kinds) > 1 and not kinds <= {int, float}:
+                    raise NotImplementedError("$min/$max over mixed types")
+                if kinds == {int, float}:
+                    # Converting to floats would turn an int result into a float,
+                    # so find the row holding the extreme and return its value.
+                    # Missing values become the other extreme, which a group of
+                    # only missing values then picks, giving None.
+                    if any(not math.isfinite(value) for value in present):
+                        raise NotImplementedError("$min/$max over infinite or NaN values")
+                    filler = math.inf if op == '$min' else -math.inf
+                    frame[f'acc:{field}'] = _numeric_series(values, pd).astype(float).fillna(filler)
+                    aggregations[field] = ('idxmin' if op == '$min' else 'idxmax', f'acc:{field}')
+                    picked[field] = values
+                else:
+                    frame[f'acc:{field}'] = _numeric_series(values, pd) if kinds <= {int, float} \
+                        else values.infer_objects()
+                    aggregations[field] = ('min' if op == '$min' else 'max', f'acc:{field}')
+        else:
+            raise NotImplementedError("accumulator argument without a vectorized form")
+
+    key_columns = [f'key:{name}' for name in keys]
+    grouped = frame.groupby(key_columns, dropna=False, sort=False)
+    if aggregations:
+        summary = grouped.agg(**{
+            f'acc:{field}': (source, how) for field, (how, source) in aggregations.items()
+        }).reset_index()
+    else:
+        summary = grouped.size().reset_index()
+
+    results = []
+    for row in summary.itertuples(index=False):
+        row = dict(zip(summary.columns, row))
+        if '_id' in keys and len(keys) == 1:
+            group_id = _python_value(row['key:_id'], pd)
+        else:
+            group_id = {name: _python_value(row[f'key:{name}'], pd) for name in keys}
+        result = {'_id': group_id}
+        for field, op, _ in accumulators:
+            if field in picked:
+                result[field] = picked[field].iat[row[f'acc:{field}']]
+                continue
+            value = _python_value(row[f'acc:{field}'], pd)
+            if op == '$sum' and (value is None or row.get(f'acc:{field}#numbers') == 0):
+                value = 0
+            result[field] = value
+        results.append(result)
+    return results
+
+
+def _group(docs: List[Dict], spec: Dict[str, Any]) -> List[Dict]:
+    if len(docs) >= VECTORIZE_MIN_DOCS:
+        pd = _pandas()
+        if pd is not None:
+            try:
+                return _group_vectorized(docs, spec, pd)
+            except NotImplementedError:
+                pass
+    return _group_python(docs, spec)
+
+
+# Other stages
+
+
+def _sort(docs: List[Dict], spec: Dict[str, int]) -> List[Dict]:
+    fields = list(spec.items())
+
+    def key(doc):
+        return tuple(
+            _sort_value(_get_path(doc, field)) if direction == 1
+            else _DescendingKey(_sort_value(_get_path(doc, field)))
+            for field, direction in fields
+        )
+    return sorted(docs, key=key)
+
+
+def _project_stage(docs: List[Dict], spec: Dict[str, Any]) -> List[Dict]:
+    computed = {
+        field: value for field, value in spec.items()
+        if not (isinstance(value, (bool, int)) and not isinstance(value, float))
+    }
+    flags = {field: value for field, value in spec.items() if field not in computed}
+    if not computed:
+        return [_project(doc, flags) for doc in docs]
+
+    results = []
+    for doc in docs:
+        result = _project(doc, dict(flags, **{field: 1 for field in computed})) \
+            if any(flags.values()) else {}
+        if flags.get('_id', 1) and '_id' in doc and '_id' not in computed:
+            result['_id'] = doc['_id']
+        for field, expression in computed.items():
+            result[field] = evaluate(expression, doc)
+        results.append(result)
+    return results
+
+
+def run_pipeline(docs: Iterable[Dict], pipeline: List[Dict[str, Any]]) -> List[Dict]:
+    """Run an aggregation pipeline over documents.
+
+    The input documents are not modified, but documents that pass through
+    without a $group or $project stage are returned as they are.
+    """
+    stages = list(pipeline)
+    documents: Iterable[Dict] = docs
+    for stage in stages:
+        if len(stage) != 1:
+            raise ValueError("a pipeline stage specification must contain exactly one field")
+        name, spec = next(iter(stage.items()))
+        if name == '$match':
+            matches = compile_filter(spec)
+            documents = [doc for doc in documents if matches(doc)]
+        elif name == '$group':
+            documents = _group(list(documents), spec)
+        elif name == '$sort':
+            documents = _sort(list(documents), spec)
+        elif name == '$project':
+            documents = _project_stage(list(documents), spec)
+        elif name == '$skip':
+            documents = list(documents)[spec:]
+        elif name == '$limit':
+            documents = list(documents)[:spec]
+        elif name == '$count':
+            count = sum(1 for _ in documents)
+            documents = [{spec: count}] if count else []
+        else:
+            raise ValueError(f"Unsupported aggregation stage: {name}")
+    return list(documents)
@@ -2,217 +2,1558 @@
 Mock database for development without MongoDB.
 This provides an in-memory database that mimics Motor's async API.
 """
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import contextlib
+import copy
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Set, Tuple
+import asyncio
+import heapq
+import itertools
+import json
+import operator
+import os
+import re
 import uuid
 from datetime import datetime
 
 
+class InsertOneResult:
+    """Result of an insert_one call."""
+
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    """Result of an insert_many call."""
+
+    def __init__(self, inserted_ids: List[Any]):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    """Result of an update_one or update_many call."""
+
+    def __init__(self, matched_count: int, modified_count: int, upserted_id: Any = None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    """Result of a delete_one or delete_many call."""
+
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+class BulkWriteResult:
+    """Result of a bulk_write call; bulk_api_result holds the raw counts."""
+
+    def __init__(self, bulk_api_result: Dict[str, Any]):
+        self.bulk_api_result = bulk_api_result
+        self.inserted_count = bulk_api_result["nInserted"]
+        self.matched_count = bulk_api_result["nMatched"]
+        self.modified_count = bulk_api_result["nModified"]
+        self.deleted_count = bulk_api_result["nRemoved"]
+        self.upserted_count = bulk_api_result["nUpserted"]
+        self.upserted_ids = {
+            entry["index"]: entry["_id"] for entry in bulk_api_result["upserted"]
+        }
+        self.acknowledged = True
+
+
+class DuplicateKeyError(Exception):
+    """Raised when a write violates a unique index.
+
+    Mirrors pymongo.errors.DuplicateKeyError: ``code`` is 11000 and ``details``
+    carries the violated ``keyPattern`` and ``keyValue``.
+    """
+
+    code = 11000
+
+    def __init__(self, collection: str, index_name: str, key_pattern: Dict[str, Any],
+                 key_value: Dict[str, Any]):
+        errmsg = (
+            f"E11000 duplicate key error collection: {collection} "
+            f"index: {index_name} dup key: {key_value}"
+        )
+        super().__init__(errmsg)
+        self._args = (collection, index_name, key_pattern, key_value)
+        self.details = {
+            "index": 0,
+            "code": self.code,
+            "errmsg": errmsg,
+            "keyPattern": key_pattern,
+            "keyValue": key_value,
+        }
+
+    def __reduce__(self):
+        return type(self), self._args
+
+
+class OperationFailure(Exception):
+    """Raised when the database rejects a command.
+
+    Mirrors pymongo.errors.OperationFailure: ``code`` is the server's error
+    code and ``details`` its full response.
+    """
+
+    def __init__(self, errmsg: str, code: int, code_name: str):
+        super().__init__(errmsg)
+        self._args = (errmsg, code, code_name)
+        self.code = code
+        self.details = {"ok": 0.0, "errmsg": errmsg, "code": code, "codeName": code_name}
+
+    def __reduce__(self):
+        return type(self), self._args
+
+
+class BulkWriteError(Exception):
+    """Raised when operations of a bulk write fail.
+
+    Mirrors pymongo.errors.BulkWriteError: ``details`` holds the counts for the
+    operations that succeeded and a ``writeErrors`` entry (with the index of the
+    failed operation) for each failure.
+    """
+
+    code = 65
+
+    def __init__(self, details: Dict[str, Any]):
+        super().__init__("batch op errors occurred")
+        self.details = details
+
+    def __reduce__(self):
+        return type(self), (self.details,)
+
+
+def _is_operator_expression(value: Any) -> bool:
+    """Return True if value is a query operator document such as {"$gt": 1}."""
+    return isinstance(value, dict) and any(
+        isinstance(key, str) and key.startswith('$') for key in value
+    )
+
+
+def _normalize_index_keys(keys: Any) -> List[Tuple[str, Any]]:
+    """Normalize a Motor-style index key spec into a list of (field, direction)."""
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    normalized = []
+    for key in keys:
+        if isinstance(key, str):
+            normalized.append((key, 1))
+        else:
+            field, direction = key
+            normalized.append((field, direction))
+    if not normalized:
+        raise ValueError("Index key specification must not be empty")
+    return normalized
+
+
+_BSON_TYPES = {
+    "string": (str,),
+    "bool": (bool,),
+    "int": (int,),
+    "long": (int,),
+    "double": (float,),
+    "number": (int, float),
+    "object": (dict,),
+    "array": (list,),
+    "date": (datetime,),
+    "null": (type(None),),
+    "regex": (re.Pattern,),
+}
+
+_MISSING = object()
+
+
+def _get_path(doc: Dict, path: str) -> Any:
+    """Return the value at a dotted path (numeric parts index arrays), or None."""
+    if '.' not in path:
+        return doc.get(path)
+    value: Any = doc
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return None
+        if value is _MISSING:
+            return None
+    return value
+
+
+def _path_getter(path: str):
+    """Build a function returning the values a document holds at a dotted path.
+
+    Follows MongoDB semantics: when a path crosses an array of sub-documents
+    every element is followed, so several values may come back. An empty tuple
+    means the field is missing.
+    """
+    if '.' not in path:
+        def get_top_level(doc):
+            value = doc.get(path, _MISSING)
+            return () if value is _MISSING else (value,)
+        return get_top_level
+
+    parts = path.split('.')
+
+    def walk(value, depth):
+        if depth == len(parts):
+            yield value
+            return
+        part = parts[depth]
+        if isinstance(value, dict):
+            if part in value:
+                yield from walk(value[part], depth + 1)
+        elif isinstance(value, list):
+            if part.isdigit() and int(part) < len(value):
+                yield from walk(value[int(part)], depth + 1)
+            for item in value:
+                if isinstance(item, dict):
+                    yield from walk(item, depth)
+
+    def get_nested(doc):
+        return tuple(walk(doc, 0))
+    return get_nested
+
+
+def _expand(values: Tuple) -> Iterator[Any]:
+    """Yield each value, plus the elements of array values."""
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+
+def _type_class(value: Any) -> Optional[type]:
+    """Values only compare with $gt/$lt etc. against values of the same class."""
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, (int, float)):
+        return float
+    for value_type in (str, datetime, bytes):
+        if isinstance(value, value_type):
+            return value_type
+    return None
+
+
+def _equal(a: Any, b: Any) -> bool:
+    # Unlike Python, MongoDB does not consider True equal to 1
+    return a == b and isinstance(a, bool) == isinstance(b, bool)
+
+
+def _regex_flags(options: str) -> int:
+    flags = 0
+    for option in options:
+        flags |= {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'x': re.VERBOSE}[option]
+    return flags
+
+
+def _value_matcher(target: Any):
+    """Build a predicate testing a single value for equality with target."""
+    if isinstance(target, re.Pattern):
+        return lambda value: isinstance(value, str) and target.search(value) is not None
+    return lambda value: _equal(value, target)
+
+
+def _compile_operator(op: str, operand: Any, condition: Dict):
+    """Compile one field operator into a predicate over the field's values."""
+    if op == '$eq':
+        match = _value_matcher(operand)
+        if operand is None:
+            return lambda values: not values or any(match(v) for v in _expand(values))
+        return lambda values: any(match(v) for v in _expand(values))
+    if op == '$ne':
+        equals = _compile_operator('$eq', operand, condition)
+        return lambda values: not equals(values)
+    if op in ('$gt', '$gte', '$lt', '$lte'):
+        compare = {
+            '$gt': operator.gt, '$gte': operator.ge,
+            '$lt': operator.lt, '$lte': operator.le,
+        }[op]
+        operand_class = _type_class(operand)
+        return lambda values: any(
+            _type_class(v) is operand_class and compare(v, operand)
+            for v in _expand(values)
+        )
+    if op == '$in':
+        matchers = [_value_matcher(item) for item in operand]
+        has_null = any(item is None for item in operand)
+        return lambda values: (has_null and not values) or any(
+            match(v) for v in _expand(values) for match in matchers
+        )
+    if op == '$nin':
+        contained = _compile_operator('$in', operand, condition)
+        return lambda values: not contained(values)
+    if op == '$exists':
+        expected = bool(operand)
+        return lambda values: bool(values) == expected
+    if op == '$regex':
+        pattern = operand if isinstance(operand, re.Pattern) else re.compile(
+            operand, _regex_flags(condition.get('$options', ''))
+        )
+        return lambda values: any(
+            isinstance(v, str) and pattern.search(v) is not None for v in _expand(values)
+        )
+    if op == '$options':
+        if '$regex' not in condition:
+            raise ValueError("$options needs a $regex")
+        return None
+    if op == '$not':
+        if isinstance(operand, (re.Pattern, str)):
+            inner = _compile_operator('$regex', operand, {})
+        else:
+            inner = _compile_condition(operand)
+        return lambda values: not inner(values)
+    if op == '$type':
+        aliases = operand if isinstance(operand, list) else [operand]
+        types = tuple(t for alias in aliases for t in _BSON_TYPES[alias])
+        wants_bool = 'bool' in aliases
+        wants_array = 'array' in aliases
+
+        def has_type(value):
+            if isinstance(value, bool) and not wants_bool:
+                return False
+            return isinstance(value, types)
+        return lambda values: any(has_type(v) for v in values) or (
+            not wants_array and any(has_type(v) for v in _expand(values))
+        )
+    if op == '$size':
+        return lambda values: any(isinstance(v, list) and len(v) == operand for v in values)
+    if op == '$all':
+        required = [_compile_operator('$eq', item, {}) for item in operand]
+        return lambda values: bool(required) and all(check(values) for check in required)
+    if op == '$elemMatch':
+        if _is_operator_expression(operand) and not any(
+            key in ('$and', '$or', '$nor') for key in operand
+        ):
+            check = _compile_condition(operand)
+
+            def element_matches(item):
+                return check((item,))
+        else:
+            matches_document = compile_filter(operand)
+
+            def element_matches(item):
+                return isinstance(item, dict) and matches_document(item)
+        return lambda values: any(
+            isinstance(v, list) and any(element_matches(item) for item in v) for v in values
+        )
+    raise ValueError(f"Unsupported query operator: {op}")
+
+
+def _compile_condition(condition: Any):
+    """Compile the condition for one field into a predicate over its values."""
+    if not _is_operator_expression(condition):
+        return _compile_operator('$eq', condition, {})
+    checks = [
+        check for check in (
+            _compile_operator(op, operand, condition) for op, operand in condition.items()
+        )
+        if check is not None
+    ]
+    if len(checks) == 1:
+        return checks[0]
+    return lambda values: all(check(values) for check in checks)
+
+
+def _compile_field(path: str, condition: Any):
+    get_values = _path_getter(path)
+    check = _compile_condition(condition)
+    return lambda doc: check(get_values(doc))
+
+
+def _compile(filter_dict: Dict):
+    checks = []
+    for key, condition in filter_dict.items():
+        if key in ('$and', '$or', '$nor'):
+            if not isinstance(condition, list) or not condition:
+                raise ValueError(f"{key} must be a nonempty array")
+            clauses = [compile_filter(clause) for clause in condition]
+            if key == '$and':
+                checks.append(lambda doc, c=clauses: all(clause(doc) for clause in c))
+            elif key == '$or':
+                checks.append(lambda doc, c=clauses: any(clause(doc) for clause in c))
+            else:
+                checks.append(lambda doc, c=clauses: not any(clause(doc) for clause in c))
+        elif key.startswith('$'):
+            raise ValueError(f"Unsupported top-level query operator: {key}")
+        else:
+            checks.append(_compile_field(key, condition))
+
+    if not checks:
+        return lambda doc: True
+    if len(checks) == 1:
+        return checks[0]
+    if len(checks) == 2:
+        first, second = checks
+        return lambda doc: first(doc) and second(doc)
+    return lambda doc: all(check(doc) for check in checks)
+
+
+def _freeze(value: Any) -> Any:
+    """Turn a filter into a hashable cache key (raises TypeError if impossible)."""
+    if isinstance(value, dict):
+        return ('d',) + tuple((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ('l',) + tuple(_freeze(item) for item in value)
+    hash(value)
+    # Keep 1, 1.0 and True apart, since they do not match the same documents
+    return (type(value), value)
+
+
+_FILTER_CACHE: "OrderedDict[Any, Any]" = OrderedDict()
+_FILTER_CACHE_SIZE = 512
+
+
+def compile_filter(filter_dict: Dict):
+    """Compile a MongoDB query filter into a predicate over documents.
+
+    Supports equality (with array membership), $eq, $ne, $gt, $gte, $lt, $lte,
+    $in, $nin, $exists, $regex/$options, $not, $type, $size, $all, $elemMatch,
+    dotted paths into sub-documents and arrays, and $and/$or/$nor. Compiled
+    predicates are cached, so repeated queries skip the compilation.
+    """
+    try:
+        key = _freeze(filter_dict)
+    except TypeError:
+        return _compile(filter_dict)
+
+    predicate = _FILTER_CACHE.get(key)
+    if predicate is not None:
+        _FILTER_CACHE.move_to_end(key)
+        return predicate
+    predicate = _compile(filter_dict)
+    _FILTER_CACHE[key] = predicate
+    if len(_FILTER_CACHE) > _FILTER_CACHE_SIZE:
+        _FILTER_CACHE.popitem(last=False)
+    return predicate
+
+
+def _equality_constraints(filter_dict: Dict) -> Dict[str, List[Any]]:
+    """Collect the fields a filter pins to a finite set of scalar values.
+
+    Looks at plain equality, $eq and $in on top-level keys and inside $and, which
+    is what an index lookup can answer.
+    """
+    constraints: Dict[str, List[Any]] = {}
+    for key, condition in filter_dict.items():
+        if key == '$and' and isinstance(condition, list):
+            for clause in condition:
+                for field, values in _equality_constraints(clause).items():
+                    constraints.setdefault(field, values)
+            continue
+        if key.startswith('$'):
+            continue
+        if not _is_operator_expression(condition):
+            values = [condition]
+        elif '$eq' in condition:
+            values = [condition['$eq']]
+        elif '$in' in condition and isinstance(condition['$in'], list):
+            values = condition['$in']
+        else:
+            continue
+        if all(
+            not isinstance(value, (dict, list, re.Pattern)) and _hashable(value)
+            for value in values
+        ):
+            constraints[key] = values
+    return constraints
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _index_name(keys: List[Tuple[str, Any]]) -> str:
+    """Generate the default index name, matching MongoDB ("email_1")."""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+_UNHASHABLE = object()
+
+
+class _HashIndex:
+    """In-memory hash index mapping indexed field values to document ids.
+
+    Single-field keys are the raw field value and compound keys are tuples.
+    Each key maps to the id of the one document holding it, or to a set of ids
+    once several do, which keeps unique indexes at one dict entry per document.
+    """
+
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], unique: bool = False,
+                 sparse: bool = False, partial_filter: Optional[Dict] = None):
+        self.name = name
+        self.keys = keys
+        self.fields = tuple(field for field, _ in keys)
+        self.unique = unique
+        self.sparse = sparse
+        self.partial_filter = partial_filter
+        self._covers_all = not sparse and partial_filter is None
+        # An index over a field that holds arrays or sub-documents cannot answer
+        # equality lookups by hashing, so the planner skips it once this is set.
+        self.multikey = False
+        self._entries: Dict[Any, Any] = {}
+        self.key_for = self._key_function()
+
+    def _key_function(self):
+        """Build the function returning a document's index key (or _UNHASHABLE)."""
+        if len(self.fields) == 1:
+            field = self.fields[0]
+            if '.' not in field:
+                def single_key(doc):
+                    value = doc.get(field)
+                    return _UNHASHABLE if isinstance(value, (list, dict)) else value
+            else:
+                def single_key(doc):
+                    value = _get_path(doc, field)
+                    return _UNHASHABLE if isinstance(value, (list, dict)) else value
+            return single_key
+
+        fields = self.fields
+
+        def compound_key(doc):
+            values = tuple(_get_path(doc, field) for field in fields)
+            for value in values:
+                if isinstance(value, (list, dict)):
+                    return _UNHASHABLE
+            return values
+        return compound_key
+
+    def covers(self, doc: Dict) -> bool:
+        """Return True if the document belongs in this (possibly sparse/partial) index."""
+        if self._covers_all:
+            return True
+        if self.sparse and all(_get_path(doc, field) is None for field in self.fields):
+            return False
+        if self.partial_filter is not None:
+            return compile_filter(self.partial_filter)(doc)
+        return True
+
+    def build(self, items: Iterable[Tuple[str, Dict]], check_unique: bool = True) -> Optional[Dict]:
+        """Index documents in bulk. Returns the first document breaking uniqueness."""
+        entries = self._entries
+        key_for = self.key_for
+        covers_all = self._covers_all
+        unique = self.unique and check_unique
+        for doc_id, doc in items:
+            if not covers_all and not self.covers(doc):
+                continue
+            key = key_for(doc)
+            if key is _UNHASHABLE:
+                self.multikey = True
+                continue
+            existing = entries.get(key, _MISSING)
+            if existing is _MISSING:
+                entries[key] = doc_id
+            elif unique:
+                return doc
+            elif type(existing) is set:
+                existing.add(doc_id)
+            else:
+                entries[key] = {existing, doc_id}
+        return None
+
+    def add(self, doc_id: str, doc: Dict):
+        # Callers check uniqueness first, via conflict()
+        self.build(((doc_id, doc),), check_unique=False)
+
+    def remove(self, doc_id: str, doc: Dict):
+        if not self.covers(doc):
+            return
+        key = self.key_for(doc)
+        existing = self._entries.get(key, _MISSING) if key is not _UNHASHABLE else _MISSING
+        if existing is _MISSING:
+            return
+        if type(existing) is set:
+            existing.discard(doc_id)
+            if len(existing) == 1:
+                self._entries[key] = next(iter(existing))
+        elif existing == doc_id:
+            del self._entries[key]
+
+    def lookup(self, key: Any) -> Iterable[str]:
+        existing = self._entries.get(key, _MISSING)
+        if existing is _MISSING:
+            return ()
+        if type(existing) is set:
+            return existing
+        return (existing,)
+
+    def conflict(self, doc_id: str, doc: Dict) -> bool:
+        """Return True if storing doc under doc_id breaks uniqueness."""
+        if not self.unique or not self.covers(doc):
+            return False
+        key = self.key_for(doc)
+        if key is _UNHASHABLE:
+            return False
+        existing = self._entries.get(key, _MISSING)
+        if existing is _MISSING:
+            return False
+        if type(existing) is set:
+            return bool(existing - {doc_id})
+        return existing != doc_id
+
+    def usable_for(self, constraints: Dict[str, List[Any]]) -> bool:
+        """Return True if the equality constraints can be answered by this index."""
+        if self.multikey or not all(field in constraints for field in self.fields):
+            return False
+        if self._covers_all:
+            return True
+        # A sparse or partial index holds only some documents, so it can only
+        # answer queries whose values would themselves be indexed.
+        return all(
+            self.covers(dict(zip(self.fields, values)))
+            for values in itertools.product(*(constraints[field] for field in self.fields))
+        )
+
+    def keys_for(self, constraints: Dict[str, List[Any]]) -> Iterator[Any]:
+        """Yield every index key the constraints allow."""
+        if len(self.fields) == 1:
+            return iter(constraints[self.fields[0]])
+        return itertools.product(*(constraints[field] for field in self.fields))
+
+    def info(self) -> Dict[str, Any]:
+        info = {"key": list(self.keys), "v": 2}
+        if self.unique:
+            info["unique"] = True
+        if self.sparse:
+            info["sparse"] = True
+        if self.partial_filter is not None:
+            info["partialFilterExpression"] = self.partial_filter
+        return info
+
+
+def _set_path(doc: Dict, path: str, value: Any, remove: bool = False):
+    """Set (or remove) a dotted path in doc, copying sub-documents along the way.
+
+    doc must be a fresh copy; nested documents are copied before being changed,
+    so the stored original is never modified.
+    """
+    parts = path.split('.')
+    target = doc
+    for part in parts[:-1]:
+        child = target.get(part)
+        if not isinstance(child, dict):
+            if remove:
+                return
+            child = {}
+        target[part] = child = dict(child)
+        target = child
+    if remove:
+        target.pop(parts[-1], None)
+    else:
+        target[parts[-1]] = value
+
+
+def _apply_update(doc: Dict, update_dict: Dict, inserting: bool = False) -> Dict:
+    """Return a copy of doc with a MongoDB update document applied.
+
+    Supports $set, $unset, $inc, $setOnInsert, $push and $addToSet. An update
+    without operators is merged into the document, as this mock always has.
+    """
+    updated = doc.copy()
+    if not _is_operator_expression(update_dict):
+        updated.update(update_dict)
+        return updated
+
+    for op, fields in update_dict.items():
+        if op == '$setOnInsert' and not inserting:
+            continue
+        for path, value in fields.items():
+            if op in ('$set', '$setOnInsert'):
+                _set_path(updated, path, value)
+            elif op == '$unset':
+                _set_path(updated, path, None, remove=True)
+            elif op == '$inc':
+                current = _get_path(updated, path)
+                _set_path(updated, path, (current or 0) + value)
+            elif op in ('$push', '$addToSet'):
+                current = _get_path(updated, path)
+                items = list(current) if isinstance(current, list) else []
+                values = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                for item in values:
+                    if op == '$push' or item not in items:
+                        items.append(item)
+                _set_path(updated, path, items)
+            else:
+                raise ValueError(f"Unsupported update operator: {op}")
+    return updated
+
+
+def _upsert_seed(filter_dict: Dict) -> Dict:
+    """Build the base document of an upsert from the filter's equality fields."""
+    seed: Dict[str, Any] = {}
+    for field, condition in filter_dict.items():
+        if field.startswith('$'):
+            continue
+        if not _is_operator_expression(condition):
+            _set_path(seed, field, condition)
+        elif '$eq' in condition:
+            _set_path(seed, field, condition['$eq'])
+    return seed
+
+
+# pymongo request class name -> (operation, attributes holding its arguments)
+_BULK_REQUESTS = {
+    'InsertOne': ('insert', ('_doc',)),
+    'UpdateOne': ('update_one', ('_filter', '_doc', '_upsert')),
+    'UpdateMany': ('update_many', ('_filter', '_doc', '_upsert')),
+    'ReplaceOne': ('replace_one', ('_filter', '_doc', '_upsert')),
+    'DeleteOne': ('delete_one', ('_filter',)),
+    'DeleteMany': ('delete_many', ('_filter',)),
+}
+
+_BULK_KINDS = frozenset(kind for kind, _ in _BULK_REQUESTS.values())
+
+
+def _bulk_operation(request: Any) -> Tuple:
+    """Turn a pymongo bulk request object into an (operation, *args) tuple."""
+    if isinstance(request, tuple):
+        if not request or request[0] not in _BULK_KINDS:
+            raise TypeError(f"{request!r} is not a valid bulk write request")
+        return request
+    try:
+        kind, attributes = _BULK_REQUESTS[type(request).__name__]
+    except KeyError:
+        raise TypeError(f"{request!r} is not a valid bulk write request") from None
+    return (kind,) + tuple(bool(getattr(request, name)) if name == '_upsert'
+                           else getattr(request, name) for name in attributes)
+
+
+# Sort order of value types, following MongoDB's BSON comparison order
+_SORT_TYPE_ORDER = (
+    (type(None), 1),
+    (bool, 8),
+    (int, 2),
+    (float, 2),
+    (str, 3),
+    (dict, 4),
+    (list, 5),
+    (bytes, 6),
+    (datetime, 9),
+)
+
+
+def _sort_value(value: Any) -> Tuple[int, Any]:
+    """Map a value to a key that orders mixed types the way MongoDB does."""
+    for value_type, rank in _SORT_TYPE_ORDER:
+        if isinstance(value, value_type):
+            if value_type in (dict, list):
+                return rank, repr(value)
+            return rank, value
+    return 10, repr(value)
+
+
+class _DescendingKey:
+    """Inverts the ordering of a sort key, for mixed-direction sorts."""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key: Any):
+        self.key = key
+
+    def __lt__(self, other: '_DescendingKey') -> bool:
+        return other.key < self.key
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _DescendingKey) and self.key == other.key
+
+
+def _normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    """Normalize the arguments of cursor.sort() into a list of (field, direction)."""
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(field, field_direction) for field, field_direction in key_or_list]
+
+
+def _copy_document(doc: Dict) -> Dict:
+    """Copy a document, including any nested documents and arrays."""
+    copied = doc.copy()
+    for key, value in copied.items():
+        if type(value) in (dict, list):
+            copied[key] = copy.deepcopy(value)
+    return copied
+
+
+class DocumentView(MutableMapping):
+    """Copy-on-write view of a stored document.
+
+    Reads go straight to the stored document, so returning a view costs no copy.
+    The first write, or the first access to a nested document or array, gives
+    the view a private copy, so callers can never modify the stored data.
+    """
+
+    __slots__ = ('_doc', '_owned', '_detached')
+
+    def __init__(self, doc: Dict):
+        self._doc = doc
+        self._owned = False
+        self._detached: Optional[Set[str]] = None
+
+    def _own(self):
+        if not self._owned:
+            self._doc = self._doc.copy()
+            self._owned = True
+            self._detached = set()
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._doc[key]
+        if type(value) in (dict, list) and (self._detached is None or key not in self._detached):
+            self._own()
+            value = self._doc[key] = copy.deepcopy(value)
+            self._detached.add(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        self._own()
+        self._doc[key] = value
+        self._detached.add(key)
+
+    def __delitem__(self, key: str):
+        self._own()
+        del self._doc[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._doc)
+
+    def __len__(self) -> int:
+        return len(self._doc)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._doc
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self._doc else default
+
+    def copy(self) -> Dict:
+        """Return a plain dict copy, like dict.copy()."""
+        return {key: self[key] for key in self._doc}
+
+    def __repr__(self) -> str:
+        return f"DocumentView({self._doc!r})"
+
+    def __reduce__(self):
+        # Pickling serializes by value, so the stored document needs no copy
+        return dict, (self._doc,)
+
+
+READ_MODES = ('copy', 'view')
+
+
+def _project(doc: Dict, projection: Optional[Dict[str, Any]], read_mode: str = 'copy') -> Any:
+    """Export a stored document, keeping only the fields the projection selects.
+
+    In 'copy' read mode the result is a fresh dict; in 'view' mode documents
+    read without a projection are returned as a DocumentView instead.
+    """
+    if not projection:
+        return DocumentView(doc) if read_mode == 'view' else _copy_document(doc)
+
+    included = [field for field, flag in projection.items() if flag and field != '_id']
+    if included:
+        result = {field: doc[field] for field in included if field in doc}
+        if projection.get('_id', True) and '_id' in doc:
+            result['_id'] = doc['_id']
+    else:
+        excluded = {field for field, flag in projection.items() if not flag}
+        result = {field: value for field, value in doc.items() if field not in excluded}
+    return _copy_document(result)
+
+
+class MockCursor:
+    """Lazily evaluated cursor over a MockCollection, mirroring Motor's cursor API.
+
+    Nothing is read until the cursor is iterated. Sort, skip, limit and the
+    projection are applied to the stored documents, so only the documents that
+    are actually returned get copied.
+    """
+
+    def __init__(self, collection: 'MockCollection', filter_dict: Dict,
+                 projection: Optional[Dict[str, Any]] = None, skip: int = 0,
+                 limit: int = 0, sort: Any = None, batch_size: int = 0):
+        self.collection = collection
+        self._filter = filter_dict
+        if isinstance(projection, (list, tuple)):
+            projection = {field: 1 for field in projection}
+        self._projection = projection
+        self._skip = skip
+        self._limit = limit
+        self._sort = _normalize_sort(sort) if sort else None
+        self._batch_size = batch_size or 101
+        self._iterator: Optional[Iterator[Dict]] = None
+        self._buffer: List[Dict] = []
+
+    def _check_not_started(self):
+        if self._iterator is not None:
+            raise RuntimeError("cannot set options after executing query")
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> 'MockCursor':
+        self._check_not_started()
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> 'MockCursor':
+        self._check_not_started()
+        if skip < 0:
+            raise ValueError("skip must be >= 0")
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> 'MockCursor':
+        self._check_not_started()
+        self._limit = abs(limit)
+        return self
+
+    def batch_size(self, batch_size: int) -> 'MockCursor':
+        if batch_size < 0:
+            raise ValueError("batch_size must be >= 0")
+        self._batch_size = batch_size or 101
+        return self
+
+    def _sorted(self, docs: Iterable[Dict]) -> Iterable[Dict]:
+        """Order documents by the sort spec, keeping only the top skip+limit when limited."""
+        sort = self._sort
+        directions = {direction for _, direction in sort}
+        descending = False
+        if len(directions) == 1:
+            descending = directions == {-1}
+
+            def key(doc):
+                return tuple(_sort_value(_get_path(doc, field)) for field, _ in sort)
+        else:
+            def key(doc):
+                return tuple(
+                    _sort_value(_get_path(doc, field)) if direction == 1
+                    else _DescendingKey(_sort_value(_get_path(doc, field)))
+                    for field, direction in sort
+                )
+
+        if self._limit:
+            select = heapq.nlargest if descending else heapq.nsmallest
+            return select(self._skip + self._limit, docs, key=key)
+        return sorted(docs, key=key, reverse=descending)
+
+    def _generate(self) -> Iterator[Dict]:
+        docs = (doc for _, doc in self.collection._iter_matches(self._filter))
+        if self._sort:
+            docs = self._sorted(docs)
+        stop = self._skip + self._limit if self._limit else None
+        for doc in itertools.islice(docs, self._skip, stop):
+            yield _project(doc, self._projection, self.collection._read_mode)
+
+    def _next_batch(self, size: Optional[int]) -> List[Dict]:
+        if self._iterator is None:
+            self._iterator = self._generate()
+        return list(itertools.islice(self._iterator, size))
+
+    def __aiter__(self) -> 'MockCursor':
+        return self
+
+    async def __anext__(self) -> Dict:
+        if not self._buffer:
+            if self._iterator is not None:
+                # Let other tasks run between batches, like a getMore round trip.
+                await asyncio.sleep(0)
+            self._buffer = self._next_batch(self._batch_size)
+            self._buffer.reverse()
+            if not self._buffer:
+                raise StopAsyncIteration
+        return self._buffer.pop()
+
+    async def to_list(self, length: Optional[int]) -> List[Dict]:
+        """Return up to length of the remaining documents (all of them if length is falsy)."""
+        results = []
+        while self._buffer and (not length or len(results) < length):
+            results.append(self._buffer.pop())
+        remaining = length - len(results) if length else None
+        if remaining != 0:
+            results.extend(self._next_batch(remaining))
+        return results
+
+    async def close(self):
+        self._iterator = None
+        self._buffer = []
+
+
+class MockCommandCursor:
+    """Cursor over the results of aggregate(), mirroring Motor's command cursor.
+
+    The pipeline runs when the cursor is first read.
+    """
+
+    def __init__(self, collection: 'MockCollection', pipeline: List[Dict[str, Any]]):
+        self.collection = collection
+        self._pipeline = pipeline
+        self._buffer: Optional[List[Dict]] = None
+
+    async def _run(self) -> List[Dict]:
+        return self.collection._aggregate(self._pipeline)
+
+    async def _results(self) -> List[Dict]:
+        if self._buffer is None:
+            self._buffer = await self._run()
+            self._buffer.reverse()
+        return self._buffer
+
+    def __aiter__(self) -> 'MockCommandCursor':
+        return self
+
+    async def __anext__(self) -> Dict:
+        buffer = await self._results()
+        if not buffer:
+            raise StopAsyncIteration
+        return buffer.pop()
+
+    async def to_list(self, length: Optional[int]) -> List[Dict]:
+        """Return up to length of the remaining documents (all of them if length is falsy)."""
+        buffer = await self._results()
+        count = min(length, len(buffer)) if length else len(buffer)
+        return [buffer.pop() for _ in range(count)]
+
+    async def close(self):
+        self._buffer = []
+
+
 class MockCollection:
     """Mock MongoDB collection with async API."""
-    
-    def __init__(self, name: str):
+
+    def __init__(self, name: str, db_name: str = '', journal=None, read_mode: str = 'copy'):
         self.name = name
+        self._db_name = db_name
+        self._journal = journal
+        self._read_mode = read_mode
         self._data: Dict[str, Dict] = {}
-    
+        self._indexes: Dict[str, _HashIndex] = {}
+        self._index_options: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
+
+    def _record(self, op: str, *args: Any):
+        """Journal a write when the client is persistent."""
+        if self._journal is not None:
+            self._journal.record(self._db_name, self.name, op, *args)
+
+    def _apply(self, op: str, *args: Any):
+        """Replay a journaled write."""
+        if op == 'insert':
+            doc, = args
+            self._store(doc['id'], doc)
+        elif op == 'replace':
+            doc_id, doc = args
+            self._store(doc_id, doc)
+        elif op == 'delete':
+            doc_id, = args
+            self._store(doc_id, None)
+        elif op == 'create_index':
+            keys, options = args
+            self._build_index(keys, options)
+        elif op == 'drop_index':
+            name, = args
+            self._indexes.pop(name, None)
+            self._index_options.pop(name, None)
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
+
+    def _store(self, doc_id: str, doc: Optional[Dict]):
+        """Replace (or with None, remove) the stored document, keeping indexes in sync."""
+        existing = self._data.get(doc_id)
+        if existing is not None:
+            self._index_remove(doc_id, existing)
+        if doc is None:
+            self._data.pop(doc_id, None)
+        else:
+            self._data[doc_id] = doc
+            self._index_add(doc_id, doc)
+
+    # Index management
+
+    def _index_specs(self) -> List[Tuple[Any, Dict[str, Any], Optional[Dict]]]:
+        """Describe the indexes for a snapshot as (keys, options, entries).
+
+        Entries of unique indexes map keys straight to ids, so a shallow copy is
+        a consistent image that lets recovery skip rebuilding them. Other
+        indexes hold sets that are updated in place and are rebuilt instead.
+        """
+        specs = []
+        for name, (keys, options) in self._index_options.items():
+            index = self._indexes[name]
+            entries = dict(index._entries) if index.unique and not index.multikey else None
+            specs.append((keys, options, entries))
+        return specs
+
+    async def create_index(self, keys: Any, **kwargs) -> str:
+        """Create a hash index over the given fields and return its name."""
+        normalized = _normalize_index_keys(keys)
+        name = kwargs.get('name') or _index_name(normalized)
+        if name in self._indexes:
+            return name
+        self._build_index(keys, kwargs)
+        self._record('create_index', keys, kwargs)
+        return name
+
+    def _build_index(self, keys: Any, kwargs: Dict[str, Any],
+                     entries: Optional[Dict] = None) -> str:
+        """Create the index, from a snapshot's entries if given, else from the data."""
+        normalized = _normalize_index_keys(keys)
+        name = kwargs.get('name') or _index_name(normalized)
+
+        index = _HashIndex(
+            name,
+            normalized,
+            unique=bool(kwargs.get('unique', False)),
+            sparse=bool(kwargs.get('sparse', False)),
+            partial_filter=kwargs.get('partialFilterExpression'),
+        )
+        if entries is not None:
+            index._entries = entries
+        else:
+            duplicate = index.build(self._data.items())
+            if duplicate is not None:
+                self._raise_duplicate(index, duplicate)
+        self._indexes[name] = index
+        self._index_options[name] = (keys, kwargs)
+        return name
+
+    async def create_indexes(self, indexes: List[Any]) -> List[str]:
+        """Create several indexes from pymongo IndexModel objects or plain dicts."""
+        names = []
+        for model in indexes:
+            spec = dict(getattr(model, 'document', model))
+            keys = spec.pop('key')
+            names.append(await self.create_index(keys, **spec))
+        return names
+
+    async def drop_index(self, name: str):
+        """Drop an index by name."""
+        if name not in self._indexes:
+            raise KeyError(f"index not found with name [{name}]")
+        del self._indexes[name]
+        del self._index_options[name]
+        self._record('drop_index', name)
+
+    async def index_information(self) -> Dict[str, Dict[str, Any]]:
+        """Describe the indexes on this collection, like Motor's index_information."""
+        info = {"_id_": {"key": [("id", 1)], "v": 2}}
+        for name, index in self._indexes.items():
+            info[name] = index.info()
+        return info
+
+    def _raise_duplicate(self, index: _HashIndex, doc: Dict):
+        key_pattern = dict(index.keys)
+        key_value = {field: _get_path(doc, field) for field in index.fields}
+        raise DuplicateKeyError(self.name, index.name, key_pattern, key_value)
+
+    def _check_unique(self, doc_id: str, doc: Dict):
+        """Raise DuplicateKeyError if storing doc under doc_id violates a unique index."""
+        for index in self._indexes.values():
+            if index.conflict(doc_id, doc):
+                self._raise_duplicate(index, doc)
+
+    def _index_add(self, doc_id: str, doc: Dict):
+        for index in self._indexes.values():
+            index.add(doc_id, doc)
+
+    def _index_remove(self, doc_id: str, doc: Dict):
+        for index in self._indexes.values():
+            index.remove(doc_id, doc)
+
+    # Query planning
+
+    def _candidate_ids(self, filter_dict: Dict) -> Optional[Set[str]]:
+        """Use the primary key or a secondary index to narrow the documents to scan.
+
+        Returns None when no index covers the filter and a full scan is needed.
+        """
+        constraints = _equality_constraints(filter_dict)
+        if not constraints:
+            return None
+
+        ids = constraints.get('id')
+        if ids is not None and all(isinstance(doc_id, str) for doc_id in ids):
+            return {doc_id for doc_id in ids if doc_id in self._data}
+
+        best = None
+        for index in self._indexes.values():
+            if not index.usable_for(constraints):
+                continue
+            # Prefer unique indexes, then the index covering the most fields.
+            rank = (index.unique, len(index.fields))
+            if best is None or rank > best[0]:
+                best = (rank, index)
+
+        if best is None:
+            return None
+        index = best[1]
+        candidates: Set[str] = set()
+        for key in index.keys_for(constraints):
+            candidates.update(index.lookup(key))
+        return candidates
+
+    def _scan(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield every (doc_id, doc) pair in insertion order.
+
+        A cursor may suspend this generator between batches while other requests
+        write to the collection. Like a MongoDB cursor without snapshot isolation,
+        the scan then resumes at the same position instead of failing.
+        """
+        position = 0
+        while True:
+            try:
+                for item in itertools.islice(self._data.items(), position, None):
+                    position += 1
+                    yield item
+                return
+            except RuntimeError:
+                # The dict changed size while suspended; restart from position.
+                continue
+
+    def _iter_matches(self, filter_dict: Dict) -> Iterator[Tuple[str, Dict]]:
+        """Yield (doc_id, doc) pairs for stored documents matching the filter."""
+        if not filter_dict:
+            yield from self._scan()
+            return
+
+        candidates = self._candidate_ids(filter_dict)
+        if candidates is None:
+            items = self._scan()
+        else:
+            items = (
+                (doc_id, self._data[doc_id])
+                for doc_id in list(candidates) if doc_id in self._data
+            )
+
+        matches = compile_filter(filter_dict)
+        for doc_id, doc in items:
+            if matches(doc):
+                yield doc_id, doc
+
+    def _first_match(self, filter_dict: Dict) -> Optional[Tuple[str, Dict]]:
+        return next(self._iter_matches(filter_dict), None)
+
+    # CRUD
+
     async def find_one(self, filter_dict: Dict) -> Optional[Dict]:
         """Find one document matching the filter."""
-        for doc_id, doc in self._data.items():
-            match = True
-            for key, value in filter_dict.items():
-                if doc.get(key) != value:
-                    match = False
-                    break
-            if match:
-                return doc.copy()
-        return None
-    
-    async def insert_one(self, document: Dict) -> Any:
-        """Insert a document."""
+        match = self._first_match(filter_dict)
+        return _project(match[1], None, self._read_mode) if match else None
+
+    def _insert_document(self, document: Dict) -> str:
+        """Store a copy of the document and index it. Returns its id.
+
+        Raises DuplicateKeyError, leaving the collection unchanged, if the id or
+        any unique index key is already taken.
+        """
         if 'id' not in document:
             document['id'] = str(uuid.uuid4())
-        
-        doc_id = document.get('id', str(uuid.uuid4()))
-        self._data[doc_id] = document.copy()
-        
-        class InsertResult:
-            def __init__(self, inserted_id):
-                self.inserted_id = inserted_id
-        
-        return InsertResult(doc_id)
-    
-    async def update_one(self, filter_dict: Dict, update_dict: Dict) -> Any:
+
+        doc_id = document['id']
+        if doc_id in self._data:
+            raise DuplicateKeyError(self.name, "_id_", {"id": 1}, {"id": doc_id})
+        self._check_unique(doc_id, document)
+        stored = _copy_document(document)
+        self._store(doc_id, stored)
+        self._record('insert', stored)
+        return doc_id
+
+    async def insert_one(self, document: Dict) -> InsertOneResult:
+        """Insert a document."""
+        return InsertOneResult(self._insert_document(document))
+
+    def _update_matches(self, filter_dict: Dict, update_dict: Dict, upsert: bool,
+                        multi: bool, replace: bool = False) -> UpdateResult:
+        """Update (or replace) the first, or if multi every, matching document."""
+        if multi:
+            matches = list(self._iter_matches(filter_dict))
+        else:
+            match = self._first_match(filter_dict)
+            matches = [match] if match else []
+
+        if not matches:
+            if not upsert:
+                return UpdateResult(0, 0)
+            if replace:
+                document = dict(update_dict)
+            else:
+                document = _apply_update(_upsert_seed(filter_dict), update_dict, inserting=True)
+            return UpdateResult(0, 0, upserted_id=self._insert_document(document))
+
+        modified = 0
+        for doc_id, doc in matches:
+            if replace:
+                updated = dict(update_dict, id=doc_id)
+            else:
+                updated = _apply_update(doc, update_dict)
+            if updated == doc:
+                continue
+            updated['updated_at'] = datetime.utcnow()
+            self._check_unique(doc_id, updated)
+            self._store(doc_id, updated)
+            self._record('replace', doc_id, updated)
+            modified += 1
+        return UpdateResult(len(matches), modified)
+
+    async def update_one(self, filter_dict: Dict, update_dict: Dict,
+                         upsert: bool = False) -> UpdateResult:
         """Update one document."""
-        for doc_id, doc in self._data.items():
-            match = True
-            for key, value in filter_dict.items():
-                if doc.get(key) != value:
-                    match = False
-                    break
-            if match:
-                if '$set' in update_dict:
-                    doc.update(update_dict['$set'])
-                else:
-                    doc.update(update_dict)
-                doc['updated_at'] = datetime.utcnow()
-                
-                class UpdateResult:
-                    def __init__(self):
-                        self.modified_count = 1
-                
-                return UpdateResult()
-        
-        class UpdateResult:
-            def __init__(self):
-                self.modified_count = 0
-        
-        return UpdateResult()
-    
-    async def delete_one(self, filter_dict: Dict) -> Any:
+        return self._update_matches(filter_dict, update_dict, upsert, multi=False)
+
+    async def update_many(self, filter_dict: Dict, update_dict: Dict,
+                          upsert: bool = False) -> UpdateResult:
+        """Update every matching document."""
+        with self._write_batch():
+            return self._update_matches(filter_dict, update_dict, upsert, multi=True)
+
+    def _delete_matches(self, filter_dict: Dict, multi: bool) -> DeleteResult:
+        if multi:
+            doc_ids = [doc_id for doc_id, _ in self._iter_matches(filter_dict)]
+        else:
+            match = self._first_match(filter_dict)
+            doc_ids = [match[0]] if match else []
+        for doc_id in doc_ids:
+            self._store(doc_id, None)
+            self._record('delete', doc_id)
+        return DeleteResult(len(doc_ids))
+
+    async def delete_one(self, filter_dict: Dict) -> DeleteResult:
         """Delete one document."""
-        for doc_id, doc in list(self._data.items()):
-            match = True
-            for key, value in filter_dict.items():
-                if doc.get(key) != value:
-                    match = False
-                    break
-            if match:
-                del self._data[doc_id]
-                
-                class DeleteResult:
-                    def __init__(self):
-                        self.deleted_count = 1
-                
-                return DeleteResult()
-        
-        class DeleteResult:
-            def __init__(self):
-                self.deleted_count = 0
-        
-        return DeleteResult()
-    
-    def find(self, filter_dict: Dict = None):
-        """Find documents matching the filter."""
+        return self._delete_matches(filter_dict, multi=False)
+
+    async def delete_many(self, filter_dict: Dict) -> DeleteResult:
+        """Delete every matching document."""
+        with self._write_batch():
+            return self._delete_matches(filter_dict, multi=True)
+
+    async def insert_many(self, documents: Iterable[Dict], ordered: bool = True) -> InsertManyResult:
+        """Insert several documents.
+
+        Ordered inserts stop at the first failure; unordered inserts attempt every
+        document. Either way failures raise BulkWriteError listing each one.
+        """
+        documents = list(documents)
+        if not documents:
+            raise TypeError("documents must be a non-empty list")
+        await self.bulk_write([('insert', document) for document in documents], ordered=ordered)
+        return InsertManyResult([document['id'] for document in documents])
+
+    async def bulk_write(self, requests: Iterable[Any], ordered: bool = True) -> BulkWriteResult:
+        """Execute a batch of write operations.
+
+        Accepts pymongo's InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne
+        and DeleteMany request objects. As with pymongo, a failed operation is
+        reported as a writeError with its index in the BulkWriteError raised
+        at the end, along with the counts of the operations that were applied;
+        an ordered batch stops at the first failure, an unordered one carries
+        on with the rest.
+        """
+        operations = [_bulk_operation(request) for request in requests]
+        if not operations:
+            raise ValueError("requests must be a non-empty list")
+
+        counts = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+        }
+        with self._write_batch():
+            for index, (kind, *args) in enumerate(operations):
+                try:
+                    self._execute(kind, args, index, counts)
+                except DuplicateKeyError as e:
+                    counts["writeErrors"].append(dict(e.details, index=index, op=args[0]))
+                    if ordered:
+                        break
+                except Exception as e:
+                    # Anything else the server would reject, e.g. an unknown
+                    # update operator (BadValue)
+                    counts["writeErrors"].append({
+                        "index": index, "code": getattr(e, "code", 2), "errmsg": str(e), "op": args[0],
+                    })
+                    if ordered:
+                        break
+        if counts["writeErrors"]:
+            raise BulkWriteError(counts)
+        return BulkWriteResult(counts)
+
+    def _execute(self, kind: str, args: List[Any], index: int, counts: Dict[str, Any]):
+        """Run one bulk operation, adding its outcome to the bulk counts."""
+        if kind == 'insert':
+            self._insert_document(args[0])
+            counts["nInserted"] += 1
+        elif kind in ('update_one', 'update_many', 'replace_one'):
+            filter_dict, update_dict, upsert = args
+            replace = kind == 'replace_one'
+            if replace and _is_operator_expression(update_dict):
+                raise ValueError("replacement can not include $ operators")
+            result = self._update_matches(
+                filter_dict, update_dict, upsert, kind == 'update_many', replace=replace
+            )
+            counts["nMatched"] += result.matched_count
+            counts["nModified"] += result.modified_count
+            if result.upserted_id is not None:
+                counts["nUpserted"] += 1
+                counts["upserted"].append({"index": index, "_id": result.upserted_id})
+        else:
+            result = self._delete_matches(args[0], kind == 'delete_many')
+            counts["nRemoved"] += result.deleted_count
+
+    def _write_batch(self):
+        """Group the journal writes of a multi-document operation into one flush."""
+        if self._journal is None:
+            return contextlib.nullcontext()
+        return self._journal.batch()
+
+    def find(self, filter_dict: Dict = None, projection: Optional[Dict[str, Any]] = None,
+             **kwargs) -> MockCursor:
+        """Find documents matching the filter.
+
+        Returns a lazy cursor; accepts Motor's skip, limit, sort and batch_size
+        keyword arguments.
+        """
         if filter_dict is None:
             filter_dict = {}
-        
-        results = []
-        for doc_id, doc in self._data.items():
-            if not filter_dict:
-                results.append(doc.copy())
-            else:
-                match = True
-                for key, value in filter_dict.items():
-                    if doc.get(key) != value:
-                        match = False
-                        break
-                if match:
-                    results.append(doc.copy())
-        
-        class MockCursor:
-            def __init__(self, results):
-                self.results = results
-            
-            async def to_list(self, length: int) -> List[Dict]:
-                return self.results[:length] if length else self.results
-        
-        return MockCursor(results)
+        return MockCursor(self, filter_dict, projection, **kwargs)
+
+
+    def _aggregate(self, pipeline: List[Dict[str, Any]]) -> List[Dict]:
+        from mock_aggregation import run_pipeline
+
+        pipeline = list(pipeline)
+        # A leading $match is answered through the indexes, like find()
+        filter_dict = {}
+        if pipeline and '$match' in pipeline[0]:
+            filter_dict = pipeline.pop(0)['$match']
+        docs = (doc for _, doc in self._iter_matches(filter_dict))
+        return [_project(doc, None, self._read_mode) for doc in run_pipeline(docs, pipeline)]
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> MockCommandCursor:
+        """Run an aggregation pipeline; see mock_aggregation for the supported stages.
+
+        Motor options such as allowDiskUse are accepted and ignored.
+        """
+        return MockCommandCursor(self, pipeline)
 
 
 class MockDatabase:
     """Mock MongoDB database."""
-    
-    def __init__(self, name: str):
+
+    def __init__(self, name: str, journal=None, read_mode: str = 'copy'):
         self.name = name
+        self._journal = journal
+        self._read_mode = read_mode
         self._collections: Dict[str, MockCollection] = {}
-    
+
     def __getattr__(self, name: str) -> MockCollection:
         """Get or create a collection."""
-        if name not in self._collections:
-            self._collections[name] = MockCollection(name)
-        return self._collections[name]
-    
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
     def __getitem__(self, name: str) -> MockCollection:
         """Get or create a collection using dict notation."""
         if name not in self._collections:
-            self._collections[name] = MockCollection(name)
+            self._collections[name] = MockCollection(
+                name, self.name, self._journal, self._read_mode
+            )
         return self._collections[name]
 
+    async def command(self, command: Any, **kwargs) -> Dict[str, Any]:
+        """Run a database command.
+
+        Only ping, the one command the app sends, exists here; any other
+        fails the way mongod answers an unknown command.
+        """
+        name = command if isinstance(command, str) else next(iter(command))
+        if name != 'ping':
+            raise OperationFailure(f"no such command: '{name}'", 59, "CommandNotFound")
+        return {"ok": 1.0}
+
 
 class MockMongoClient:
-    """Mock MongoDB client."""
-    
-    def __init__(self, url: str):
+    """Mock MongoDB client.
+
+    With a path, the data is persistent: writes are journaled to that directory
+    and the previous contents are restored on startup (see mock_journal).
+
+    read_mode 'copy' returns reads as fresh dicts, like Motor. 'view' returns
+    copy-on-write DocumentViews over the stored documents instead, which avoids
+    copying every document that is read.
+    """
+
+    def __init__(self, url: str, path: Optional[str] = None, snapshot_every: int = 10000,
+                 fsync: bool = False, read_mode: str = 'copy'):
+        if read_mode not in READ_MODES:
+            raise ValueError(f"read_mode must be one of {READ_MODES}")
         self.url = url
+        self._read_mode = read_mode
         self._databases: Dict[str, MockDatabase] = {}
-    
+        self._journal = None
+        if path:
+            from mock_journal import MockJournal
+
+            journal = MockJournal(path, snapshot_every=snapshot_every, fsync=fsync)
+            journal.load(self)
+            # Attach only after recovery, so replayed writes are not journaled again
+            self._journal = journal
+            for database in self._databases.values():
+                database._journal = journal
+                for collection in database._collections.values():
+                    collection._journal = journal
+
     def __getitem__(self, name: str) -> MockDatabase:
         """Get or create a database."""
         if name not in self._databases:
-            self._databases[name] = MockDatabase(name)
+            self._databases[name] = MockDatabase(name, self._journal, self._read_mode)
         return self._databases[name]
-    
+
+    def snapshot(self):
+        """Write a snapshot now (persistent clients only), so a restart replays no journal."""
+        if self._journal is not None:
+            self._journal.snapshot()
+
     def close(self):
-        """Close connection (no-op for mock)."""
-        pass
+        """Close connection, flushing the journal if the client is persistent."""
+        if self._journal is not None:
+            self._journal.close()
+
+
+# Test users with pre-computed bcrypt hashes (cost 10), so seeding does no
+# hashing. Logging in rehashes them at the configured cost.
+SEED_USERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'mock_users.json')
 
 
-def seed_mock_data(db: MockDatabase):
+def seed_mock_data(db: MockDatabase, fixture_path: str = SEED_USERS_FILE):
     """Seed the mock database with test data (synchronous version)."""
-    from passlib.context import CryptContext
-    
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    
-    # Create test users
+    with open(fixture_path) as f:
+        fixture_users = json.load(f)
+
+    now = datetime.utcnow()
     test_users = [
-        {
-            "id": str(uuid.uuid4()),
-            "email": "donor@organconnect.com",
-            "hashed_password": pwd_context.hash("donor123"),
-            "role": "donor",
-            "name": "John Donor",
-            "mobile": "+1234567890",
-            "age": 30,
-            "mobile_verified": True,
-            "is_active": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "email": "hospital@organconnect.com",
-            "hashed_password": pwd_context.hash("hospital123"),
-            "role": "hospital",
-            "name": "City Hospital",
-            "mobile": "+1234567891",
-            "age": None,
-            "mobile_verified": True,
-            "is_active": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "email": "admin@organconnect.com",
-            "hashed_password": pwd_context.hash("admin123"),
-            "role": "admin",
-            "name": "Admin User",
-            "mobile": "+1234567892",
-            "age": 35,
-            "mobile_verified": True,
-            "is_active": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
+        dict(user, id=user.get("id") or str(uuid.uuid4()), created_at=now, updated_at=now)
+        for user in fixture_users
     ]
-    
-    # Insert users synchronously (directly into the mock collection)
-    for user in test_users:
-        if 'id' not in user:
-            user['id'] = str(uuid.uuid4())
-        doc_id = user['id']
-        db.users._data[doc_id] = user.copy()
-    
+
+    # Insert users synchronously (directly into the mock collection, keeping
+    # any indexes that already exist up to date). A persistent mock database
+    # may already hold them from a previous run.
+    with db.users._write_batch():
+        for user in test_users:
+            if db.users._first_match({"email": user["email"]}) is None:
+                db.users._insert_document(user)
+
     print("Mock database seeded with test users:")
     print("   - donor@organconnect.com / donor123")
     print("   - hospital@organconnect.com / hospital123")
-    print("   - admin@organconnect.com / admin123")
\ No newline at end of file
+    print("   - admin@organconnect.com / admin123")
@@ -0,0 +1,444 @@
+"""
+Shared mock database server, so several uvicorn/gunicorn workers see one dataset.
+
+The server owns a single MockMongoClient and serves the async collection API
+over a Unix socket. Workers connect with RemoteMockClient, a drop-in
+replacement for MockMongoClient: requests issued in the same event loop tick
+are sent in one write, and many requests can be in flight on one connection.
+
+Run the server once, before starting the workers:
+    python mock_db_server.py --socket /tmp/organconnect-mockdb.sock
+and start the workers with MOCK_DB_SOCKET set to the same path.
+
+Frames are length-prefixed pickles, so the socket is created readable by
+its owner only; never expose it to untrusted users.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import pickle
+import struct
+
+from mock_db import MockCommandCursor, MockCursor, MockMongoClient, _bulk_operation
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct(">I")
+
+# Collection methods a client may call remotely
+COLLECTION_METHODS = frozenset({
+    "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "delete_one", "delete_many", "bulk_write", "create_index", "create_indexes",
+    "drop_index", "index_information",
+})
+
+
+def _frame(message: Any) -> bytes:
+    payload = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    return _LENGTH.pack(len(payload)) + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Any:
+    header = await reader.readexactly(_LENGTH.size)
+    (length,) = _LENGTH.unpack(header)
+    return pickle.loads(await reader.readexactly(length))
+
+
+def _picklable_error(error: BaseException) -> BaseException:
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+class MockDBServer:
+    """Serves a MockMongoClient's collections over a Unix socket."""
+
+    def __init__(self, client: MockMongoClient, socket_path: str):
+        self.client = client
+        self.socket_path = socket_path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Mock database server listening on {self.socket_path}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        cursors: Dict[int, MockCursor] = {}
+        cursor_ids = itertools.count(1)
+        outgoing: List[bytes] = []
+
+        def flush():
+            writer.write(b"".join(outgoing))
+            outgoing.clear()
+
+        try:
+            while True:
+                request_id, db_name, coll_name, method, args, kwargs = await _read_frame(reader)
+                try:
+                    result = await self._dispatch(
+                        db_name, coll_name, method, args, kwargs, cursors, cursor_ids
+                    )
+                    response = (request_id, True, result)
+                except Exception as e:
+                    response = (request_id, False, _picklable_error(e))
+                # Requests that arrived together are answered with one write
+                if not outgoing:
+                    loop.call_soon(flush)
+                outgoing.append(_frame(response))
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, db_name: str, coll_name: str, method: str, args: Tuple,
+                        kwargs: Dict[str, Any], cursors: Dict[int, MockCursor],
+                        cursor_ids) -> Any:
+        if method == "command":
+            return await self.client[db_name].command(*args, **kwargs)
+        collection = self.client[db_name][coll_name]
+        if method == "find":
+            # kwargs carry the cursor options; args[1] is the first batch size
+            filter_dict, size = args
+            cursor = collection.find(filter_dict, **kwargs)
+            return await self._next_batch(cursor, size, cursors, next(cursor_ids))
+        if method == "get_more":
+            cursor_id, size = args
+            return await self._next_batch(cursors.pop(cursor_id), size, cursors, cursor_id)
+        if method == "kill_cursor":
+            cursors.pop(args[0], None)
+            return None
+        if method == "aggregate":
+            # Aggregation results are small, so they are returned in one reply
+            return await collection.aggregate(*args, **kwargs).to_list(None)
+        if method not in COLLECTION_METHODS:
+            raise ValueError(f"Unsupported mock database method: {method}")
+        return await getattr(collection, method)(*args, **kwargs)
+
+    @staticmethod
+    async def _next_batch(cursor: MockCursor, size: Optional[int],
+                          cursors: Dict[int, MockCursor], cursor_id: int) -> Tuple[int, List]:
+        """Return (cursor_id, documents); cursor_id is 0 once the cursor is exhausted."""
+        documents = await cursor.to_list(size)
+        if size is None or len(documents) < size:
+            return 0, documents
+        cursors[cursor_id] = cursor
+        return cursor_id, documents
+
+
+class _Connection:
+    """One pipelined connection to the server, bound to the running event loop."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connected: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._outgoing: List[bytes] = []
+        self._ids = itertools.count(1)
+
+    async def _ensure_connected(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._connected is None:
+            # First use, after a lost connection, or on a new event loop (each
+            # test client runs its own)
+            self._loop = loop
+            self._connected = loop.create_task(self._connect())
+        try:
+            await asyncio.shield(self._connected)
+        except BaseException:
+            self._connected = None
+            raise
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        self._writer = writer
+        self._pending = {}
+        self._outgoing = []
+        self._reader_task = asyncio.get_running_loop().create_task(
+            self._read_responses(reader, writer, self._pending)
+        )
+
+    async def _read_responses(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              pending: Dict[int, asyncio.Future]):
+        try:
+            while True:
+                request_id, ok, result = await _read_frame(reader)
+                future = pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+        except BaseException as e:
+            # Whatever stopped the reader (including a frame that does not
+            # unpickle), nothing else will answer the pending requests
+            if isinstance(e, (asyncio.IncompleteReadError, ConnectionError)):
+                error = ConnectionError(f"Lost connection to mock database server: {e}")
+            else:
+                if isinstance(e, Exception):
+                    logger.warning(f"Dropping connection to mock database server: {e!r}")
+                error = ConnectionError(f"Connection to mock database server failed: {e!r}")
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+                self._connected = None
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            pending.clear()
+            if not isinstance(e, Exception):
+                raise
+
+    def _flush(self):
+        if self._writer is not None and self._outgoing:
+            self._writer.write(b"".join(self._outgoing))
+        self._outgoing = []
+
+    async def call(self, db_name: str, coll_name: str, method: str, args: Tuple = (),
+                   kwargs: Optional[Dict[str, Any]] = None) -> Any:
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        if not self._outgoing:
+            # Batch every request made before the loop next runs callbacks
+            self._loop.call_soon(self._flush)
+        self._outgoing.append(_frame((request_id, db_name, coll_name, method, args, kwargs or {})))
+        return await future
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._connected = None
+
+
+class RemoteCursor:
+    """Cursor over a find() on the server, with MockCursor's API."""
+
+    def __init__(self, collection: "RemoteCollection", filter_dict: Dict,
+                 projection: Optional[Dict[str, Any]] = None, **kwargs):
+        self.collection = collection
+        self._filter = filter_dict
+        self._options: Dict[str, Any] = dict(kwargs, projection=projection)
+        self._cursor_id: Optional[int] = None
+        self._buffer: List[Dict] = []
+
+    def _set(self, option: str, value: Any) -> "RemoteCursor":
+        if self._cursor_id is not None:
+            raise RuntimeError("cannot set options after executing query")
+        self._options[option] = value
+        return self
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "RemoteCursor":
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction if direction is not None else 1)]
+        return self._set("sort", key_or_list)
+
+    def skip(self, skip: int) -> "RemoteCursor":
+        return self._set("skip", skip)
+
+    def limit(self, limit: int) -> "RemoteCursor":
+        return self._set("limit", limit)
+
+    def batch_size(self, batch_size: int) -> "RemoteCursor":
+        self._options["batch_size"] = batch_size
+        return self
+
+    async def _fetch(self, size: Optional[int]) -> List[Dict]:
+        if self._cursor_id == 0:
+            return []
+        if self._cursor_id is None:
+            self._cursor_id, documents = await self.collection._call(
+                "find", (self._filter, size), self._options
+            )
+        else:
+            self._cursor_id, documents = await self.collection._call(
+                "get_more", (self._cursor_id, size)
+            )
+        return documents
+
+    def __aiter__(self) -> "RemoteCursor":
+        return self
+
+    async def __anext__(self) -> Dict:
+        if not self._buffer:
+            self._buffer = await self._fetch(self._options.get("batch_size") or 101)
+            self._buffer.reverse()
+            if not self._buffer:
+                raise StopAsyncIteration
+        return self._buffer.pop()
+
+    async def to_list(self, length: Optional[int]) -> List[Dict]:
+        results = []
+        while self._buffer and (not length or len(results) < length):
+            results.append(self._buffer.pop())
+        remaining = length - len(results) if length else None
+        if remaining != 0:
+            results.extend(await self._fetch(remaining))
+        return results
+
+    async def close(self):
+        if self._cursor_id:
+            await self.collection._call("kill_cursor", (self._cursor_id,))
+        self._cursor_id = 0
+        self._buffer = []
+
+
+class RemoteCommandCursor(MockCommandCursor):
+    """Cursor over an aggregate() run on the server."""
+
+    async def _run(self) -> List[Dict]:
+        return await self.collection._call("aggregate", (self._pipeline,))
+
+
+class RemoteCollection:
+    """Proxy for a collection on the mock database server."""
+
+    def __init__(self, connection: _Connection, db_name: str, name: str):
+        self._connection = connection
+        self._db_name = db_name
+        self.name = name
+
+    def _call(self, method: str, args: Tuple = (), kwargs: Optional[Dict[str, Any]] = None):
+        return self._connection.call(self._db_name, self.name, method, args, kwargs)
+
+    def find(self, filter_dict: Dict = None, projection: Optional[Dict[str, Any]] = None,
+             **kwargs) -> RemoteCursor:
+        return RemoteCursor(self, filter_dict or {}, projection, **kwargs)
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> RemoteCommandCursor:
+        return RemoteCommandCursor(self, pipeline)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True):
+        # Send plain tuples so the server does not need pymongo's request classes
+        operations = [_bulk_operation(request) for request in requests]
+        return await self._call("bulk_write", (operations,), {"ordered": ordered})
+
+    def __getattr__(self, method: str):
+        if method not in COLLECTION_METHODS:
+            raise AttributeError(method)
+
+        async def call(*args, **kwargs):
+            return await self._call(method, args, kwargs)
+        call.__name__ = method
+        return call
+
+
+class RemoteDatabase:
+    """Proxy for a database on the mock database server."""
+
+    def __init__(self, connection: _Connection, name: str):
+        self._connection = connection
+        self.name = name
+        self._collections: Dict[str, RemoteCollection] = {}
+
+    def __getattr__(self, name: str) -> RemoteCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str) -> RemoteCollection:
+        if name not in self._collections:
+            self._collections[name] = RemoteCollection(self._connection, self.name, name)
+        return self._collections[name]
+
+    async def command(self, command: Any, **kwargs) -> Dict[str, Any]:
+        return await self._connection.call(self.name, None, "command", (command,), kwargs)
+
+
+class RemoteMockClient:
+    """Drop-in replacement for MockMongoClient that talks to a MockDBServer."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._connection = _Connection(socket_path)
+        self._databases: Dict[str, RemoteDatabase] = {}
+
+    def __getitem__(self, name: str) -> RemoteDatabase:
+        if name not in self._databases:
+            self._databases[name] = RemoteDatabase(self._connection, name)
+        return self._databases[name]
+
+    def close(self):
+        self._connection.close()
+
+
+def main():
+    from dotenv import load_dotenv
+    from pathlib import Path
+
+    from indexes import ensure_indexes
+    from mock_db import seed_mock_data
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Serve the mock database over a Unix socket.")
+    parser.add_argument("--socket", default=os.environ.get('MOCK_DB_SOCKET') or
+                        "/tmp/organconnect-mockdb.sock")
+    parser.add_argument("--path", default=os.environ.get('MOCK_DB_PATH', ''),
+                        help="persist the data to this directory (see mock_journal)")
+    parser.add_argument("--no-seed", action="store_true", help="do not create the demo users")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    client = MockMongoClient(
+        "mock://localhost:27017",
+        path=args.path or None,
+        snapshot_every=int(os.environ.get('MOCK_DB_SNAPSHOT_EVERY', '10000')),
+        fsync=os.environ.get('MOCK_DB_FSYNC', 'false').lower() == 'true',
+        read_mode='view',
+    )
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+    if not args.no_seed:
+        seed_mock_data(db)
+
+    async def serve():
+        await ensure_indexes(db)
+        server = MockDBServer(client, args.socket)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
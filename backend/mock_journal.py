@@ -0,0 +1,233 @@
+"""
+Optional persistence for the mock database.
+Writes are appended to a journal; periodic snapshots compact it. On startup the
+latest snapshot is unpickled and the journal written after it is replayed.
+
+Layout of the data directory:
+    snapshot.pkl           latest snapshot, replaced atomically
+    journal-<seq>.log      journal segments, named after their first sequence number
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import contextlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "snapshot.pkl"
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".log"
+
+# Each journal record is framed as (payload length, crc32 of payload)
+_HEADER = struct.Struct(">II")
+
+
+def _segment_name(first_seq: int) -> str:
+    return f"{SEGMENT_PREFIX}{first_seq:020d}{SEGMENT_SUFFIX}"
+
+
+def _map_file(path: str) -> Optional[mmap.mmap]:
+    """Memory-map a file read-only, or return None if it is missing or empty."""
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+class MockJournal:
+    """Append-only journal with snapshots for a MockMongoClient.
+
+    Records are (seq, database, collection, op, args) tuples. A snapshot stores
+    every collection's documents and index definitions as of a sequence number,
+    so recovery loads the snapshot and replays only newer records.
+    """
+
+    def __init__(self, directory: str, snapshot_every: int = 10000, fsync: bool = False):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self._client = None
+        self._seq = 0
+        self._since_snapshot = 0
+        self._batch_depth = 0
+        self._segment = None
+        self._snapshot_thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    # Recovery
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                first_seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                segments.append((first_seq, os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _read_segment(self, path: str) -> Iterator[Tuple]:
+        """Yield the records of a segment, truncating a torn record at its tail."""
+        mapped = _map_file(path)
+        if mapped is None:
+            return
+        offset = 0
+        valid_end = 0
+        with mapped:
+            size = len(mapped)
+            while offset + _HEADER.size <= size:
+                length, crc = _HEADER.unpack_from(mapped, offset)
+                start = offset + _HEADER.size
+                payload = mapped[start:start + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                yield pickle.loads(payload)
+                offset = valid_end = start + length
+        if valid_end < size:
+            logger.warning(f"Truncating torn journal record at {path}:{valid_end}")
+            with open(path, "r+b") as f:
+                f.truncate(valid_end)
+
+    def load(self, client) -> int:
+        """Restore the client's databases from disk. Returns the records replayed.
+
+        The client's later writes are then journaled and snapshotted here.
+        """
+        self._client = client
+        snapshot_seq = 0
+        state = None
+        with contextlib.suppress(FileNotFoundError):
+            with open(os.path.join(self.directory, SNAPSHOT_FILE), "rb") as f:
+                state = pickle.load(f)
+        if state is not None:
+            snapshot_seq = state["seq"]
+            for db_name, collections in state["databases"].items():
+                for coll_name, contents in collections.items():
+                    collection = client[db_name][coll_name]
+                    collection._data = contents["documents"]
+                    for keys, options, entries in contents["indexes"]:
+                        collection._build_index(keys, options, entries)
+
+        self._seq = snapshot_seq
+        replayed = 0
+        for _, path in self._segments():
+            for seq, db_name, coll_name, op, args in self._read_segment(path):
+                if seq <= snapshot_seq:
+                    continue
+                client[db_name][coll_name]._apply(op, *args)
+                self._seq = seq
+                replayed += 1
+
+        self._since_snapshot = replayed
+        self._open_segment()
+        return replayed
+
+    # Writing
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        path = os.path.join(self.directory, _segment_name(self._seq + 1))
+        self._segment = open(path, "ab")
+
+    def record(self, db_name: str, coll_name: str, op: str, *args: Any):
+        """Append a write to the journal."""
+        self._seq += 1
+        payload = pickle.dumps((self._seq, db_name, coll_name, op, args), pickle.HIGHEST_PROTOCOL)
+        self._segment.write(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        if not self._batch_depth:
+            self.flush()
+        self._since_snapshot += 1
+
+        # Compact once enough writes have accumulated, unless a snapshot is
+        # still being written
+        if 0 < self.snapshot_every <= self._since_snapshot and not (
+            self._snapshot_thread is not None and self._snapshot_thread.is_alive()
+        ):
+            self.snapshot(background=True)
+
+    def flush(self):
+        self._segment.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Flush the records written inside the block once, when it exits."""
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def snapshot(self, background: bool = False):
+        """Write a snapshot of the client's databases and drop the journal it covers.
+
+        Stored documents are never mutated in place (updates replace them), so a
+        shallow copy of each collection's document dict taken here is a
+        consistent view that can be pickled off the event loop.
+
+        Waits for a snapshot still being written in the background first, as
+        both would write the same file.
+        """
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+        seq = self._seq
+        state = {
+            "seq": seq,
+            "databases": {
+                db_name: {
+                    coll_name: {
+                        "documents": dict(collection._data),
+                        "indexes": collection._index_specs(),
+                    }
+                    for coll_name, collection in database._collections.items()
+                }
+                for db_name, database in self._client._databases.items()
+            },
+        }
+        # Later writes go to a new segment, so older segments can be removed
+        # once the snapshot is durable.
+        self._open_segment()
+        self._since_snapshot = 0
+
+        if background:
+            self._snapshot_thread = threading.Thread(
+                target=self._write_snapshot, args=(state,), name="mock-db-snapshot", daemon=True
+            )
+            self._snapshot_thread.start()
+        else:
+            self._write_snapshot(state)
+
+    def _write_snapshot(self, state: Dict[str, Any]):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        segments = self._segments()
+        for index, (first_seq, segment_path) in enumerate(segments):
+            # A segment is fully covered when the next one starts at or before seq + 1
+            next_first = segments[index + 1][0] if index + 1 < len(segments) else None
+            if next_first is not None and next_first <= state["seq"] + 1:
+                os.remove(segment_path)
+        logger.info(f"Mock database snapshot written at seq {state['seq']}")
+
+    def close(self):
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
@@ -49,3 +49,14 @@ class UserResponse(BaseModel):
     age: Optional[int] = None
     mobile_verified: bool
     is_active: bool
+
+class SignupsPerDay(BaseModel):
+    date: str
+    count: int
+
+class AgeBandCount(BaseModel):
+    age_band: Optional[int] = None
+    count: int
+
+class ActiveHospitals(BaseModel):
+    active_hospitals: int
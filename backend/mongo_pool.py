@@ -0,0 +1,142 @@
+"""
+MongoDB connection pool settings, warm-up and monitoring.
+
+Only imported when the app runs against MongoDB, as it needs pymongo.
+
+Pool settings come from the environment; pymongo's defaults apply to the
+ones that are unset:
+    MONGO_MAX_POOL_SIZE                connections per server (default 100)
+    MONGO_MIN_POOL_SIZE                connections kept open, and opened at startup (default 0)
+    MONGO_MAX_IDLE_TIME_MS             close connections idle for longer
+    MONGO_WAIT_QUEUE_TIMEOUT_MS        how long an operation waits for a free connection
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  how long to wait for a reachable server (default 30000)
+    MONGO_CONNECT_TIMEOUT_MS           timeout for opening a connection (default 20000)
+    MONGO_COMPRESSORS                  wire compression, e.g. "zstd,snappy,zlib"
+"""
+from typing import Any, Dict
+import asyncio
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+import metrics
+
+# Environment variable -> pymongo client option
+POOL_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_COMPRESSORS": ("compressors", str),
+}
+
+
+def client_options() -> Dict[str, Any]:
+    """AsyncIOMotorClient keyword arguments for the pool settings in the environment."""
+    options = {}
+    for variable, (option, convert) in POOL_OPTIONS.items():
+        value = os.environ.get(variable)
+        if value:
+            options[option] = convert(value)
+    return options
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts the connections of every pool of a client.
+
+    pymongo calls listeners from its own threads (Motor runs it on a
+    thread pool), hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.created = 0
+        self.check_out_failures = 0
+        self.pools_cleared = 0
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.check_out_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.in_use += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self, max_pool_size: int) -> Dict[str, Any]:
+        return {
+            "open": self.open,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "max_pool_size": max_pool_size,
+            "utilization": round(self.in_use / max_pool_size, 3) if max_pool_size else None,
+            "created": self.created,
+            "check_out_failures": self.check_out_failures,
+        }
+
+
+pool_monitor = PoolMonitor()
+
+metrics.CallbackMetric(
+    "mongo_pool_connections", "MongoDB pool connections by state (open, in_use, waiting).",
+    lambda: [(("open",), pool_monitor.open), (("in_use",), pool_monitor.in_use),
+             (("waiting",), pool_monitor.waiting)],
+    labelnames=("state",),
+)
+
+
+async def warm_up(db, min_pool_size: int) -> float:
+    """Ping the server, then open min_pool_size connections; returns the first ping's seconds.
+
+    Raises if no server is reachable within the server selection timeout,
+    so a misconfigured deployment fails at startup rather than on the first
+    request.
+    """
+    start = time.perf_counter()
+    await db.command("ping")
+    latency = time.perf_counter() - start
+    if min_pool_size > 1:
+        # Concurrent pings each need a connection of their own
+        await asyncio.gather(*(db.command("ping") for _ in range(min_pool_size)))
+    return latency
@@ -0,0 +1,74 @@
+"""
+Keyset pagination.
+
+Pages are ordered by a sort key plus the unique id as a tie-breaker, and
+the next page starts after the last document returned, instead of skipping
+over the documents before it. Each page costs the same however deep into
+the collection it is, and documents inserted meanwhile never shift a page.
+
+The position is handed to clients as an opaque cursor token (URL-safe
+base64 of JSON), so the key can change without breaking their code.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import binascii
+import json
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor token that was not produced by encode_cursor."""
+
+
+# Keys a cursor may carry besides datetimes; anything else (such as a dict of
+# query operators) would change the meaning of the filter it goes into
+_SCALAR_KEYS = (str, int, float, bool, type(None))
+
+
+def encode_cursor(key: Any, id_value: str) -> str:
+    """Token for the position just after the document with this sort key and id."""
+    if isinstance(key, datetime):
+        payload = ["dt", key.isoformat(), id_value]
+    else:
+        payload = ["v", key, id_value]
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Any, str]:
+    """The (sort key, id) a token was made from; raises InvalidCursor.
+
+    Keys are scalars or naive datetimes, as stored; an aware datetime is
+    converted to naive UTC.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        kind, key, id_value = json.loads(data)
+        if kind == "dt":
+            key = datetime.fromisoformat(key)
+            if key.tzinfo is not None:
+                key = key.astimezone(timezone.utc).replace(tzinfo=None)
+        elif kind != "v" or not isinstance(key, _SCALAR_KEYS):
+            raise ValueError(kind)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {token!r}") from e
+    if not isinstance(id_value, str):
+        raise InvalidCursor(f"Invalid cursor: {token!r}")
+    return key, id_value
+
+
+def keyset_sort(field: str, id_field: str = "id") -> List[Tuple[str, int]]:
+    """Ascending sort on field, ties broken by id; backed by a (field, id) index."""
+    return [(field, 1), (id_field, 1)]
+
+
+def keyset_filter(field: str, after: Optional[Tuple[Any, str]],
+                  id_field: str = "id") -> Dict[str, Any]:
+    """Filter for the documents that sort after the (key, id) position."""
+    if after is None:
+        return {}
+    key, id_value = after
+    return {"$or": [
+        {field: {"$gt": key}},
+        {field: key, id_field: {"$gt": id_value}},
+    ]}
@@ -0,0 +1,263 @@
+"""
+Per-request profiling.
+
+ProfilingMiddleware profiles a request when it carries an X-Profile header
+along with the bearer token of an active admin (looked up like any other
+authenticated request, so a deactivated or demoted admin's token does not
+work), or when it is picked by sampling one in
+every PROFILE_SAMPLE_RATE requests. The profile is written to PROFILE_DIR
+as collapsed stacks (<id>.collapsed, for flamegraph.pl or speedscope) and a
+flamegraph (<id>.svg); the response's X-Profile-Id header names the files.
+
+Profiles are wall-clock stack samples of the request's asyncio task, taken
+every PROFILE_INTERVAL_MS by a background thread. While the task runs, the
+sample is its Python stack; while it is suspended, the sample is the chain
+of coroutines it is awaiting, ending in "[waiting]". So time spent waiting
+for the database or for password hashing shows up under the call that
+awaited it, next to CPU time, and other requests running concurrently are
+left out (unlike cProfile, which profiles the whole thread).
+
+The sampler needs the GIL, so while the event loop is busy with CPU work it
+samples at most once per switch interval (sys.getswitchinterval(), 5ms).
+
+The middleware is only installed with PROFILING_ENABLED=true, so when
+profiling is off it costs nothing; when on, requests that are not profiled
+pay for a counter and a header lookup.
+"""
+from collections import Counter
+from typing import Dict, List, Optional
+import asyncio
+import html
+import itertools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+
+from starlette.datastructures import MutableHeaders
+
+from auth_routes import authenticate
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+WAITING = "[waiting]"
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    # Collapsed stacks separate frames with ";"
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class _Profile:
+    """Samples collected for one task."""
+
+    def __init__(self, task: asyncio.Task, thread_id: int):
+        self.task = task
+        self.thread_id = thread_id
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def sample(self, thread_frame):
+        coro = self.task.get_coro()
+        top = getattr(coro, "cr_frame", None)
+        if top is None:
+            return
+        stack = self._running_stack(thread_frame, top)
+        if stack is None:
+            stack = self._awaiting_stack(coro)
+        self.stacks[";".join(stack)] += 1
+        self.samples += 1
+
+    @staticmethod
+    def _running_stack(frame, top) -> Optional[List[str]]:
+        """The thread's stack from the task's first frame, if the task is running."""
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            if frame is top:
+                return [_frame_name(frame) for frame in reversed(frames)]
+            frame = frame.f_back
+        return None
+
+    @staticmethod
+    def _awaiting_stack(coro) -> List[str]:
+        """The coroutines a suspended task is awaiting, outermost first."""
+        stack = []
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+            if frame is None:
+                break
+            stack.append(_frame_name(frame))
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        stack.append(WAITING)
+        return stack
+
+
+class StackSampler:
+    """One background thread sampling the stacks of every task being profiled."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._profiles: Dict[int, _Profile] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, task: asyncio.Task) -> int:
+        profile = _Profile(task, threading.get_ident())
+        with self._lock:
+            profile_id = next(self._ids)
+            self._profiles[profile_id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        return profile_id
+
+    def stop(self, profile_id: int) -> _Profile:
+        with self._lock:
+            return self._profiles.pop(profile_id)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._profiles:
+                    # Exit when idle; the next start() begins a new thread
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for profile in self._profiles.values():
+                    thread_frame = frames.get(profile.thread_id)
+                    try:
+                        profile.sample(thread_frame)
+                    except Exception:
+                        # Coroutines change under us while the loop runs; skip the sample
+                        continue
+
+
+def render_flamegraph(stacks: Dict[str, int], title: str, width: int = 1200) -> str:
+    """An SVG flamegraph of collapsed stacks, callers below their callees."""
+    root = {"count": 0, "children": {}}
+    for stack, count in stacks.items():
+        node = root
+        node["count"] += count
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"count": 0, "children": {}})
+            node["count"] += count
+    total = root["count"] or 1
+
+    def depth(node) -> int:
+        return 1 + max((depth(child) for child in node["children"].values()), default=0)
+
+    row, top = 17, 30
+    height = top + depth(root) * row + 10
+    scale = (width - 20) / total
+    rects = []
+
+    def layout(name: str, node, x: float, level: int):
+        w = node["count"] * scale
+        if w < 0.3:
+            return
+        y = height - 10 - (level + 1) * row
+        share = node["count"] / total * 100
+        hue = zlib.crc32(name.encode()) % 60
+        color = "rgb(200,200,200)" if name == WAITING else f"hsl({hue},80%,60%)"
+        label = html.escape(name if len(name) * 7 < w else name[:max(int(w / 7) - 2, 0)] + "..")
+        rects.append(
+            f'<g><title>{html.escape(name)} ({node["count"]} samples, {share:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="{color}"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + 12}">{label}</text>' if w > 21 else "")
+            + "</g>"
+        )
+        child_x = x
+        for child_name, child in sorted(node["children"].items()):
+            layout(child_name, child, child_x, level + 1)
+            child_x += child["count"] * scale
+
+    layout("all", root, 10, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="white"/>'
+        f'<text x="10" y="20" font-size="14">{html.escape(title)}</text>'
+        + "".join(rects) + "</svg>\n"
+    )
+
+
+def _write_profile(directory: str, profile_id: str, title: str, stacks: Dict[str, int]):
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, profile_id)
+    with open(base + ".collapsed", "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+    with open(base + ".svg", "w") as f:
+        f.write(render_flamegraph(stacks, title))
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware profiling requests picked by header or by sampling."""
+
+    def __init__(self, app, db, output_dir: str, sample_rate: int = 0, interval: float = 0.002):
+        self.app = app
+        self.db = db
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self._countdown = sample_rate
+        self._ids = itertools.count(1)
+        self.sampler = StackSampler(interval)
+
+    async def _requested_by_admin(self, scope) -> bool:
+        profile = authorization = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                profile = value
+            elif name == b"authorization":
+                authorization = value
+        if not profile or not authorization:
+            return False
+        user = await authenticate(self.db, authorization.decode("latin-1"))
+        return user is not None and user.is_active and user.role == "admin"
+
+    def _sampled(self) -> bool:
+        if not self.sample_rate:
+            return False
+        self._countdown -= 1
+        if self._countdown > 0:
+            return False
+        self._countdown = self.sample_rate
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self._sampled() or await self._requested_by_admin(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-") or "root"
+        profile_id = (f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{slug}"
+                      f"-{os.getpid()}-{next(self._ids)}")
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+
+        sample_id = self.sampler.start(asyncio.current_task())
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - start
+            profile = self.sampler.stop(sample_id)
+            title = f"{scope['method']} {path}: {elapsed * 1000:.1f}ms, {profile.samples} samples"
+            # Response already sent; write the files off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, _write_profile, self.output_dir, profile_id, title, dict(profile.stacks)
+            )
+            logger.info(f"Profiled {title} -> {os.path.join(self.output_dir, profile_id)}.svg")
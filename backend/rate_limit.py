@@ -0,0 +1,383 @@
+"""
+Rate limiting for the auth and OTP endpoints.
+
+Each route has a list of limits, each keyed on the client IP, the email or
+the mobile number in the request, or a combination such as "email+ip". A
+request over any of them is rejected with 429 before the route does any
+hashing or database work.
+
+The client IP is the address of the peer, unless the peer is one of
+TRUSTED_PROXIES (comma-separated addresses or networks, e.g.
+"10.0.0.0/8,127.0.0.1"): then it is the last address in the
+FORWARDED_IP_HEADER (default X-Forwarded-For) that is not a trusted proxy.
+Set TRUSTED_PROXIES to the ingress or load balancer in front of the app,
+otherwise every client shares the proxy's limits. Running uvicorn with
+--proxy-headers --forwarded-allow-ips=<proxies> has the same effect.
+
+Two algorithms are available:
+    token_bucket     allows bursts of up to `limit`, refilling at limit/period
+    sliding_window   at most `limit` requests in any `period` (approximated
+                     with two fixed-window counters, so O(1) memory per key)
+
+State is kept in this process by default: plain dict updates on the event
+loop, so no locks are needed. With RATE_LIMIT_STORE=redis every limit is
+enforced as a sliding window on counters in Redis (REDIS_URL), shared by all
+workers.
+
+Limits are set per route and key as "count/seconds", e.g.
+RATE_LIMIT_LOGIN_EMAIL_IP="10/300"; RATE_LIMIT_ENABLED=false turns limiting off.
+"""
+from typing import Any, Dict, List, Optional, Tuple, Union
+import ipaddress
+import math
+import os
+import time
+
+import metrics
+
+# route -> [(key, algorithm, limit, period in seconds)]
+DEFAULT_LIMITS: Dict[str, List[Tuple[str, str, int, float]]] = {
+    # Keyed on the email and IP together, so that nobody can lock an account
+    # out by spending its limit from elsewhere
+    "login": [("ip", "token_bucket", 30, 60), ("email+ip", "sliding_window", 10, 300)],
+    "register": [("ip", "token_bucket", 10, 60)],
+    "request-otp": [("ip", "token_bucket", 10, 60), ("mobile", "sliding_window", 3, 300)],
+    # Guards the 6-digit code against guessing
+    "verify-otp": [("mobile", "sliding_window", 10, 300)],
+}
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is over a limit; retry_after is in seconds."""
+
+    def __init__(self, limiter: str, retry_after: float):
+        super().__init__(f"Rate limit {limiter} exceeded, retry after {retry_after:.1f}s")
+        self.limiter = limiter
+        self.retry_after = retry_after
+
+
+class _KeyedState:
+    """Per-key state with a bound on the number of keys (oldest dropped first).
+
+    Dropping a key forgets its history, which only ever lets a client
+    through sooner, never blocks one that should pass.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._states: Dict[str, Any] = {}
+
+    def get(self, key: str) -> Any:
+        return self._states.get(key)
+
+    def put(self, key: str, state: Any):
+        if key not in self._states and len(self._states) >= self.max_keys:
+            del self._states[next(iter(self._states))]
+        self._states[key] = state
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class TokenBucket:
+    """Bursts of up to `limit` requests, refilled continuously at limit/period per second."""
+
+    def __init__(self, name: str, limit: int, period: float, max_keys: int = 100000,
+                 clock=time.monotonic):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.rate = limit / period
+        self._clock = clock
+        self._buckets = _KeyedState(max_keys)
+        self.allowed = 0
+        self.rejected = 0
+
+    async def hit(self, key: str):
+        """Take a token for key, or raise RateLimitExceeded."""
+        now = self._clock()
+        state = self._buckets.get(key)
+        if state is None:
+            tokens = self.limit
+        else:
+            tokens, updated = state
+            tokens = min(self.limit, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.rejected += 1
+            self._buckets.put(key, (tokens, now))
+            raise RateLimitExceeded(self.name, (1 - tokens) / self.rate)
+        self._buckets.put(key, (tokens - 1, now))
+        self.allowed += 1
+
+    async def refund(self, key: str, counted_in: Any = None):
+        """Give back the token a hit took, for a request rejected by another limit."""
+        state = self._buckets.get(key)
+        if state is not None:
+            tokens, updated = state
+            self._buckets.put(key, (min(self.limit, tokens + 1), updated))
+        self.allowed -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"algorithm": "token_bucket", "limit": self.limit, "period": self.period,
+                "allowed": self.allowed, "rejected": self.rejected, "keys": len(self._buckets)}
+
+
+def _window_retry_after(limit: int, period: float, previous: int, current: int,
+                        elapsed: float) -> float:
+    """Seconds until one more request fits: previous * (1 - f) + current + 1 <= limit,
+    where f is the fraction of the current window that has elapsed."""
+    if current + 1 > limit:
+        # Not before the next window, where this window's count is the previous one
+        return period - elapsed + period * max(0.0, 1 - (limit - 1) / current)
+    fraction = 1 - (limit - 1 - current) / previous
+    return max(fraction * period - elapsed, 0.001)
+
+
+class SlidingWindow:
+    """At most `limit` requests per `period`, weighting the previous window's count
+    by how much of it still overlaps the sliding window."""
+
+    def __init__(self, name: str, limit: int, period: float, max_keys: int = 100000,
+                 clock=time.monotonic):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self._clock = clock
+        self._windows = _KeyedState(max_keys)
+        self.allowed = 0
+        self.rejected = 0
+
+    async def hit(self, key: str) -> int:
+        """Count a request for key and return its window, or raise RateLimitExceeded."""
+        now = self._clock()
+        window, elapsed = divmod(now, self.period)
+        state = self._windows.get(key)
+        previous = current = 0
+        if state is not None:
+            state_window, state_previous, state_current = state
+            if state_window == window:
+                previous, current = state_previous, state_current
+            elif state_window == window - 1:
+                previous = state_current
+        weighted = previous * (1 - elapsed / self.period) + current
+        if weighted + 1 > self.limit:
+            self.rejected += 1
+            self._windows.put(key, (window, previous, current))
+            raise RateLimitExceeded(
+                self.name, _window_retry_after(self.limit, self.period, previous, current, elapsed)
+            )
+        self._windows.put(key, (window, previous, current + 1))
+        self.allowed += 1
+        return window
+
+    async def refund(self, key: str, counted_in: int):
+        """Uncount a request that hit counted in window counted_in."""
+        state = self._windows.get(key)
+        if state is not None:
+            window, previous, current = state
+            if window == counted_in and current > 0:
+                self._windows.put(key, (window, previous, current - 1))
+            elif window == counted_in + 1 and previous > 0:
+                self._windows.put(key, (window, previous - 1, current))
+        self.allowed -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"algorithm": "sliding_window", "limit": self.limit, "period": self.period,
+                "allowed": self.allowed, "rejected": self.rejected, "keys": len(self._windows)}
+
+
+class SharedSlidingWindow:
+    """SlidingWindow on counters in a shared store with atomic incr and decr (see expiring_store).
+
+    A request is counted before it is checked, so that concurrent requests
+    in other workers see it, and uncounted again if it is rejected: like
+    SlidingWindow, only allowed requests use up the limit.
+    """
+
+    def __init__(self, name: str, limit: int, period: float, store, clock=time.time):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self._store = store
+        # Wall-clock time, so that every worker agrees on the window boundaries
+        self._clock = clock
+        self.allowed = 0
+        self.rejected = 0
+
+    async def hit(self, key: str) -> int:
+        """Count a request for key and return its window, or raise RateLimitExceeded."""
+        now = self._clock()
+        window, elapsed = divmod(now, self.period)
+        prefix = f"ratelimit:{self.name}:{key}:"
+        # Each counter must outlive the window after it, where it is the previous one
+        current = await self._store.incr(f"{prefix}{int(window)}", 2 * self.period)
+        previous = int(await self._store.get(f"{prefix}{int(window) - 1}") or 0)
+        # current already includes this request
+        if previous * (1 - elapsed / self.period) + current > self.limit:
+            await self._store.decr(f"{prefix}{int(window)}")
+            self.rejected += 1
+            raise RateLimitExceeded(
+                self.name,
+                _window_retry_after(self.limit, self.period, previous, current - 1, elapsed),
+            )
+        self.allowed += 1
+        return int(window)
+
+    async def refund(self, key: str, counted_in: int):
+        """Uncount a request that hit counted in window counted_in."""
+        await self._store.decr(f"ratelimit:{self.name}:{key}:{counted_in}")
+        self.allowed -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"algorithm": "shared_sliding_window", "limit": self.limit, "period": self.period,
+                "allowed": self.allowed, "rejected": self.rejected}
+
+
+class RateLimits:
+    """The limiters of every route, built from DEFAULT_LIMITS and the environment."""
+
+    def __init__(self, limits: Dict[str, List[Tuple[str, str, int, float]]],
+                 enabled: bool = True, store=None, max_keys: int = 100000):
+        self.enabled = enabled
+        self._limiters: Dict[str, List[Tuple[str, Any]]] = {}
+        for route, route_limits in limits.items():
+            limiters = []
+            for key, algorithm, limit, period in route_limits:
+                name = f"{route}:{key}"
+                if store is not None:
+                    limiter = SharedSlidingWindow(name, limit, period, store)
+                elif algorithm == "token_bucket":
+                    limiter = TokenBucket(name, limit, period, max_keys)
+                elif algorithm == "sliding_window":
+                    limiter = SlidingWindow(name, limit, period, max_keys)
+                else:
+                    raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+                limiters.append((key, limiter))
+            self._limiters[route] = limiters
+
+    @classmethod
+    def from_env(cls) -> "RateLimits":
+        limits = {}
+        for route, route_limits in DEFAULT_LIMITS.items():
+            limits[route] = []
+            for key, algorithm, limit, period in route_limits:
+                variable = f"RATE_LIMIT_{route.replace('-', '_').upper()}_{key.replace('+', '_').upper()}"
+                if os.environ.get(variable):
+                    count, _, seconds = os.environ[variable].partition("/")
+                    limit, period = int(count), float(seconds)
+                limits[route].append((key, algorithm, limit, period))
+
+        store = None
+        if os.environ.get("RATE_LIMIT_STORE", "local").lower() == "redis":
+            from expiring_store import RedisExpiringStore
+
+            store = RedisExpiringStore.from_env()
+        return cls(
+            limits,
+            enabled=os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true",
+            store=store,
+            max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000")),
+        )
+
+    async def check(self, route: str, **keys: Optional[str]):
+        """Count a request to route against each of its limits.
+
+        keys gives the value of each key (ip, email, mobile); limits on a key
+        without a value are skipped. Raises RateLimitExceeded, after giving
+        back what the limits checked before the one exceeded took, so that a
+        rejected request counts against none of them.
+        """
+        if not self.enabled:
+            return
+        counted = []
+        try:
+            for key, limiter in self._limiters.get(route, ()):
+                values = [keys.get(part) for part in key.split("+")]
+                if all(values):
+                    value = " ".join(values)
+                    counted.append((limiter, value, await limiter.hit(value)))
+        except RateLimitExceeded:
+            for limiter, value, counted_in in reversed(counted):
+                await limiter.refund(value, counted_in)
+            raise
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            limiter.name: limiter.stats()
+            for limiters in self._limiters.values() for _, limiter in limiters
+        }
+
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+_trusted_proxies: Optional[List[Network]] = None
+
+
+def get_trusted_proxies() -> List[Network]:
+    """The networks of TRUSTED_PROXIES, parsed on first use."""
+    global _trusted_proxies
+    if _trusted_proxies is None:
+        _trusted_proxies = [
+            ipaddress.ip_network(entry.strip(), strict=False)
+            for entry in os.environ.get("TRUSTED_PROXIES", "").split(",") if entry.strip()
+        ]
+    return _trusted_proxies
+
+
+def _is_trusted_proxy(address: str, proxies: List[Network]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def client_ip(peer: Optional[str], headers) -> Optional[str]:
+    """The client's address, given the peer's and the request headers.
+
+    Behind trusted proxies, each appends the address it received the request
+    from to the forwarded header, so the last untrusted address is the client.
+    Anything before it was sent by the client and cannot be believed.
+    """
+    proxies = get_trusted_proxies()
+    if not peer or not proxies or not _is_trusted_proxy(peer, proxies):
+        return peer
+    forwarded = headers.get(os.environ.get("FORWARDED_IP_HEADER", "X-Forwarded-For"))
+    if not forwarded:
+        return peer
+    for address in reversed([part.strip() for part in forwarded.split(",")]):
+        if address and not _is_trusted_proxy(address, proxies):
+            return address
+    return peer
+
+
+def retry_after_header(retry_after: float) -> str:
+    """Retry-After takes whole seconds; round up so clients never retry too early."""
+    return str(max(1, math.ceil(retry_after)))
+
+
+_rate_limits: Optional[RateLimits] = None
+
+
+def get_rate_limits() -> RateLimits:
+    """The process-wide rate limits, configured from the environment on first use."""
+    global _rate_limits
+    if _rate_limits is None:
+        _rate_limits = RateLimits.from_env()
+    return _rate_limits
+
+
+def _limiter_samples() -> Optional[List[Tuple[Tuple[str, str], int]]]:
+    if _rate_limits is None:
+        return None
+    samples = []
+    for name, stats in _rate_limits.stats().items():
+        samples.append(((name, "allowed"), stats["allowed"]))
+        samples.append(((name, "rejected"), stats["rejected"]))
+    return samples
+
+
+metrics.CallbackMetric(
+    "rate_limit_checks_total", "Rate limit checks by limiter (route:key) and result.",
+    _limiter_samples, kind="counter", labelnames=("limiter", "result"),
+)
@@ -0,0 +1,120 @@
+"""
+Fast JSON responses.
+
+ORJSONResponse is the app's default response class: FastAPI still validates
+and converts the return value of each route as before, and orjson only
+replaces the final json.dumps. By then FastAPI has already encoded the
+value with pydantic or jsonable_encoder, so route responses are
+byte-for-byte the same as with JSONResponse (compact separators, UTF-8).
+
+Content handed to an ORJSONResponse directly is encoded by orjson itself,
+with datetimes and UUIDs written as pydantic writes them. That matches the
+validated models, but not jsonable_encoder on plain dicts: it writes aware
+UTC datetimes as "+00:00" where pydantic and orjson here write "Z".
+
+Routes returning many documents from the database can skip validation
+altogether: build the content with trusted_content() (or models with
+trusted_models()), which runs no validators, and return an ORJSONResponse
+directly, which FastAPI sends as is instead of validating it against the
+response_model. Only do this for data the API itself wrote through
+validated models.
+"""
+from typing import Any, Dict, Iterable, List, Type, TypeVar
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# OPT_UTC_Z writes UTC offsets as "Z", like pydantic (jsonable_encoder writes "+00:00")
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+# Model class -> whether its __dict__ serializes the same as model_dump(by_alias=True)
+_plain_models: Dict[type, bool] = {}
+
+
+def _is_plain(model_class: Type[BaseModel]) -> bool:
+    plain = _plain_models.get(model_class)
+    if plain is None:
+        decorators = model_class.__pydantic_decorators__
+        plain = _plain_models[model_class] = not (
+            decorators.field_serializers or decorators.model_serializers
+            or model_class.model_computed_fields
+            or any(field.alias or field.serialization_alias or field.exclude
+                   for field in model_class.model_fields.values())
+        )
+    return plain
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        if _is_plain(type(value)):
+            # orjson calls back here for nested models
+            return value.__dict__
+        # Python mode leaves datetimes and UUIDs to orjson, which writes them like pydantic
+        return value.model_dump(by_alias=True)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; also accepts pydantic models in the content."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def trusted_models(model_class: Type[Model], documents: Iterable[Dict[str, Any]]) -> List[Model]:
+    """model_class instances built from stored documents without validation.
+
+    Fields missing from a document get their defaults; other keys (such as
+    Mongo's _id) are dropped.
+    """
+    # model_fields is a property in recent pydantic, so read it once
+    fields = tuple(model_class.model_fields)
+    new = model_class.__new__
+    set_attribute = object.__setattr__
+    models = []
+    for document in documents:
+        values = {key: document[key] for key in fields if key in document}
+        if len(values) < len(fields):
+            models.append(model_class.model_construct(**values))
+            continue
+        # What model_construct does once every field is present, without its
+        # per-field Python loop, which costs more than validating would
+        model = new(model_class)
+        set_attribute(model, "__dict__", values)
+        set_attribute(model, "__pydantic_fields_set__", set(fields))
+        set_attribute(model, "__pydantic_extra__", None)
+        set_attribute(model, "__pydantic_private__", None)
+        models.append(model)
+    return models
+
+
+def trusted_model(model_class: Type[Model], document: Dict[str, Any]) -> Model:
+    return trusted_models(model_class, (document,))[0]
+
+
+def trusted_content(model_class: Type[BaseModel],
+                    documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Stored documents as the content of a response of model_class items.
+
+    For plain models (see _is_plain) a model's JSON is just its fields, so
+    the documents are only trimmed to those, skipping the model objects
+    altogether; otherwise they become trusted_models. Either way the
+    response renders the same bytes as validated models would.
+    """
+    if not _is_plain(model_class):
+        return trusted_models(model_class, documents)
+    fields = tuple(model_class.model_fields)
+    content = []
+    for document in documents:
+        values = {key: document[key] for key in fields if key in document}
+        if len(values) < len(fields):
+            values = model_class.model_construct(**values).__dict__
+        content.append(values)
+    return content
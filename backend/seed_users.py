@@ -1,62 +1,217 @@
-"""Seed demo users for testing."""
+"""Seed demo users, or bulk load synthetic users for load testing.
+
+Usage:
+    python seed_users.py                          # the three demo accounts
+    python seed_users.py --synthetic 1000000      # plus a million synthetic users
+
+Synthetic users are donors and hospitals named <role><n>@loadtest.organconnect.com,
+all with the same --password. Each gets its own bcrypt hash, computed on a
+process pool while the previous batch is being inserted. Batches are written
+with unordered insert_many; users that already exist are counted and skipped,
+so a load can be re-run or extended with --start.
+
+--target picks the database: "mongo" (MONGO_URL), "mock" (a persistent mock
+database in --mock-path, which the server loads with MOCK_DB_PATH) or
+"socket" (a running mock_db_server.py at --socket).
+"""
+import argparse
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import os
+import random
 import sys
+import time
+import uuid
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent))
 
 from models import User
-from auth_utils import get_password_hash
+from auth_utils import BCRYPT_MIN_ROUNDS, get_password_hash, pwd_context
+from indexes import ensure_indexes
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-async def seed_demo_users():
-    """Seed demo users into database."""
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ['DB_NAME']]
-    
-    demo_users = [
-        {
-            "email": "donor@organconnect.com",
-            "password": "donor123",
-            "role": "donor",
-            "name": "Demo Donor",
-            "mobile": "9876543210",
-            "age": 30
-        },
-        {
-            "email": "hospital@organconnect.com",
-            "password": "hospital123",
-            "role": "hospital",
-            "name": "Demo Hospital",
-            "mobile": "9876543211",
-            "age": None
-        },
-        {
-            "email": "admin@organconnect.com",
-            "password": "admin123",
-            "role": "admin",
-            "name": "Admin User",
-            "mobile": "9876543212",
-            "age": None
+DEMO_USERS = [
+    {
+        "email": "donor@organconnect.com",
+        "password": "donor123",
+        "role": "donor",
+        "name": "Demo Donor",
+        "mobile": "9876543210",
+        "age": 30
+    },
+    {
+        "email": "hospital@organconnect.com",
+        "password": "hospital123",
+        "role": "hospital",
+        "name": "Demo Hospital",
+        "mobile": "9876543211",
+        "age": None
+    },
+    {
+        "email": "admin@organconnect.com",
+        "password": "admin123",
+        "role": "admin",
+        "name": "Admin User",
+        "mobile": "9876543212",
+        "age": None
+    }
+]
+
+FIRST_NAMES = ["Aarav", "Priya", "Rohan", "Ananya", "Vikram", "Meera", "Arjun", "Kavya", "Ishaan", "Diya"]
+LAST_NAMES = ["Sharma", "Patel", "Reddy", "Iyer", "Gupta", "Singh", "Nair", "Das", "Mehta", "Rao"]
+HOSPITAL_WORDS = ["City", "General", "Memorial", "Apollo", "Lifeline", "Sunrise", "Unity", "Hope"]
+
+
+def bulk_write_errors() -> tuple:
+    """BulkWriteError classes of the driver in use (pymongo's only if loaded)."""
+    from mock_db import BulkWriteError as MockBulkWriteError
+
+    pymongo_errors = sys.modules.get("pymongo.errors")
+    if pymongo_errors is None:
+        return (MockBulkWriteError,)
+    return (pymongo_errors.BulkWriteError, MockBulkWriteError)
+
+
+async def insert_users(db, documents: List[Dict[str, Any]]) -> Tuple[int, List[int]]:
+    """Insert in one unordered batch; returns (inserted count, indexes of existing users)."""
+    try:
+        await db.users.insert_many(documents, ordered=False)
+        return len(documents), []
+    except bulk_write_errors() as e:
+        duplicates = []
+        for error in e.details["writeErrors"]:
+            if error["code"] != 11000:
+                raise
+            duplicates.append(error["index"])
+        return e.details["nInserted"], duplicates
+
+
+# Synthetic users
+
+
+def synthetic_users(count: int, start: int, donor_ratio: float, days: int,
+                    seed: int) -> Iterator[Dict[str, Any]]:
+    """Yield user documents (without a password hash) for users start .. start+count-1.
+
+    The documents have exactly the fields of models.User.
+    """
+    rng = random.Random(seed + start)
+    now = datetime.utcnow()
+    for n in range(start, start + count):
+        if rng.random() < donor_ratio:
+            role = "donor"
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            age = rng.randint(18, 75)
+        else:
+            role = "hospital"
+            name = f"{rng.choice(HOSPITAL_WORDS)} Hospital {n}"
+            age = None
+        created_at = now - timedelta(seconds=rng.randint(0, days * 86400))
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "email": f"{role}{n}@loadtest.organconnect.com",
+            "hashed_password": None,
+            "role": role,
+            "name": name,
+            "mobile": f"+91{n:010d}",
+            "age": age,
+            "mobile_verified": True,
+            "is_active": rng.random() < 0.97,
+            "created_at": created_at,
+            "updated_at": created_at,
         }
-    ]
-    
-    for user_data in demo_users:
-        # Check if user already exists
-        existing = await db.users.find_one({"email": user_data["email"]})
-        if existing:
-            print(f"User {user_data['email']} already exists, skipping...")
-            continue
-        
-        # Create user
-        user = User(
+
+
+def hash_passwords(password: str, count: int, rounds: int) -> List[str]:
+    """Hash password count times, each with its own salt (runs in a worker process)."""
+    handler = pwd_context.handler("bcrypt").using(rounds=rounds)
+    return [handler.hash(password) for _ in range(count)]
+
+
+def batches(iterator: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for item in iterator:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def hash_batch(pool: ProcessPoolExecutor, workers: int, batch: List[Dict[str, Any]],
+                     password: str, rounds: int) -> List[Dict[str, Any]]:
+    """Fill in the batch's password hashes, split across the pool's workers."""
+    loop = asyncio.get_running_loop()
+    sizes = [len(batch) // workers + (1 if i < len(batch) % workers else 0) for i in range(workers)]
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(pool, hash_passwords, password, size, rounds)
+        for size in sizes if size
+    ))
+    hashes = [hashed for chunk in chunks for hashed in chunk]
+    for document, hashed in zip(batch, hashes):
+        document["hashed_password"] = hashed
+    return batch
+
+
+async def bulk_load(db, args) -> None:
+    """Hash and insert args.synthetic users, hashing batch n+1 while batch n is inserted."""
+    workers = args.workers or os.cpu_count() or 1
+    users = synthetic_users(args.synthetic, args.start, args.donor_ratio, args.days, args.seed)
+    # Check the generator's documents against the model once, not per user
+    first = next(synthetic_users(1, args.start, args.donor_ratio, args.days, args.seed))
+    User(**dict(first, hashed_password="x"))
+
+    inserted = existing = 0
+    started = time.perf_counter()
+    last_report = started
+    pending_insert: Optional[asyncio.Task] = None
+
+    async def finish_insert():
+        nonlocal inserted, existing, last_report
+        count, duplicates = await pending_insert
+        inserted += count
+        existing += len(duplicates)
+        now = time.perf_counter()
+        done = inserted + existing
+        if now - last_report >= args.progress_every or done == args.synthetic:
+            last_report = now
+            rate = done / (now - started)
+            print(f"{done:,}/{args.synthetic:,} users ({inserted:,} inserted, "
+                  f"{existing:,} already existed), {rate:,.0f} users/s")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in batches(users, args.batch_size):
+            batch = await hash_batch(pool, workers, batch, args.password, args.rounds)
+            if pending_insert is not None:
+                await finish_insert()
+            pending_insert = asyncio.create_task(insert_users(db, batch))
+        if pending_insert is not None:
+            await finish_insert()
+
+    elapsed = time.perf_counter() - started
+    print(f"\nLoaded {inserted:,} synthetic users in {elapsed:.1f}s "
+          f"({(inserted + existing) / elapsed:,.0f} users/s, {workers} hashing workers, "
+          f"bcrypt cost {args.rounds})")
+
+
+# Demo users
+
+
+async def seed_demo_users(db):
+    """Seed demo users into database."""
+    # The unique email index makes existing users fail individually, so all
+    # users go to the server in one unordered batch instead of a lookup and an
+    # insert per user.
+    users = [
+        User(
             email=user_data["email"],
             hashed_password=get_password_hash(user_data["password"]),
             role=user_data["role"],
@@ -65,12 +220,81 @@ async def seed_demo_users():
             age=user_data["age"],
             mobile_verified=True
         )
-        
-        await db.users.insert_one(user.dict())
-        print(f"Created demo user: {user_data['email']} (role: {user_data['role']})")
-    
-    client.close()
+        for user_data in DEMO_USERS
+    ]
+
+    _, duplicates = await insert_users(db, [user.model_dump() for user in users])
+
+    for index, user in enumerate(users):
+        if index in duplicates:
+            print(f"User {user.email} already exists, skipping...")
+        else:
+            print(f"Created demo user: {user.email} (role: {user.role})")
+
     print("\nDemo users seeded successfully!")
 
+
+def connect(args):
+    """Open the client for --target; returns (client, db)."""
+    db_name = os.environ.get('DB_NAME', 'test_database')
+    if args.target == "mongo":
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    elif args.target == "socket":
+        from mock_db_server import RemoteMockClient
+
+        client = RemoteMockClient(args.socket or os.environ.get('MOCK_DB_SOCKET'))
+    else:
+        from mock_db import MockMongoClient
+
+        # Snapshot once at the end rather than every few thousand inserts
+        client = MockMongoClient(
+            "mock://localhost:27017", path=args.mock_path or os.environ.get('MOCK_DB_PATH'),
+            snapshot_every=0,
+        )
+    return client, client[db_name]
+
+
+async def main(args):
+    client, db = connect(args)
+    try:
+        await ensure_indexes(db)
+        if not args.no_demo:
+            await seed_demo_users(db)
+        if args.synthetic:
+            print()
+            await bulk_load(db, args)
+        if args.target == "mock":
+            client.snapshot()
+    finally:
+        client.close()
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["mongo", "mock", "socket"], default="mongo",
+                        help="database to load (default: mongo)")
+    parser.add_argument("--mock-path", help="mock database directory (default: MOCK_DB_PATH)")
+    parser.add_argument("--socket", help="mock_db_server.py socket (default: MOCK_DB_SOCKET)")
+    parser.add_argument("--no-demo", action="store_true", help="skip the demo accounts")
+    parser.add_argument("--synthetic", type=int, default=0, help="number of synthetic users")
+    parser.add_argument("--start", type=int, default=0, help="number of the first synthetic user")
+    parser.add_argument("--password", default="loadtest123", help="password of every synthetic user")
+    parser.add_argument("--rounds", type=int, default=BCRYPT_MIN_ROUNDS,
+                        help=f"bcrypt cost of synthetic users (default: {BCRYPT_MIN_ROUNDS})")
+    parser.add_argument("--workers", type=int, default=0, help="hashing processes (default: CPUs)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--donor-ratio", type=float, default=0.9)
+    parser.add_argument("--days", type=int, default=365, help="spread signups over this many days")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for the generator")
+    parser.add_argument("--progress-every", type=float, default=2.0, help="seconds between reports")
+    args = parser.parse_args(argv)
+    if args.target == "mock" and not (args.mock_path or os.environ.get('MOCK_DB_PATH')):
+        parser.error("--target mock needs --mock-path or MOCK_DB_PATH, or the users are lost on exit")
+    if args.target == "socket" and not (args.socket or os.environ.get('MOCK_DB_SOCKET')):
+        parser.error("--target socket needs --socket or MOCK_DB_SOCKET")
+    return args
+
 if __name__ == "__main__":
-    asyncio.run(seed_demo_users())
+    asyncio.run(main(parse_args()))
@@ -1,52 +1,125 @@
-from fastapi import FastAPI, APIRouter, Request
+import time
+SERVER_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import contextlib
+import hmac
 import os
 import logging
 from pathlib import Path
+import tempfile
 from pydantic import BaseModel, Field
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional
 import uuid
 from datetime import datetime
 from auth_routes import router as auth_router
+from admin_routes import require_admin, router as admin_router
+from indexes import ensure_indexes
+from hashing import get_password_hasher
+from auth_utils import configure_bcrypt_rounds
+from instrumented_db import InstrumentedDatabase
+from server_timing import ServerTimingMiddleware, TimedRoute
+import metrics
+from responses import ORJSONResponse, dumps, trusted_content
+from write_coalescer import CoalescerFull, WriteCoalescer
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter, keyset_sort
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Seconds spent in each startup step, reported once the app has started
+startup_timings: Dict[str, float] = {}
+
+@contextlib.contextmanager
+def timed_startup_step(step: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[step] = time.perf_counter() - start
+
 # MongoDB connection with fallback to mock database
 USE_MOCK_DB = os.environ.get('USE_MOCK_DB', 'true').lower() == 'true'
+# Directory for persisting the mock database across restarts (in memory if unset)
+MOCK_DB_PATH = os.environ.get('MOCK_DB_PATH', '')
+MOCK_DB_SNAPSHOT_EVERY = int(os.environ.get('MOCK_DB_SNAPSHOT_EVERY', '10000'))
+MOCK_DB_FSYNC = os.environ.get('MOCK_DB_FSYNC', 'false').lower() == 'true'
+# 'view' returns copy-on-write views of stored documents instead of copies
+MOCK_DB_READ_MODE = os.environ.get('MOCK_DB_READ_MODE', 'view')
+# Unix socket of a shared mock_db_server.py, for running several workers
+MOCK_DB_SOCKET = os.environ.get('MOCK_DB_SOCKET', '')
 
-if USE_MOCK_DB:
-    from mock_db import MockMongoClient, seed_mock_data
-    
-    logger = logging.getLogger(__name__)
-    logger.info("🔧 Using MOCK DATABASE (MongoDB not required)")
-    
-    client = MockMongoClient("mock://localhost:27017")
-    db = client[os.environ.get('DB_NAME', 'test_database')]
-    
-    # Seed mock data
-    seed_mock_data(db)
-else:
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
-    logging.getLogger(__name__).info("🗄️  Connected to MongoDB")
+# Connection pool monitor, when using MongoDB (see mongo_pool)
+pool_monitor = None
+mongo_options: Dict = {}
+
+# Each driver is imported only on the path that uses it
+with timed_startup_step("open database"):
+    if USE_MOCK_DB and MOCK_DB_SOCKET:
+        from mock_db_server import RemoteMockClient
+
+        # The server process owns (and has seeded) the data
+        client = RemoteMockClient(MOCK_DB_SOCKET)
+        db = client[os.environ.get('DB_NAME', 'test_database')]
+        logging.getLogger(__name__).info(f"🔧 Using SHARED MOCK DATABASE at {MOCK_DB_SOCKET}")
+    elif USE_MOCK_DB:
+        from mock_db import MockMongoClient
+        
+        logger = logging.getLogger(__name__)
+        logger.info("🔧 Using MOCK DATABASE (MongoDB not required)")
+        
+        client = MockMongoClient(
+            "mock://localhost:27017",
+            path=MOCK_DB_PATH or None,
+            snapshot_every=MOCK_DB_SNAPSHOT_EVERY,
+            fsync=MOCK_DB_FSYNC,
+            read_mode=MOCK_DB_READ_MODE,
+        )
+        db = client[os.environ.get('DB_NAME', 'test_database')]
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        import mongo_pool
+        
+        mongo_url = os.environ['MONGO_URL']
+        mongo_options = mongo_pool.client_options()
+        pool_monitor = mongo_pool.pool_monitor
+        # Connections are opened by the warm-up in startup(), not here
+        client = AsyncIOMotorClient(mongo_url, event_listeners=[pool_monitor], **mongo_options)
+        db = client[os.environ.get('DB_NAME', 'test_database')]
+        logging.getLogger(__name__).info("🗄️  Connected to MongoDB")
+
+# Time every database operation (see server_timing)
+db = InstrumentedDatabase(db)
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TimedRoute)
 
-# Middleware to inject db into request state
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
-    request.state.db = db
-    response = await call_next(request)
-    return response
+class DatabaseMiddleware:
+    """Pure ASGI middleware that injects db into request state.
+
+    Unlike @app.middleware("http"), this adds no extra task or response
+    wrapping per request.
+    """
+    
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            # request.state is backed by scope["state"]
+            scope.setdefault("state", {})["db"] = self.db
+        await self.app(scope, receive, send)
+
+app.add_middleware(DatabaseMiddleware, db=db)
 
 
 # Define Models
@@ -58,6 +131,10 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+# Opt-in group commit for status check inserts (see write_coalescer)
+STATUS_WRITE_COALESCING = os.environ.get('STATUS_WRITE_COALESCING', 'false').lower() == 'true'
+status_writer = WriteCoalescer.from_env(db.status_checks) if STATUS_WRITE_COALESCING else None
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -67,28 +144,155 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.model_dump()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.model_dump())
+    if status_writer is None:
+        _ = await db.status_checks.insert_one(status_obj.model_dump())
+        return status_obj
+    try:
+        await status_writer.insert(status_obj.model_dump())
+    except CoalescerFull as e:
+        logger.warning(f"Rejecting status check: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"},
+        )
     return status_obj
 
+# Largest page of status checks returned as a JSON array
+STATUS_PAGE_MAX = 1000
+# Documents fetched per cursor batch, and written per chunk, when streaming
+STATUS_STREAM_BATCH = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+async def stream_status_checks(query: Dict, limit: Optional[int]) -> AsyncIterator[bytes]:
+    """Status checks as NDJSON, written batch by batch as they come off the cursor."""
+    cursor = db.status_checks.find(query).sort(keyset_sort("timestamp")).batch_size(STATUS_STREAM_BATCH)
+    if limit:
+        cursor = cursor.limit(limit)
+    lines = []
+    try:
+        async for status_check in cursor:
+            lines.append(dumps(trusted_content(StatusCheck, (status_check,))[0]))
+            if len(lines) >= STATUS_STREAM_BATCH:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+    finally:
+        await cursor.close()
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    accept: Optional[str] = Header(None),
+):
+    """Status checks, oldest first.
 
-# Include auth router
+    Returns a page of up to limit (default and at most 1000); if there are
+    more, the X-Next-Cursor header holds a cursor to pass back for the next
+    page. With format=ndjson (or Accept: application/x-ndjson) every status
+    check after the cursor is streamed instead, one JSON object per line,
+    up to limit if given.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    query = keyset_filter("timestamp", after)
+    
+    if format == "ndjson" or (format is None and accept and NDJSON_MEDIA_TYPE in accept):
+        return StreamingResponse(stream_status_checks(query, limit), media_type=NDJSON_MEDIA_TYPE)
+    
+    if limit is None or limit > STATUS_PAGE_MAX:
+        limit = STATUS_PAGE_MAX
+    # One extra document tells whether there is a next page
+    status_checks = await db.status_checks.find(query).sort(keyset_sort("timestamp")).to_list(limit + 1)
+    headers = {}
+    if len(status_checks) > limit:
+        status_checks = status_checks[:limit]
+        last = status_checks[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last["timestamp"], last["id"])
+    # Documents written by create_status_check, so skip validating them again
+    return ORJSONResponse(trusted_content(StatusCheck, status_checks), headers=headers)
+
+# How long /health waits for the database to answer a ping
+HEALTH_PING_TIMEOUT = float(os.environ.get('HEALTH_PING_TIMEOUT_MS', '1000')) / 1000
+
+@api_router.get("/health")
+async def health():
+    """Database reachability, ping latency and connection pool use.
+
+    Responds 503 when the database does not answer a ping within
+    HEALTH_PING_TIMEOUT_MS, so load balancers can take the instance out.
+    """
+    database = {"backend": "mock" if USE_MOCK_DB else "mongodb"}
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command("ping"), HEALTH_PING_TIMEOUT)
+    except Exception as e:
+        # Only the error type: the message can name internal hosts
+        database["error"] = type(e).__name__
+        logger.warning(f"Health check failed: {type(e).__name__}: {e}")
+        return ORJSONResponse({"status": "unavailable", "database": database}, status_code=503)
+    database["ping_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    if pool_monitor is not None:
+        database["pool"] = pool_monitor.stats(mongo_options.get("maxPoolSize", 100))
+    return {"status": "ok", "database": database}
+
+# Bearer token for Prometheus scrapers; without it /metrics needs an admin's token
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+@api_router.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request, authorization: Optional[str] = Header(None)):
+    """Metrics in the Prometheus text format, for METRICS_TOKEN or an admin.
+
+    They name every route and expose auth failures and limiter state, so
+    they are not public.
+    """
+    if not (METRICS_TOKEN and authorization
+            and hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode())):
+        await require_admin(authorization, request)
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+# Include auth and admin routers
 api_router.include_router(auth_router)
+api_router.include_router(admin_router)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Server-Timing headers with db, hash, app and serialization times
+if os.environ.get('SERVER_TIMING', 'true').lower() == 'true':
+    app.add_middleware(ServerTimingMiddleware)
+
+# Request profiling (see profiling.py); not installed at all unless enabled
+if os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true':
+    from profiling import ProfilingMiddleware
+    
+    app.add_middleware(
+        ProfilingMiddleware,
+        db=db,
+        output_dir=os.environ.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'organconnect-profiles'),
+        sample_rate=int(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+        interval=float(os.environ.get('PROFILE_INTERVAL_MS', '2')) / 1000,
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Profile-Id"],
 )
 
+# Request counts and latency histograms per route, outermost so that they
+# include the time spent in the other middleware
+if os.environ.get('METRICS_ENABLED', 'true').lower() == 'true':
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -96,6 +300,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+SERVER_IMPORT_SECONDS = time.perf_counter() - SERVER_IMPORT_STARTED
+
+@app.on_event("startup")
+async def startup():
+    if pool_monitor is not None:
+        import mongo_pool
+        
+        # Connect before serving, so the first requests after a deploy do not
+        # pay for connection setup (or find out the database is unreachable)
+        with timed_startup_step("connect to MongoDB"):
+            ping = await mongo_pool.warm_up(db, mongo_options.get("minPoolSize", 0))
+        logger.info(f"MongoDB ping {ping * 1000:.1f}ms, {pool_monitor.open} connections open")
+    
+    # Choose the bcrypt cost before anything is hashed (BCRYPT_ROUNDS, or
+    # calibrated to BCRYPT_TARGET_MS and shared with the other workers)
+    with timed_startup_step("bcrypt calibration"):
+        bcrypt_cost = await configure_bcrypt_rounds(db)
+    logger.info(f"Hashing passwords with bcrypt cost {bcrypt_cost}")
+    
+    if USE_MOCK_DB and not MOCK_DB_SOCKET:
+        from mock_db import seed_mock_data
+        
+        with timed_startup_step("seed mock database"):
+            seed_mock_data(db)
+    
+    with timed_startup_step("ensure indexes"):
+        await ensure_indexes(db)
+    
+    steps = ", ".join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in startup_timings.items())
+    logger.info(f"Startup: import server.py {SERVER_IMPORT_SECONDS * 1000:.0f}ms ({steps})")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if status_writer is not None:
+        await status_writer.close()
+    client.close()
+    get_password_hasher().shutdown()
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Group commit for inserts.
+
+WriteCoalescer collects the documents inserted by concurrent requests and
+writes them with one insert_many, once max_docs are queued or max_delay
+after the first one, whichever comes first. Each insert() returns only when
+the batch holding its document has been acknowledged, and raises if that
+document failed, so a caller sees the same outcome as with insert_one; it
+just shares the round trip with its neighbours.
+
+Documents queued or being written are bounded by max_pending. Past that,
+insert() waits up to enqueue_timeout for room before raising CoalescerFull,
+which routes turn into a 503.
+
+Configured with environment variables (see from_env):
+    WRITE_COALESCE_MAX_DOCS            documents per insert_many (default 100)
+    WRITE_COALESCE_MAX_DELAY_MS        longest a document waits for its batch (default 5)
+    WRITE_COALESCE_MAX_PENDING         documents queued or in flight (default 10000)
+    WRITE_COALESCE_MAX_FLUSHES         insert_many calls in flight at once (default 4)
+    WRITE_COALESCE_ENQUEUE_TIMEOUT_MS  wait for room in the queue (default 1000)
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_DOCUMENTS = metrics.Histogram(
+    "write_batch_documents", "Documents per coalesced insert_many, by collection.",
+    ("collection",), buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+FLUSH_SECONDS = metrics.Histogram(
+    "write_batch_flush_duration_seconds", "Time for a coalesced insert_many, by collection.",
+    ("collection",),
+)
+COALESCED_DOCUMENTS = metrics.Counter(
+    "write_coalescer_documents_total",
+    "Documents given to a write coalescer, by collection and result (written, failed, rejected).",
+    ("collection", "result"),
+)
+
+# Every coalescer, for the queue depth gauge
+_coalescers: List["WriteCoalescer"] = []
+
+
+class CoalescerFull(Exception):
+    """Raised when the queue stayed full for the whole enqueue timeout."""
+
+
+class BatchWriteError(Exception):
+    """Raised for a document that the batch it was written in rejected.
+
+    details is the driver's write error for the document (code, errmsg, ...).
+    """
+
+    def __init__(self, details: Dict[str, Any]):
+        super().__init__(details.get("errmsg", "Write failed"))
+        self.details = details
+        self.code = details.get("code")
+
+
+class WriteCoalescer:
+    """Batches concurrent inserts into one collection."""
+
+    def __init__(self, collection: Any, max_docs: int = 100, max_delay: float = 0.005,
+                 max_pending: int = 10000, max_flushes: int = 4,
+                 enqueue_timeout: float = 1.0):
+        self.collection = collection
+        self.name = collection.name
+        self.max_docs = max_docs
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_flushes = max_flushes
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        # Documents queued plus documents being written
+        self._pending = 0
+        self._flushes: Set[asyncio.Task] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._room: Optional[asyncio.Event] = None
+        _coalescers.append(self)
+
+    @classmethod
+    def from_env(cls, collection: Any) -> "WriteCoalescer":
+        return cls(
+            collection,
+            max_docs=int(os.environ.get("WRITE_COALESCE_MAX_DOCS", "100")),
+            max_delay=float(os.environ.get("WRITE_COALESCE_MAX_DELAY_MS", "5")) / 1000,
+            max_pending=int(os.environ.get("WRITE_COALESCE_MAX_PENDING", "10000")),
+            max_flushes=int(os.environ.get("WRITE_COALESCE_MAX_FLUSHES", "4")),
+            enqueue_timeout=float(os.environ.get("WRITE_COALESCE_ENQUEUE_TIMEOUT_MS", "1000")) / 1000,
+        )
+
+    async def insert(self, document: Dict[str, Any]):
+        """Insert document with the next batch; returns once the batch is acknowledged."""
+        if self._pending >= self.max_pending:
+            await self._wait_for_room()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((document, future))
+        self._pending += 1
+        self._schedule()
+        # Shielded, so a request cancelled meanwhile does not fail the others' batch
+        await asyncio.shield(future)
+
+    async def _wait_for_room(self):
+        if self._room is None:
+            self._room = asyncio.Event()
+        deadline = time.monotonic() + self.enqueue_timeout
+        while self._pending >= self.max_pending:
+            self._room.clear()
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._room.wait(), remaining)
+            except asyncio.TimeoutError:
+                COALESCED_DOCUMENTS.labels(self.name, "rejected").inc()
+                raise CoalescerFull(
+                    f"Write queue for {self.name} is full ({self._pending} documents pending)"
+                )
+
+    def _schedule(self):
+        """Start a flush if a full batch is queued, else make sure one is timed."""
+        if not self._queue:
+            return
+        if len(self._queue) >= self.max_docs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queue:
+            return
+        if len(self._flushes) >= self.max_flushes:
+            # The next flush to finish schedules this batch, which keeps growing meanwhile
+            return
+        batch, self._queue = self._queue[:self.max_docs], self._queue[self.max_docs:]
+        task = asyncio.get_running_loop().create_task(self._write(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+        self._schedule()
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        start = time.perf_counter()
+        errors: Dict[int, Exception] = {}
+        try:
+            await self.collection.insert_many([document for document, _ in batch], ordered=False)
+        except Exception as e:
+            details = getattr(e, "details", None) or {}
+            if details.get("writeErrors") and not details.get("writeConcernErrors"):
+                # Unordered: every document without a write error was inserted
+                for error in details["writeErrors"]:
+                    errors[error["index"]] = BatchWriteError(error)
+            else:
+                logger.warning(f"Coalesced insert of {len(batch)} documents into {self.name} failed: {e}")
+                errors = {index: e for index in range(len(batch))}
+        finally:
+            FLUSH_SECONDS.labels(self.name).observe(time.perf_counter() - start)
+            BATCH_DOCUMENTS.labels(self.name).observe(len(batch))
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            error = errors.get(index)
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+        COALESCED_DOCUMENTS.labels(self.name, "written").inc(len(batch) - len(errors))
+        if errors:
+            COALESCED_DOCUMENTS.labels(self.name, "failed").inc(len(errors))
+
+        self._pending -= len(batch)
+        if self._room is not None:
+            self._room.set()
+        # This flush is over, so a batch held back by max_flushes may start
+        self._flushes.discard(asyncio.current_task())
+        self._schedule()
+
+    def queued(self) -> int:
+        return self._pending
+
+    async def close(self):
+        """Write everything queued and wait for the writes to finish."""
+        while self._queue or self._flushes:
+            self._flush()
+            if self._flushes:
+                await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+def _pending_samples() -> List[Tuple[Tuple[str], int]]:
+    pending: Dict[str, int] = {}
+    for coalescer in _coalescers:
+        pending[coalescer.name] = pending.get(coalescer.name, 0) + coalescer.queued()
+    return [((name,), count) for name, count in pending.items()]
+
+
+metrics.CallbackMetric(
+    "write_coalescer_pending_documents", "Documents queued or being written, by collection.",
+    _pending_samples, labelnames=("collection",),
+)
@@ -0,0 +1,61 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other by name, as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+class FakeClock:
+    """A clock for time.monotonic/time.time parameters that only moves when told."""
+
+    def __init__(self, now: float = 10000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+# Settings for the app under test, applied before server.py is imported (its
+# .env does not override variables that are already set)
+TEST_ENVIRONMENT = {
+    "USE_MOCK_DB": "true",
+    "MOCK_DB_PATH": "",
+    "MOCK_DB_SOCKET": "",
+    "BCRYPT_ROUNDS": "4",
+    "RATE_LIMIT_ENABLED": "false",
+    "OTP_STORE": "local",
+    "PROFILING_ENABLED": "false",
+}
+
+
+@pytest.fixture(scope="session")
+def app():
+    os.environ.update(TEST_ENVIRONMENT)
+    import server
+
+    return server.app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    # As a context manager, so that startup seeds the mock database
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from expiring_store import LocalExpiringStore, RedisExpiringStore, RespServer
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_entries_expire_after_their_ttl(clock):
+    store = LocalExpiringStore(clock=clock)
+    await store.set("otp", "123456", 300)
+    clock.advance(299)
+    assert await store.get("otp") == "123456"
+    clock.advance(1)
+    assert await store.get("otp") is None
+    assert store.stats()["expired"] == 1
+    assert len(store) == 0
+
+
+async def test_expiry_beyond_one_wheel_revolution(clock):
+    store = LocalExpiringStore(resolution=1.0, slots=60, clock=clock)
+    await store.set("long", "x", 150)
+    await store.set("short", "y", 30)
+    clock.advance(100)
+    assert await store.get("long") == "x"
+    assert await store.get("short") is None
+    clock.advance(50)
+    assert await store.get("long") is None
+    assert len(store) == 0
+
+
+async def test_setting_a_key_again_replaces_its_expiry(clock):
+    store = LocalExpiringStore(clock=clock)
+    await store.set("otp", "111111", 10)
+    clock.advance(5)
+    await store.set("otp", "222222", 10)
+    clock.advance(9)
+    assert await store.get("otp") == "222222"
+    clock.advance(1)
+    assert await store.get("otp") is None
+
+
+async def test_the_oldest_entries_are_evicted_at_capacity(clock):
+    store = LocalExpiringStore(max_entries=3, clock=clock)
+    for key in "abcd":
+        await store.set(key, key, 60)
+    assert await store.get("a") is None
+    assert [await store.get(key) for key in "bcd"] == ["b", "c", "d"]
+    assert store.stats()["evicted"] == 1
+    assert len(store) == 3
+
+
+async def test_pop_takes_the_value_once(clock):
+    store = LocalExpiringStore(clock=clock)
+    await store.set("otp", "123456", 60)
+    assert await store.pop("otp") == "123456"
+    assert await store.pop("otp") is None
+    await store.set("otp", "123456", 60)
+    clock.advance(60)
+    assert await store.pop("otp") is None
+
+
+async def test_pop_if_equal_keeps_a_value_that_does_not_match(clock):
+    store = LocalExpiringStore(clock=clock)
+    assert await store.pop_if_equal("otp", "123456") is None
+    await store.set("otp", "123456", 60)
+    assert await store.pop_if_equal("otp", "000000") is False
+    assert await store.get("otp") == "123456"
+    assert await store.pop_if_equal("otp", "123456") is True
+    assert await store.pop_if_equal("otp", "123456") is None
+
+
+async def test_counters_keep_their_expiry(clock):
+    store = LocalExpiringStore(clock=clock)
+    assert await store.incr("n", 10) == 1
+    clock.advance(5)
+    assert await store.incr("n", 10) == 2
+    assert await store.decr("n") == 1
+    clock.advance(5)
+    assert await store.get("n") is None
+    assert await store.decr("n") == 0
+
+
+@pytest.fixture
+async def resp_server():
+    server = RespServer(LocalExpiringStore(), port=0)
+    await server.start()
+    server.port = server._server.sockets[0].getsockname()[1]
+    yield server
+    await server.close()
+
+
+async def test_redis_store_against_the_stand_in(resp_server):
+    store = RedisExpiringStore(f"redis://127.0.0.1:{resp_server.port}/0", prefix="otp:")
+    try:
+        await store.set("555", "123456", 60)
+        assert await store.get("555") == "123456"
+        results = await asyncio.gather(store.pop("555"), store.pop("555"))
+        assert sorted(results, key=str) == ["123456", None]
+        await store.set("555", "123456", 60)
+        assert await store.pop_if_equal("555", "000000") is False
+        results = await asyncio.gather(*(store.pop_if_equal("555", "123456") for _ in range(2)))
+        assert sorted(results, key=str) == [None, True]
+        assert await store.incr("n", 60) == 1
+        assert await store.decr("n") == 0
+    finally:
+        await store.close()
+
+
+async def test_redis_counters_expire_with_their_first_increment(clock):
+    server = RespServer(LocalExpiringStore(clock=clock), port=0)
+    await server.start()
+    port = server._server.sockets[0].getsockname()[1]
+    store = RedisExpiringStore(f"redis://127.0.0.1:{port}/0", prefix="rl:")
+    try:
+        assert await store.incr("n", 10) == 1
+        clock.advance(5)
+        assert await store.incr("n", 10) == 2
+        clock.advance(5)
+        assert await store.get("n") is None
+        assert await store.incr("n", 10) == 1
+    finally:
+        await store.close()
+        await server.close()
+
+
+async def test_redis_store_reconnects_after_a_failed_connect(resp_server):
+    port = resp_server.port
+    await resp_server.close()
+    store = RedisExpiringStore(f"redis://127.0.0.1:{port}/0", connect_timeout=0.5)
+    try:
+        with pytest.raises(ConnectionError):
+            await store.get("a")
+        resp_server.port = port
+        await resp_server.start()
+        await store.set("a", "1", 60)
+        assert await store.get("a") == "1"
+    finally:
+        await store.close()
+
+
+async def test_redis_store_fails_pending_commands_on_a_bad_reply():
+    async def garbage(reader, writer):
+        await reader.read(100)
+        writer.write(b"?not resp\r\n")
+        await writer.drain()
+
+    server = await asyncio.start_server(garbage, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    store = RedisExpiringStore(f"redis://127.0.0.1:{port}/0", timeout=1.0)
+    try:
+        results = await asyncio.gather(store.get("a"), store.get("b"), return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+        # The broken connection is dropped, so the next command opens a new one
+        assert store._writer is None and store._connected is None
+    finally:
+        await store.close()
+        server.close()
+
+
+async def test_redis_store_times_out_on_a_silent_server():
+    async def silent(reader, writer):
+        await reader.read(100)
+
+    server = await asyncio.start_server(silent, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    store = RedisExpiringStore(f"redis://127.0.0.1:{port}/0", timeout=0.1)
+    try:
+        with pytest.raises(ConnectionError, match="Timed out"):
+            await store.get("a")
+    finally:
+        await store.close()
+        server.close()
@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import auth_utils
+from auth_utils import JWT_BACKENDS, create_access_token, decode_access_token, get_jwt_backend
+from ttl_cache import TTLCache
+
+
+@pytest.fixture(params=sorted(JWT_BACKENDS))
+def backend(request, monkeypatch, clock):
+    """Each JWT backend in turn, with an empty verified-token cache on the fake clock."""
+    monkeypatch.setattr(auth_utils, "_jwt_backend", JWT_BACKENDS[request.param]())
+    monkeypatch.setattr(auth_utils, "_verified_tokens", TTLCache(100, 0, clock=clock))
+    return auth_utils._jwt_backend
+
+
+@pytest.mark.parametrize("name", ["jose", "pyjwt", "PyJWT"])
+def test_jwt_backend_is_selected_by_the_environment(monkeypatch, name):
+    monkeypatch.setattr(auth_utils, "_jwt_backend", None)
+    monkeypatch.setenv("JWT_BACKEND", name)
+    assert get_jwt_backend().name == name.lower()
+    assert get_jwt_backend() is get_jwt_backend()
+
+
+def test_unknown_jwt_backend_is_an_error(monkeypatch):
+    monkeypatch.setattr(auth_utils, "_jwt_backend", None)
+    monkeypatch.setenv("JWT_BACKEND", "nope")
+    with pytest.raises(ValueError, match="nope"):
+        get_jwt_backend()
+
+
+def test_backends_read_each_others_tokens():
+    jose, pyjwt = JWT_BACKENDS["jose"](), JWT_BACKENDS["pyjwt"]()
+    claims = {"sub": "a@example.com", "exp": int(time.time()) + 60}
+    key, algorithm = auth_utils.SECRET_KEY, auth_utils.ALGORITHM
+    assert pyjwt.decode(jose.encode(claims, key, algorithm), key, algorithm) == claims
+    assert jose.decode(pyjwt.encode(claims, key, algorithm), key, algorithm) == claims
+
+
+def test_cached_claims_expire_with_the_token(backend, monkeypatch, clock):
+    now = time.time()
+    exp = int(now) + 100
+    token = backend.encode({"sub": "a@example.com", "exp": exp}, auth_utils.SECRET_KEY,
+                           auth_utils.ALGORITHM)
+    monkeypatch.setattr(auth_utils, "time", SimpleNamespace(time=lambda: now))
+    cache = auth_utils.get_verified_token_cache()
+
+    assert decode_access_token(token)["sub"] == "a@example.com"
+    clock.advance(exp - now - 1)
+    assert decode_access_token(token)["sub"] == "a@example.com"
+    assert cache.hits == 1
+    # At exp the cache no longer answers, and the token goes back to the backend
+    clock.advance(1)
+    assert cache.get(token) is None
+
+
+def test_expired_tokens_are_rejected_and_not_cached(backend):
+    token = create_access_token({"sub": "a@example.com"}, timedelta(seconds=-10))
+    assert decode_access_token(token) is None
+    assert len(auth_utils.get_verified_token_cache()) == 0
+
+
+def test_tampered_tokens_are_rejected_and_not_cached(backend):
+    token = create_access_token({"sub": "a@example.com", "role": "patient"})
+    assert decode_access_token(token)["role"] == "patient"
+    header, payload, signature = token.split(".")
+    forged_claims = backend.encode({"sub": "a@example.com", "role": "admin", "exp": 9999999999},
+                                   "a different key of at least thirty-two bytes", auth_utils.ALGORITHM)
+    tampered = [
+        ".".join([header, forged_claims.split(".")[1], signature]),
+        ".".join([header, payload, signature[:-2] + ("AA" if signature[-2:] != "AA" else "BB")]),
+        forged_claims,
+        "not a token",
+    ]
+    for bad in tampered:
+        assert decode_access_token(bad) is None
+    # Only the genuine token was ever cached
+    assert len(auth_utils.get_verified_token_cache()) == 1
+    assert decode_access_token(token)["role"] == "patient"
+
+
+def test_tokens_without_exp_are_not_cached(backend):
+    token = backend.encode({"sub": "a@example.com"}, auth_utils.SECRET_KEY, auth_utils.ALGORITHM)
+    assert decode_access_token(token)["sub"] == "a@example.com"
+    assert len(auth_utils.get_verified_token_cache()) == 0
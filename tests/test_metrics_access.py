@@ -0,0 +1,29 @@
+import server
+
+
+def token(client, email: str, password: str) -> str:
+    response = client.post("/api/auth/login", json={"email": email, "password": password})
+    return response.json()["access_token"]
+
+
+def test_metrics_need_authentication(client):
+    assert client.get("/api/metrics").status_code == 401
+
+
+def test_metrics_are_refused_to_non_admins(client):
+    donor = token(client, "donor@organconnect.com", "donor123")
+    response = client.get("/api/metrics", headers={"Authorization": f"Bearer {donor}"})
+    assert response.status_code == 403
+
+
+def test_metrics_for_an_admin(client):
+    admin = token(client, "admin@organconnect.com", "admin123")
+    response = client.get("/api/metrics", headers={"Authorization": f"Bearer {admin}"})
+    assert response.status_code == 200
+    assert "http_requests_total" in response.text
+
+
+def test_metrics_for_the_scrape_token(client, monkeypatch):
+    monkeypatch.setattr(server, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
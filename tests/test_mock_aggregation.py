@@ -0,0 +1,87 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import mock_aggregation
+from mock_aggregation import _group_python, _group_vectorized, run_pipeline
+
+pd = pytest.importorskip("pandas")
+
+
+def make_documents(count: int):
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    documents = []
+    for i in range(count):
+        document = {
+            "id": str(i),
+            "role": rng.choice(["donor", "hospital", "admin"]),
+            "organ": rng.choice(["kidney", "liver", None]),
+            "age": rng.randint(18, 80),
+            # Integers and floats mixed, and sometimes missing
+            "weight": rng.choice([rng.randint(40, 120), rng.uniform(40, 120), None]),
+            "score": rng.choice([rng.randint(0, 10), "n/a", True]),
+            "created_at": start + timedelta(minutes=rng.randint(0, 100000)),
+        }
+        if i % 11 == 0:
+            del document["weight"]
+        documents.append(document)
+    # A group where every weight is an int, one where it is always missing
+    documents.append({"id": "int-only", "role": "int", "weight": 18, "age": 1})
+    documents.append({"id": "int-only-2", "role": "int", "weight": 19.5, "age": 2})
+    documents.append({"id": "none", "role": "none", "age": 3})
+    return documents
+
+
+def typed(results):
+    """Results with the type of every value, so that 18 and 18.0 differ.
+
+    Floats are compared approximately: pandas sums them in another order.
+    """
+    def convert(value):
+        if isinstance(value, dict):
+            return {key: convert(item) for key, item in value.items()}
+        if isinstance(value, float):
+            return ("float", pytest.approx(value, rel=1e-12))
+        return (type(value).__name__, value)
+    return [convert(result) for result in results]
+
+
+GROUPS = [
+    {"_id": "$role", "n": {"$count": {}}, "total_age": {"$sum": "$age"}, "avg_age": {"$avg": "$age"}},
+    {"_id": "$role", "lightest": {"$min": "$weight"}, "heaviest": {"$max": "$weight"}},
+    {"_id": "$organ", "youngest": {"$min": "$age"}, "oldest": {"$max": "$age"}},
+    {"_id": {"role": "$role", "organ": "$organ"}, "first": {"$min": "$created_at"},
+     "last": {"$max": "$created_at"}, "weight": {"$sum": "$weight"}},
+    {"_id": None, "score": {"$sum": "$score"}, "avg_weight": {"$avg": "$weight"}, "ones": {"$sum": 1}},
+]
+
+
+@pytest.mark.parametrize("spec", GROUPS)
+def test_vectorized_group_matches_the_python_one(spec):
+    documents = make_documents(3000)
+    assert typed(_group_vectorized(documents, spec, pd)) == typed(_group_python(documents, spec))
+
+
+def test_min_and_max_keep_integers_in_a_mixed_column():
+    documents = make_documents(3000)
+    spec = {"_id": "$role", "lightest": {"$min": "$weight"}, "heaviest": {"$max": "$weight"}}
+    results = {result["_id"]: result for result in _group_vectorized(documents, spec, pd)}
+    assert results["int"]["lightest"] == 18 and type(results["int"]["lightest"]) is int
+    assert results["none"]["lightest"] is None and results["none"]["heaviest"] is None
+
+
+def test_pipeline_uses_the_vectorized_group_for_large_inputs(monkeypatch):
+    documents = make_documents(3000)
+    pipeline = [{"$match": {"age": {"$gte": 30}}},
+                {"$group": {"_id": "$role", "oldest": {"$max": "$age"}}},
+                {"$sort": {"_id": 1}}]
+    calls = []
+    original = mock_aggregation._group_vectorized
+    monkeypatch.setattr(mock_aggregation, "_group_vectorized",
+                        lambda *args: calls.append(1) or original(*args))
+    vectorized = run_pipeline(documents, pipeline)
+    assert calls
+    monkeypatch.setattr(mock_aggregation, "VECTORIZE_MIN_DOCS", len(documents) + 1)
+    assert typed(run_pipeline(documents, pipeline)) == typed(vectorized)
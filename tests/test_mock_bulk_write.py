@@ -0,0 +1,49 @@
+import pytest
+
+from mock_db import BulkWriteError, MockMongoClient
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def collection():
+    return MockMongoClient("mock://localhost")["test"]["items"]
+
+
+def batch():
+    return [
+        ("insert", {"id": "1", "n": 1}),
+        ("update_one", {"id": "1"}, {"$bogus": {"n": 2}}, False),
+        ("insert", {"id": "1"}),
+        ("insert", {"id": "2", "n": 2}),
+    ]
+
+
+async def ids(collection):
+    return sorted(document["id"] for document in await collection.find({}).to_list(None))
+
+
+async def test_ordered_bulk_write_stops_at_the_first_error(collection):
+    with pytest.raises(BulkWriteError) as raised:
+        await collection.bulk_write(batch(), ordered=True)
+    details = raised.value.details
+    assert details["nInserted"] == 1
+    assert [(error["index"], error["code"]) for error in details["writeErrors"]] == [(1, 2)]
+    assert "$bogus" in details["writeErrors"][0]["errmsg"]
+    assert await ids(collection) == ["1"]
+
+
+async def test_unordered_bulk_write_reports_every_error(collection):
+    with pytest.raises(BulkWriteError) as raised:
+        await collection.bulk_write(batch(), ordered=False)
+    details = raised.value.details
+    assert details["nInserted"] == 2
+    assert [(error["index"], error["code"]) for error in details["writeErrors"]] == [(1, 2), (2, 11000)]
+    assert await ids(collection) == ["1", "2"]
+
+
+async def test_unknown_operations_are_rejected_before_any_write(collection):
+    await collection.insert_one({"id": "1"})
+    with pytest.raises(TypeError):
+        await collection.bulk_write([("delete_one", {"id": "1"}), ("update", {"id": "1"}, {}, False)])
+    assert await ids(collection) == ["1"]
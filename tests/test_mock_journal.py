@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from mock_db import DuplicateKeyError, MockMongoClient
+from mock_journal import SNAPSHOT_FILE
+
+pytestmark = pytest.mark.anyio
+
+
+def open_client(path, **kwargs) -> MockMongoClient:
+    return MockMongoClient("mock://localhost:27017", path=str(path), **kwargs)
+
+
+async def documents(client, collection="users"):
+    cursor = client["test"][collection].find({}, {"_id": 0})
+    return sorted(await cursor.to_list(None), key=lambda document: document["id"])
+
+
+def segments(path):
+    return sorted(name for name in os.listdir(path) if name.startswith("journal-"))
+
+
+async def test_writes_are_recovered_from_the_journal(tmp_path):
+    client = open_client(tmp_path)
+    users = client["test"]["users"]
+    await users.create_index("email", unique=True)
+    await users.insert_one({"id": "1", "email": "a@example.com", "age": 30})
+    await users.insert_one({"id": "2", "email": "b@example.com", "age": 40})
+    await users.update_one({"id": "1"}, {"$inc": {"age": 1}})
+    await users.delete_one({"id": "2"})
+    expected = await documents(client)
+    client.close()
+
+    recovered = open_client(tmp_path)
+    assert await documents(recovered) == expected
+    assert expected[0]["age"] == 31
+    # Indexes are rebuilt, unique constraints included
+    with pytest.raises(DuplicateKeyError):
+        await recovered["test"]["users"].insert_one({"id": "3", "email": "a@example.com"})
+    recovered.close()
+
+
+async def test_recovery_replays_only_the_journal_after_the_snapshot(tmp_path):
+    client = open_client(tmp_path, snapshot_every=0)
+    users = client["test"]["users"]
+    for i in range(5):
+        await users.insert_one({"id": str(i), "email": f"{i}@example.com"})
+    client.snapshot()
+    await users.insert_one({"id": "5", "email": "5@example.com"})
+    client.close()
+
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+    # Segments covered by the snapshot are removed
+    assert len(segments(tmp_path)) == 1
+
+    recovered = open_client(tmp_path)
+    assert [document["id"] for document in await documents(recovered)] == [str(i) for i in range(6)]
+    assert recovered._journal._since_snapshot == 1
+    recovered.close()
+
+
+async def test_a_torn_record_at_the_journal_tail_is_dropped(tmp_path):
+    client = open_client(tmp_path)
+    await client["test"]["users"].insert_one({"id": "1", "email": "a@example.com"})
+    await client["test"]["users"].insert_one({"id": "2", "email": "b@example.com"})
+    client.close()
+
+    # A crash in the middle of writing the last record
+    segment = tmp_path / segments(tmp_path)[-1]
+    data = segment.read_bytes()
+    segment.write_bytes(data[:-5])
+
+    recovered = open_client(tmp_path)
+    assert [document["id"] for document in await documents(recovered)] == ["1"]
+    # The torn bytes are truncated, so later writes follow the last good record
+    await recovered["test"]["users"].insert_one({"id": "3", "email": "c@example.com"})
+    recovered.close()
+
+    again = open_client(tmp_path)
+    assert [document["id"] for document in await documents(again)] == ["1", "3"]
+    again.close()
+
+
+async def test_a_foreground_snapshot_waits_for_a_background_one(tmp_path):
+    client = open_client(tmp_path, snapshot_every=10)
+    users = client["test"]["users"]
+    for i in range(25):
+        await users.insert_one({"id": f"{i:02d}", "email": f"{i}@example.com"})
+    client.snapshot()
+    assert not client._journal._snapshot_thread
+    client.close()
+
+    recovered = open_client(tmp_path)
+    assert len(await documents(recovered)) == 25
+    # Everything was in the final snapshot
+    assert recovered._journal._since_snapshot == 0
+    recovered.close()
@@ -0,0 +1,37 @@
+import pytest
+
+
+def request_otp(client, mobile: str) -> str:
+    response = client.post("/api/auth/request-otp", json={"mobile": mobile})
+    assert response.status_code == 200
+    return response.json()["otp"]
+
+
+def verify(client, mobile: str, otp: str) -> int:
+    return client.post("/api/auth/verify-otp", json={"mobile": mobile, "otp": otp}).status_code
+
+
+def wrong_code(otp: str) -> str:
+    return "000000" if otp != "000000" else "111111"
+
+
+def test_the_issued_code_verifies_once(client):
+    otp = request_otp(client, "9000000001")
+    assert verify(client, "9000000001", otp) == 200
+    # Used up; the demo accepts any code again only once none is pending
+    assert verify(client, "9000000001", otp) == 200
+
+
+def test_a_wrong_code_does_not_use_up_the_pending_otp(client):
+    otp = request_otp(client, "9000000002")
+    assert verify(client, "9000000002", wrong_code(otp)) == 400
+    # The OTP is still pending, so the demo fallback does not accept any code
+    for code in ("111111", "222222"):
+        if code != otp:
+            assert verify(client, "9000000002", code) == 400
+    assert verify(client, "9000000002", otp) == 200
+
+
+@pytest.mark.parametrize("otp", ["12345", "abcdef"])
+def test_the_demo_fallback_only_takes_six_digits(client, otp):
+    assert verify(client, "9000000003", otp) == 400
@@ -0,0 +1,111 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from mock_db import MockMongoClient
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter, keyset_sort
+
+
+def token(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("key", [datetime(2024, 5, 1, 12, 30, 0, 123456), 42, "b", None])
+def test_cursor_round_trip(key):
+    assert decode_cursor(encode_cursor(key, "id-1")) == (key, "id-1")
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("?&/+=", "id")
+    assert cursor == cursor.strip("=")
+    assert not set(cursor) & set("+/=?&")
+
+
+@pytest.mark.parametrize("cursor", [
+    "garbage!",
+    token("not a list"),
+    token(["v", 1]),
+    token(["x", 1, "id"]),
+    token(["v", 1, 2]),
+    token(["dt", "not a date", "id"]),
+    token(["dt", 20240101, "id"]),
+    token(["v", {"$foo": 1}, "a"]),
+    token(["v", {"$ne": None}, "a"]),
+    token(["v", [1, 2], "a"]),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_aware_cursor_keys_become_naive_utc():
+    key, _ = decode_cursor(token(["dt", "2020-01-01T05:30:00+05:30", "a"]))
+    assert key == datetime(2020, 1, 1) and key.tzinfo is None
+
+
+@pytest.mark.parametrize("key", [{"$ne": None}, {"$foo": 1}])
+def test_status_rejects_operators_in_a_cursor(client, key):
+    response = client.get("/api/status", params={"cursor": token(["v", key, "a"])})
+    assert response.status_code == 400
+
+
+def test_status_pages_after_an_aware_cursor(client):
+    client.post("/api/status", json={"client_name": "aware-cursor"})
+    cursor = token(["dt", "2020-01-01T00:00:00+00:00", "a"])
+    response = client.get("/api/status", params={"cursor": cursor})
+    assert response.status_code == 200
+    assert response.json()
+    assert all(item["timestamp"] > "2020-01-01T00:00:00" for item in response.json())
+
+
+@pytest.mark.anyio
+async def test_keyset_pages_cover_every_document_once():
+    collection = MockMongoClient("mock://localhost")["test"]["status_checks"]
+    start = datetime(2024, 1, 1)
+    # Pairs of documents share a timestamp, so pages split ties on the id
+    for i in range(25):
+        await collection.insert_one({"id": f"{i:03d}", "timestamp": start + timedelta(seconds=i // 2)})
+
+    seen, after = [], None
+    while True:
+        page = await collection.find(keyset_filter("timestamp", after)).sort(
+            keyset_sort("timestamp")).to_list(4)
+        if not page:
+            break
+        seen.extend(document["id"] for document in page)
+        if len(seen) == 8:
+            # Documents inserted before the position do not shift later pages
+            await collection.insert_one({"id": "early", "timestamp": start - timedelta(days=1)})
+        last = page[-1]
+        after = decode_cursor(encode_cursor(last["timestamp"], last["id"]))
+
+    assert seen == [f"{i:03d}" for i in range(25)]
+
+
+def test_status_pages_through_the_api(client):
+    created = {client.post("/api/status", json={"client_name": f"page-{i}"}).json()["id"] for i in range(7)}
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/status", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 3
+        seen.extend(item["id"] for item in page)
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+
+    assert len(seen) == len(set(seen))
+    assert created <= set(seen)
+
+
+def test_status_rejects_a_bad_cursor(client):
+    response = client.get("/api/status", params={"cursor": "garbage!"})
+    assert response.status_code == 400
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from auth_routes import update_user
+from profiling import ProfilingMiddleware
+
+
+@pytest.fixture
+def profiled(client, tmp_path):
+    """The app behind ProfilingMiddleware, writing to tmp_path (client has seeded the database)."""
+    app = ProfilingMiddleware(server.app, db=server.db, output_dir=str(tmp_path), interval=0.001)
+    return TestClient(app)
+
+
+def login(client, email: str, password: str) -> dict:
+    response = client.post("/api/auth/login", json={"email": email, "password": password})
+    return {"Authorization": f"Bearer {response.json()['access_token']}", "X-Profile": "1"}
+
+
+def test_an_admin_can_profile_a_request(profiled, client, tmp_path):
+    headers = login(client, "admin@organconnect.com", "admin123")
+    response = profiled.get("/api/status", headers=headers)
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+    assert (tmp_path / f"{profile_id}.collapsed").exists()
+    assert (tmp_path / f"{profile_id}.svg").read_text().startswith("<svg")
+
+
+def test_other_users_cannot(profiled, client, tmp_path):
+    headers = login(client, "donor@organconnect.com", "donor123")
+    response = profiled.get("/api/status", headers=headers)
+    assert "x-profile-id" not in response.headers
+    assert response.status_code == 200
+    assert not list(tmp_path.iterdir())
+
+
+def test_a_deactivated_admin_cannot(profiled, client, tmp_path):
+    headers = login(client, "hospital@organconnect.com", "hospital123")
+    user_id = client.get("/api/auth/me", headers=headers).json()["id"]
+    asyncio.run(update_user(server.db, {"id": user_id}, {"$set": {"role": "admin", "is_active": False}}))
+    try:
+        response = profiled.get("/api/status", headers=headers)
+        assert "x-profile-id" not in response.headers
+    finally:
+        asyncio.run(update_user(server.db, {"id": user_id}, {"$set": {"role": "hospital", "is_active": True}}))
+
+
+def test_sampling_profiles_one_request_in_n(client, tmp_path):
+    app = ProfilingMiddleware(server.app, db=server.db, output_dir=str(tmp_path), sample_rate=3)
+    responses = [TestClient(app).get("/api/") for _ in range(6)]
+    assert ["x-profile-id" in response.headers for response in responses] == [False, False, True] * 2
@@ -0,0 +1,146 @@
+import pytest
+
+from expiring_store import LocalExpiringStore
+from rate_limit import (
+    RateLimitExceeded, RateLimits, SharedSlidingWindow, SlidingWindow, TokenBucket,
+    client_ip, retry_after_header,
+)
+import rate_limit
+
+pytestmark = pytest.mark.anyio
+
+
+async def outcomes(limiter, key, count):
+    results = []
+    for _ in range(count):
+        try:
+            await limiter.hit(key)
+            results.append("ok")
+        except RateLimitExceeded as e:
+            results.append(round(e.retry_after, 2))
+    return results
+
+
+async def test_token_bucket_allows_a_burst_then_refills(clock):
+    bucket = TokenBucket("t", 3, 3, clock=clock)
+    assert await outcomes(bucket, "a", 4) == ["ok", "ok", "ok", 1.0]
+    # Keys are independent
+    assert await outcomes(bucket, "b", 1) == ["ok"]
+
+    clock.advance(1)
+    assert await outcomes(bucket, "a", 2) == ["ok", 1.0]
+    assert bucket.stats()["allowed"] == 5
+    assert bucket.stats()["rejected"] == 2
+
+
+async def test_token_bucket_refill_is_capped_at_the_limit(clock):
+    bucket = TokenBucket("t", 2, 10, clock=clock)
+    clock.advance(3600)
+    assert await outcomes(bucket, "a", 3) == ["ok", "ok", 5.0]
+
+
+async def test_sliding_window_weights_the_previous_window(clock):
+    window = SlidingWindow("s", 3, 10, clock=clock)
+    assert await outcomes(window, "a", 4) == ["ok", "ok", "ok", 13.33]
+
+    # At the start of the next window all 3 still count
+    clock.advance(10)
+    assert await outcomes(window, "a", 1) == [3.33]
+    # Halfway through, they count for 1.5
+    clock.advance(5)
+    assert await outcomes(window, "a", 2) == ["ok", 1.67]
+
+
+async def test_sliding_window_does_not_count_rejections(clock):
+    window = SlidingWindow("s", 2, 10, clock=clock)
+    await outcomes(window, "a", 2)
+    # Retrying while blocked does not extend the block
+    assert len(await outcomes(window, "a", 50)) == 50
+    clock.advance(20)
+    assert await outcomes(window, "a", 1) == ["ok"]
+
+
+async def test_shared_sliding_window_matches_the_local_one(clock):
+    store = LocalExpiringStore(clock=clock)
+    shared = SharedSlidingWindow("s", 3, 10, store, clock=clock)
+    local = SlidingWindow("s", 3, 10, clock=clock)
+    for step in (0, 10, 5, 100):
+        clock.advance(step)
+        assert await outcomes(shared, "a", 4) == await outcomes(local, "a", 4)
+
+
+async def test_shared_sliding_window_does_not_count_rejections(clock):
+    store = LocalExpiringStore(clock=clock)
+    window = SharedSlidingWindow("s", 2, 10, store, clock=clock)
+    await outcomes(window, "a", 30)
+    window_index = int(clock() // 10)
+    assert await store.get(f"ratelimit:s:a:{window_index}") == 2
+    clock.advance(20)
+    assert await outcomes(window, "a", 1) == ["ok"]
+
+
+async def test_rate_limits_combine_keys_and_skip_missing_ones():
+    limits = RateLimits({"login": [("email+ip", "sliding_window", 1, 300)]})
+    await limits.check("login", email="victim@example.com", ip="203.0.113.1")
+    with pytest.raises(RateLimitExceeded):
+        await limits.check("login", email="victim@example.com", ip="203.0.113.1")
+    # Another client is not locked out of the same account
+    await limits.check("login", email="victim@example.com", ip="198.51.100.7")
+    # Limits on a key without a value do not apply
+    await limits.check("login", email="victim@example.com")
+    await limits.check("register", ip="203.0.113.1")
+
+
+@pytest.mark.parametrize("store", [None, LocalExpiringStore()], ids=["local", "shared"])
+async def test_a_request_rejected_by_one_limit_counts_against_none(store):
+    limits = RateLimits({"login": [("ip", "token_bucket", 5, 600),
+                                   ("email+ip", "sliding_window", 1, 600)]}, store=store)
+    await limits.check("login", email="a@example.com", ip="203.0.113.1")
+    for _ in range(3):
+        with pytest.raises(RateLimitExceeded, match="login:email\\+ip"):
+            await limits.check("login", email="a@example.com", ip="203.0.113.1")
+    # The rejected requests gave their ip tokens back, so four more fit
+    for email in "bcde":
+        await limits.check("login", email=f"{email}@example.com", ip="203.0.113.1")
+    with pytest.raises(RateLimitExceeded, match="login:ip"):
+        await limits.check("login", email="f@example.com", ip="203.0.113.1")
+    assert limits.stats()["login:ip"]["allowed"] == 5
+
+
+async def test_sliding_window_refund_follows_the_window_rolling_over(clock):
+    window = SlidingWindow("s", 2, 10, clock=clock)
+    counted_in = await window.hit("k")
+    await window.hit("k")
+    clock.advance(10)
+    await window.refund("k", counted_in)
+    # One request remains in the previous window, weighted 1 at its start
+    assert await outcomes(window, "k", 2) == ["ok", 10.0]
+
+
+async def test_disabled_rate_limits_allow_everything():
+    limits = RateLimits({"login": [("ip", "token_bucket", 1, 60)]}, enabled=False)
+    for _ in range(5):
+        await limits.check("login", ip="203.0.113.1")
+
+
+def test_client_ip_trusts_only_configured_proxies(monkeypatch):
+    monkeypatch.setenv("TRUSTED_PROXIES", "10.0.0.0/8, 127.0.0.1")
+    monkeypatch.setattr(rate_limit, "_trusted_proxies", None)
+    forwarded = {"X-Forwarded-For": "198.51.100.9, 203.0.113.1, 10.0.0.5"}
+    # The last address a trusted proxy did not add
+    assert client_ip("10.1.2.3", forwarded) == "203.0.113.1"
+    # A client cannot pick its own address
+    assert client_ip("192.0.2.4", forwarded) == "192.0.2.4"
+    assert client_ip("127.0.0.1", {}) == "127.0.0.1"
+
+
+def test_client_ip_without_trusted_proxies_is_the_peer(monkeypatch):
+    monkeypatch.delenv("TRUSTED_PROXIES", raising=False)
+    monkeypatch.setattr(rate_limit, "_trusted_proxies", None)
+    assert client_ip("10.1.2.3", {"X-Forwarded-For": "203.0.113.1"}) == "10.1.2.3"
+
+
+def test_retry_after_header_rounds_up():
+    assert retry_after_header(0.01) == "1"
+    assert retry_after_header(1.2) == "2"
+    assert retry_after_header(30) == "30"
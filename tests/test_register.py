@@ -0,0 +1,65 @@
+import pytest
+
+from mock_db import DuplicateKeyError
+
+
+def registration(email: str, mobile: str) -> dict:
+    return {
+        "email": email,
+        "password": "secret",
+        "confirm_password": "secret",
+        "role": "donor",
+        "name": "Test Donor",
+        "mobile": mobile,
+    }
+
+
+def test_register_returns_a_token(client):
+    response = client.post("/api/auth/register", json=registration("new@example.com", "+15550100"))
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+
+def test_duplicate_email_is_a_400(client):
+    client.post("/api/auth/register", json=registration("taken@example.com", "+15550101"))
+    response = client.post("/api/auth/register", json=registration("taken@example.com", "+15550102"))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+
+
+def test_duplicate_mobile_is_a_400(client):
+    client.post("/api/auth/register", json=registration("first@example.com", "+15550103"))
+    response = client.post("/api/auth/register", json=registration("second@example.com", "+15550103"))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Mobile number already registered"
+
+
+def test_a_clash_on_both_reports_the_email(client):
+    client.post("/api/auth/register", json=registration("both@example.com", "+15550104"))
+    response = client.post("/api/auth/register", json=registration("both@example.com", "+15550104"))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+
+
+def test_an_error_naming_only_the_index_is_mapped(client, monkeypatch):
+    # Servers older than 4.2 send no keyPattern
+    error = DuplicateKeyError("users", "mobile_1", {"mobile": 1}, {"mobile": "+15550105"})
+    error.details = {"code": 11000, "errmsg": "E11000 duplicate key error index: mobile_1 dup key"}
+
+    async def insert_one(document):
+        raise error
+
+    import server
+
+    monkeypatch.setattr(server.db.users, "insert_one", insert_one)
+    response = client.post("/api/auth/register", json=registration("old@example.com", "+15550105"))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Mobile number already registered"
+
+
+def test_password_mismatch_is_a_400(client):
+    data = registration("mismatch@example.com", "+15550106")
+    data["confirm_password"] = "other"
+    response = client.post("/api/auth/register", json=data)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Passwords do not match"
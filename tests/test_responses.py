@@ -0,0 +1,66 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from responses import ORJSONResponse, dumps, trusted_content, trusted_models
+
+NAIVE = datetime(2024, 1, 2, 3, 4, 5, 6)
+WHOLE_SECOND = datetime(2024, 1, 2, 3, 4, 5)
+UTC = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+OFFSET = datetime(2024, 1, 2, 3, 4, 5, 600, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+TIMESTAMPS = [NAIVE, WHOLE_SECOND, UTC, OFFSET]
+
+
+class Item(BaseModel):
+    id: str
+    name: str
+    at: datetime
+
+
+def document(at: datetime) -> dict:
+    return {"_id": 1, "id": str(uuid.UUID(int=7)), "name": "é ✓", "at": at}
+
+
+def route_bodies(value) -> list:
+    """The body of a route returning value, once per response class."""
+    bodies = []
+    for response_class in (JSONResponse, ORJSONResponse):
+        app = FastAPI(default_response_class=response_class)
+        app.get("/")(lambda: value)
+        bodies.append(TestClient(app).get("/").content)
+    return bodies
+
+
+@pytest.mark.parametrize("at", TIMESTAMPS)
+def test_route_responses_match_json_response(at):
+    # FastAPI encodes return values before render, so either class sees strings
+    for value in ({"at": at, "id": uuid.UUID(int=7)}, Item(id="1", name="é", at=at)):
+        json_body, orjson_body = route_bodies(value)
+        assert orjson_body == json_body
+
+
+@pytest.mark.parametrize("at", TIMESTAMPS)
+def test_trusted_paths_match_validated_models(at):
+    documents = [document(at)]
+    validated = JSONResponse(jsonable_encoder([Item(**d) for d in documents])).body
+    assert ORJSONResponse(trusted_models(Item, documents)).body == validated
+    assert ORJSONResponse(trusted_content(Item, documents)).body == validated
+
+
+@pytest.mark.parametrize("at", [NAIVE, WHOLE_SECOND, OFFSET])
+def test_direct_content_matches_jsonable_encoder(at):
+    content = {"at": at, "id": uuid.UUID(int=7), "name": "é ✓"}
+    assert dumps(content) == JSONResponse(jsonable_encoder(content)).body
+
+
+def test_direct_content_writes_utc_like_pydantic():
+    # The one documented difference from jsonable_encoder on plain values
+    assert dumps({"at": UTC}) == b'{"at":"2024-01-02T03:04:05Z"}'
+    assert JSONResponse(jsonable_encoder({"at": UTC})).body == b'{"at":"2024-01-02T03:04:05+00:00"}'
+    assert dumps({"at": UTC}) == Item(id="1", name="x", at=UTC).model_dump_json(include={"at"}).encode()